@@ -1,18 +1,41 @@
 import time
 import uuid
 import logging
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from core.logging_setup import setup_logging
-from core.db import check_connection, engine
-from services.api_service import APIService
+from core.db import check_connection_async, engine, ensure_schema, SessionLocal
+from services.api_service import APIService, ASSET_COLUMNS, CHANGES_MAX_LIMIT
+from services import export
 from services.etl_service import ETLService
-from core import models
+from services.cache import ResponseCache
+from core import models, search, etl_stats, metrics, changes
 
 logger = logging.getLogger("api")
 app = FastAPI(title="Kasparro Backend & ETL")
 
 # ensure tables exist at startup
-models.Base.metadata.create_all(bind=engine)
+ensure_schema(models.Base.metadata, bind=engine)
+search.ensure(engine)
+with SessionLocal() as _session:
+    etl_stats.backfill(_session)
+    changes.ensure(_session)
+    changes.backfill(_session)
+    _session.commit()
+
+response_cache = ResponseCache.from_settings()
+
+HTTP_LATENCY = metrics.REGISTRY.histogram("http_request_duration_seconds", "API request latency",
+                                          ("route", "method", "status"))
+DB_POOL = metrics.REGISTRY.gauge("db_pool_connections", "Connections in the API engine's pool", ("state",))
+
+
+@metrics.REGISTRY.collector
+def _pool_metrics():
+    pool = engine.pool
+    for state, attr in (("checked_out", "checkedout"), ("checked_in", "checkedin"), ("overflow", "overflow"), ("size", "size")):
+        if hasattr(pool, attr):
+            DB_POOL.set(getattr(pool, attr)(), state=state)
 
 
 @app.get("/")
@@ -23,7 +46,10 @@ def root():
         "endpoints": {
             "health": "/health",
             "data": "/data",
+            "export": "/data/export",
+            "changes": "/changes",
             "stats": "/stats",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -32,50 +58,98 @@ def root():
 @app.middleware("http")
 async def add_request_id_and_timing(request: Request, call_next):
     request_id = str(uuid.uuid4())
-    start = time.time()
+    request.state.request_id = request_id
+    start = time.perf_counter()
     response = await call_next(request)
-    latency = int((time.time() - start) * 1000)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_LATENCY.observe(elapsed, route=route.path if route else "unmatched", method=request.method,
+                         status=str(response.status_code))
     response.headers["X-Request-Id"] = request_id
-    response.headers["X-Api-Latency-Ms"] = str(latency)
+    response.headers["X-Api-Latency-Ms"] = str(int(elapsed * 1000))
     return response
 
 
-@app.get("/health")
-def health():
-    db_ok = check_connection()
-    last = ETLService.last_run()
+async def _health():
+    db_ok = await check_connection_async()
+    last = await ETLService.last_run_async() if db_ok else None
     return {
         "db": db_ok,
         "last_etl": {
-            "status": last.status if last else None,
-            "run_started_at": str(last.run_started_at) if last else None
+            "status": last.last_status if last else None,
+            "run_started_at": str(last.last_run_started_at) if last else None
         }
     }
 
 
-@app.get("/data")
-def get_data(limit: int = 50, offset: int = 0, q: str | None = None, request: Request = None):
+@app.get("/health")
+async def health(response: Response):
+    body, hit = await response_cache.get_or_set_async("health", {}, _health)
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return body
+
+
+async def _data_page(limit: int, offset: int, q: str | None, cursor: str | None):
+    items, total, next_cursor = await APIService.list_assets_async(limit=limit, offset=offset, q=q, cursor=cursor)
+    return {"total": total, "next_cursor": next_cursor, "data": items}
+
+
+@app.get("/data", response_class=ORJSONResponse)
+async def get_data(limit: int = 50, offset: int = 0, q: str | None = None, cursor: str | None = None, request: Request = None):
     start = time.time()
-    items, total = APIService.list_assets(limit=limit, offset=offset, q=q)
+    params = {"limit": limit, "offset": offset, "q": q, "cursor": cursor}
+    try:
+        page, hit = await response_cache.get_or_set_async("data", params, lambda: _data_page(limit, offset, q, cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     latency = int((time.time() - start) * 1000)
-    return {
-        "request_id": request.headers.get("X-Request-Id"),
+    # returned directly so FastAPI skips jsonable_encoder; orjson renders the plain dicts
+    return ORJSONResponse({
+        "request_id": request.state.request_id,
         "api_latency_ms": latency,
         "limit": limit,
         "offset": offset,
-        "total": total,
-        "data": [
-            {
-                "id": a.id,
-                "external_id": a.external_id,
-                "symbol": a.symbol,
-                "name": a.name,
-                "source": a.source
-            } for a in items
-        ]
-    }
+        **page,
+    }, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+
+@app.get("/changes", response_class=ORJSONResponse)
+async def get_changes(since: int = 0, limit: int = 100, request: Request = None):
+    """Assets inserted or updated after change sequence ``since``, in order; poll again with ``next``."""
+    if since < 0 or limit < 1:
+        raise HTTPException(status_code=400, detail="since must be >= 0 and limit >= 1")
+    items, next_since, has_more = await APIService.list_changes_async(since, min(limit, CHANGES_MAX_LIMIT))
+    return ORJSONResponse({
+        "request_id": request.state.request_id,
+        "since": since,
+        "next": next_since,
+        "has_more": has_more,
+        "changes": items,
+    })
+
+
+@app.get("/data/export")
+def export_data(request: Request, format: str = "ndjson", q: str | None = None, source: str | None = None):
+    """Every matching asset as NDJSON or CSV, streamed; gzip when the client accepts it."""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    gzip = export.accepts_gzip(request.headers.get("Accept-Encoding", ""))
+    # the body depends on Accept-Encoding, so shared caches must key on it
+    headers = {"Content-Disposition": f'attachment; filename="assets.{format}"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    body = export.encode(format, ASSET_COLUMNS, APIService.export_rows(q=q, source=source), gzip=gzip)
+    return StreamingResponse(body, media_type=export.FORMATS[format], headers=headers)
 
 
 @app.get("/stats")
-def stats():
-    return ETLService.stats()
+async def stats(response: Response):
+    body, hit = await response_cache.get_or_set_async("stats", {}, ETLService.stats_async)
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return {**body, "response_cache": response_cache.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition: API latency, pool state and the ETL process's last published metrics."""
+    return PlainTextResponse(metrics.REGISTRY.render() + metrics.read_textfile(), media_type="text/plain; version=0.0.4")
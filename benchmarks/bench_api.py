@@ -0,0 +1,65 @@
+"""/data latency percentiles through the ASGI app in-process, as JSON on stdout.
+
+    python -m benchmarks.bench_api --rows 10000 --requests 300
+
+Loads ``--rows`` synthetic assets into a throwaway SQLite database with the
+ETL, disables the response cache so every request reaches the database, and
+times requests with an in-process httpx client (no network, no server).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+PATHS = {"page": "/data?limit=50", "page_deep": "/data?limit=50&offset=5000", "search": "/data?q=synthetic%2012",
+         "search_short": "/data?q=5a"}
+
+
+def _percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 3)
+
+
+async def _measure(app, path: str, requests: int):
+    import httpx
+    samples = []
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        await client.get(path)  # warm up
+        for _ in range(requests):
+            start = time.perf_counter()
+            r = await client.get(path)
+            samples.append((time.perf_counter() - start) * 1000)
+            if r.status_code != 200:
+                raise RuntimeError(f"{path} returned {r.status_code}")
+    return {"p50_ms": _percentile(samples, 0.50), "p95_ms": _percentile(samples, 0.95), "p99_ms": _percentile(samples, 0.99)}
+
+
+def run(rows: int, requests: int):
+    logging.disable(logging.INFO)
+    import ingestion.run as etl
+    from benchmarks.synthetic import register
+    etl._ensure_tables()
+    etl._run_source(register("synthetic", n=rows))
+    from api.main import app
+    return {"rows": rows, "requests": requests,
+            **{name: asyncio.run(_measure(app, path, requests)) for name, path in PATHS.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+        result = run(args.rows, args.requests)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Load test: /data throughput with the threadpool (sync) vs the async engine.
+
+    python -m benchmarks.bench_api_load --rows 20000 --concurrency 64 --seconds 10
+
+Starts one uvicorn server per mode against the same throwaway SQLite
+database, with the response cache disabled so every request reaches the
+database, and drives it with concurrent httpx clients.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _seed(db_url: str, rows: int):
+    env = dict(os.environ, DATABASE_URL=db_url)
+    code = (
+        "from core.db import engine\n"
+        "from core.models import Base, Asset\n"
+        "Base.metadata.create_all(bind=engine)\n"
+        "with engine.begin() as conn:\n"
+        f"    conn.execute(Asset.__table__.insert(), [{{'external_id': f'id-{{i}}', 'symbol': f'S{{i}}', "
+        f"'name': f'Asset {{i}}', 'source': 'bench', 'metadata': {{}}}} for i in range({rows})])\n"
+    )
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+
+async def _drive(base: str, concurrency: int, seconds: float, path: str):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            r = await client.get(path)
+            if r.status_code != 200:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def _run_mode(name: str, db_url: str, args) -> str:
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=db_url, API_ASYNC_DB=str(name == "async").lower(),
+               RESPONSE_CACHE_MAX_ENTRIES="0", LOG_LEVEL="WARNING")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port),
+                               "--log-level", "warning"], env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(base + "/", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        asyncio.run(_drive(base, args.concurrency, 1.0, args.path))  # warm up
+        latencies, errors = asyncio.run(_drive(base, args.concurrency, args.seconds, args.path))
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    return (f"{name:>6}: {len(latencies) / args.seconds:8.1f} req/s   p50 {statistics.median(latencies):7.1f} ms   "
+            f"p99 {p99:7.1f} ms   errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--path", default="/data?limit=100&q=asset%201")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        _seed(db_url, args.rows)
+        print(f"rows={args.rows} concurrency={args.concurrency} seconds={args.seconds} path={args.path}")
+        for mode in ("sync", "async"):
+            print(_run_mode(mode, db_url, args))
+
+
+if __name__ == "__main__":
+    main()
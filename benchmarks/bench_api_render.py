@@ -0,0 +1,77 @@
+"""Microbenchmark: /data page rendering, ORM + default encoder vs projection + orjson.
+
+    python -m benchmarks.bench_api_render --rows 20000 --limit 500 --repeat 50
+
+Uses a throwaway SQLite database; each asset carries a metadata payload the
+way ETL-loaded rows do, so the cost of loading the unused column shows up.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+
+def _setup(db_path: str, rows: int):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from core.db import engine
+    from core.models import Base, Asset
+    Base.metadata.create_all(bind=engine)
+    payload = {"rank": 1, "is_new": False, "is_active": True, "type": "coin", "tags": ["a", "b", "c"] * 5,
+               "description": "x" * 400}
+    with engine.begin() as conn:
+        conn.execute(Asset.__table__.insert(), [
+            {"external_id": f"id-{i}", "symbol": f"S{i}", "name": f"Asset {i}", "source": "bench", "metadata": payload}
+            for i in range(rows)
+        ])
+
+
+def orm_page(limit: int) -> bytes:
+    """The previous read path: ORM entities, a dict comprehension, jsonable_encoder and json.dumps."""
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy import select
+    from core.db import SessionLocal
+    from core.models import Asset
+    with SessionLocal() as session:
+        items = session.execute(select(Asset).order_by(Asset.id).limit(limit)).scalars().all()
+        body = {"data": [{"id": a.id, "external_id": a.external_id, "symbol": a.symbol, "name": a.name,
+                          "source": a.source} for a in items]}
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def projected_page(limit: int) -> bytes:
+    from fastapi.responses import ORJSONResponse
+    from services.api_service import APIService
+    items, _, _ = APIService.list_assets(limit=limit)
+    return ORJSONResponse({"data": items}).body
+
+
+def _time(fn, limit: int, repeat: int):
+    fn(limit)  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(limit)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup(os.path.join(tmp, "bench.db"), args.rows)
+        assert json.loads(orm_page(args.limit)) == json.loads(projected_page(args.limit))
+        print(f"rows={args.rows} limit={args.limit} repeat={args.repeat}")
+        for label, fn in (("orm+json", orm_page), ("projection+orjson", projected_page)):
+            median, worst = _time(fn, args.limit, args.repeat)
+            print(f"{label:>20}: median {median:7.2f} ms   max {worst:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""ETL throughput and peak memory for one synthetic load, as JSON on stdout.
+
+    python -m benchmarks.bench_etl --records 100000 [--database-url postgresql+psycopg2://...]
+
+Runs the synthetic source through ``SOURCE_CLASSES`` twice: an initial load
+(every record new) and a rerun where ``--change-ratio`` of the records changed.
+Without ``--database-url`` a throwaway SQLite file is used; a given URL must
+point at a scratch database, since its tables are dropped and recreated.
+Meant to run in its own process (``benchmarks.run`` does this) so the peak
+RSS belongs to this load alone.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run(records: int, database_url: str, duplicate_ratio: float, change_ratio: float, payload_bytes: int):
+    os.environ["DATABASE_URL"] = database_url
+    logging.disable(logging.INFO)
+    from core.db import engine
+    from core.models import Base
+    if engine.dialect.name != "sqlite":
+        Base.metadata.drop_all(bind=engine)
+    import ingestion.run as etl
+    from benchmarks.synthetic import register
+    etl._ensure_tables()
+
+    result = {"backend": engine.dialect.name, "records": records, "duplicate_ratio": duplicate_ratio,
+              "change_ratio": change_ratio, "payload_bytes": payload_bytes}
+    for phase, version in (("initial", 0), ("rerun", 1)):
+        name = register("synthetic", n=records, duplicate_ratio=duplicate_ratio, change_ratio=change_ratio,
+                        payload_bytes=payload_bytes, version=version)
+        outcome = etl._run_source(name)
+        if outcome["status"] != "success":
+            raise RuntimeError(f"{phase} run failed: {outcome['error']}")
+        result[phase] = {
+            "seconds": outcome["seconds"],
+            "records_per_second": round(outcome["records_processed"] / outcome["seconds"], 1) if outcome["seconds"] else None,
+        }
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--database-url")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.01)
+    parser.add_argument("--change-ratio", type=float, default=0.1)
+    parser.add_argument("--payload-bytes", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        result = run(args.records, url, args.duplicate_ratio, args.change_ratio, args.payload_bytes)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark suite: ETL throughput / peak RSS per load size and /data latency.
+
+    python -m benchmarks.run                          # 10k and 100k records on SQLite
+    python -m benchmarks.run --sizes 10000,100000,1000000
+    BENCH_POSTGRES_URL=postgresql+psycopg2://.../scratch python -m benchmarks.run
+    python -m benchmarks.run --update-baseline
+
+Each load runs in a fresh process. Results are written as JSON to
+``--output`` and compared metric by metric with ``--baseline``; the run exits
+non-zero when any metric is worse than the baseline by more than
+``--threshold`` (throughput lower, latency or memory higher).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).parent
+DEFAULT_BASELINE = HERE / "baseline.json"
+DEFAULT_OUTPUT = HERE / "results" / "latest.json"
+
+
+def _run_json(module: str, *args: str) -> dict:
+    out = subprocess.run([sys.executable, "-m", module, *args], check=True, capture_output=True, text=True,
+                         cwd=HERE.parent).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def flatten(results: dict) -> dict:
+    """{"etl.sqlite.10000.initial.records_per_second": 2500.0, "api.search.p95_ms": 6.1, ...}"""
+    flat = {}
+    for run in results.get("etl", []):
+        prefix = f"etl.{run['backend']}.{run['records']}"
+        for phase in ("initial", "rerun"):
+            flat[f"{prefix}.{phase}.records_per_second"] = run[phase]["records_per_second"]
+        flat[f"{prefix}.peak_rss_mb"] = run["peak_rss_mb"]
+    api = results.get("api") or {}
+    for name, stats in api.items():
+        if isinstance(stats, dict):
+            for key, value in stats.items():
+                flat[f"api.{name}.{key}"] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Metrics that regressed by more than ``threshold``, as (name, baseline, current, change)."""
+    regressions = []
+    base, cur = flatten(baseline), flatten(current)
+    for name, old in base.items():
+        new = cur.get(name)
+        if new is None or not old:
+            continue
+        higher_is_better = name.endswith("records_per_second")
+        change = (new - old) / old
+        if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated record counts")
+    parser.add_argument("--postgres-url", default=os.environ.get("BENCH_POSTGRES_URL"),
+                        help="scratch PostgreSQL database (tables are dropped); default $BENCH_POSTGRES_URL")
+    parser.add_argument("--api-rows", type=int, default=10000)
+    parser.add_argument("--api-requests", type=int, default=300)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = {"etl": [], "api": None}
+    backends = [None] + ([args.postgres_url] if args.postgres_url else [])
+    for url in backends:
+        for size in (int(s) for s in args.sizes.split(",") if s):
+            extra = ["--database-url", url] if url else []
+            run = _run_json("benchmarks.bench_etl", "--records", str(size), *extra)
+            print(f"etl {run['backend']:>10} {size:>9}: initial {run['initial']['records_per_second']:>9} rec/s   "
+                  f"rerun {run['rerun']['records_per_second']:>9} rec/s   peak RSS {run['peak_rss_mb']} MB")
+            results["etl"].append(run)
+    results["api"] = _run_json("benchmarks.bench_api", "--rows", str(args.api_rows), "--requests", str(args.api_requests))
+    for name, stats in results["api"].items():
+        if isinstance(stats, dict):
+            print(f"api {name:>12}: p50 {stats['p50_ms']} ms   p95 {stats['p95_ms']} ms   p99 {stats['p99_ms']} ms")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+    for name, old, new, change in regressions:
+        print(f"REGRESSION {name}: {old} -> {new} ({change:+.0%})")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
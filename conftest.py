@@ -35,6 +35,16 @@ def isolated_test_db(monkeypatch):
     original_sessionlocal = core.db.SessionLocal
     core.db.engine = test_engine
     core.db.SessionLocal = TestSessionLocal
+
+    # modules that imported engine/SessionLocal by name keep the originals; repoint them too
+    import sys
+    for name, module in list(sys.modules.items()):
+        if module is None or not name.split(".")[0] in ("api", "services", "ingestion"):
+            continue
+        if getattr(module, "SessionLocal", None) is original_sessionlocal:
+            monkeypatch.setattr(module, "SessionLocal", TestSessionLocal)
+        if getattr(module, "engine", None) is original_engine:
+            monkeypatch.setattr(module, "engine", test_engine)
     
     yield
     
@@ -0,0 +1,88 @@
+# Change sequence for the assets table. Every insert or update written by the
+# ETL stamps the row with the next number from a counter row in
+# data_generation, reserved inside the writing transaction. The counter's row
+# lock is held until commit, so numbers become visible in increasing order
+# and a consumer reading "everything after N" never skips a change. Rows are
+# written with negative placeholders and numbered by ``assign`` right before
+# commit, so concurrent writers (shard workers included) only serialize on
+# that last statement rather than on their whole batch.
+from typing import Any, Dict, List
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+from .models import Asset, DataGeneration
+
+CHANGES = "asset_changes"
+
+INSERT = "insert"
+UPDATE = "update"
+
+
+def ensure(session: Session):
+    """Create the counter row if missing, after every number already stamped.
+
+    Run at startup, before any writer: a row created lazily by concurrent
+    first writers would make all but one of them fail on the primary key.
+    """
+    if session.get(DataGeneration, CHANGES) is None:
+        session.add(DataGeneration(name=CHANGES, generation=_highest(session), asset_total=0))
+        session.flush()
+
+
+def _highest(session: Session) -> int:
+    # placeholders written by an open transaction are negative
+    return session.execute(
+        select(func.coalesce(func.max(Asset.change_seq), 0)).where(Asset.change_seq > 0)
+    ).scalar_one()
+
+
+def reserve(session: Session, count: int) -> int:
+    """Reserve ``count`` sequence numbers inside the caller's transaction; returns the first."""
+    updated = session.execute(
+        update(DataGeneration)
+        .where(DataGeneration.name == CHANGES)
+        .values(generation=DataGeneration.generation + count, updated_at=func.now())
+    ).rowcount
+    if not updated:
+        # only without ensure (a database set up before it ran)
+        session.add(DataGeneration(name=CHANGES, generation=_highest(session) + count, asset_total=0))
+        session.flush()
+    last = session.execute(select(DataGeneration.generation).where(DataGeneration.name == CHANGES)).scalar_one()
+    return last - count + 1
+
+
+def stamp(session: Session, inserted: List[Dict[str, Any]], updated: List[Dict[str, Any]]):
+    """Set placeholder ``change_seq`` values (-1, -2, ...) and ``change_op`` on asset rows about to be written, inserts first."""
+    placeholder = -1
+    for op, rows in ((INSERT, inserted), (UPDATE, updated)):
+        for row in rows:
+            row["change_seq"] = placeholder
+            row["change_op"] = op
+            placeholder -= 1
+
+
+def assign(session: Session, source: str, count: int):
+    """Replace the placeholders ``stamp`` left on ``source``'s rows with ``count`` reserved numbers, in order.
+
+    Call once per transaction, after the asset writes and just before commit:
+    the reservation locks the counter row until then.
+    """
+    if not count:
+        return
+    base = reserve(session, count)
+    session.execute(
+        update(Asset).where(Asset.source == source, Asset.change_seq < 0)
+        .values(change_seq=base - 1 - Asset.change_seq)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backfill(session: Session):
+    """Number assets written before the sequence existed, in id order, after every number handed out so far."""
+    if session.execute(select(Asset.id).where(Asset.change_seq.is_(None)).limit(1)).first() is None:
+        return
+    high = session.execute(select(func.max(Asset.id))).scalar_one()
+    base = reserve(session, high) - 1
+    session.execute(
+        update(Asset).where(Asset.change_seq.is_(None)).values(change_seq=base + Asset.id, change_op=INSERT)
+        .execution_options(synchronize_session=False)
+    )
@@ -1,11 +1,69 @@
 from pydantic import BaseSettings, Field
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str = Field("sqlite:///./data.db", env="DATABASE_URL")
+    # connection pool (per engine; the async engine gets its own pool of the same size)
+    DB_POOL_SIZE: int = Field(5, env="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(10, env="DB_MAX_OVERFLOW")
+    DB_POOL_TIMEOUT_SECONDS: float = Field(30.0, env="DB_POOL_TIMEOUT_SECONDS")
+    DB_POOL_RECYCLE_SECONDS: int = Field(1800, env="DB_POOL_RECYCLE_SECONDS")
+    DB_POOL_PRE_PING: bool = Field(True, env="DB_POOL_PRE_PING")
+    # serve API reads through an AsyncEngine (asyncpg / aiosqlite) instead of the threadpool
+    API_ASYNC_DB: bool = Field(False, env="API_ASYNC_DB")
     COINPAPRIKA_API_KEY: Optional[str] = Field(None, env="COINPAPRIKA_API_KEY")
     ETL_FAIL_AFTER_N_RECORDS: Optional[int] = Field(None, env="ETL_FAIL_AFTER_N_RECORDS")
     LOG_LEVEL: str = Field("INFO", env="LOG_LEVEL")
+    ETL_BATCH_SIZE: int = Field(500, env="ETL_BATCH_SIZE")
+    # batches buffered between the fetch, validate and write stages; 0 runs them in one thread
+    ETL_PIPELINE_DEPTH: int = Field(4, env="ETL_PIPELINE_DEPTH")
+    # worker processes a source's records are hash-partitioned across by record id; 1 disables
+    ETL_SHARDS: int = Field(1, env="ETL_SHARDS")
+    # memory budget for the per-run idempotency key index; 0 disables it
+    ETL_IDEMPOTENCY_MEMORY_MB: int = Field(64, env="ETL_IDEMPOTENCY_MEMORY_MB")
+    # daemon mode (python -m ingestion.run --daemon): seconds between runs of a source, per-source
+    # overrides as JSON (e.g. {"csv": 60}), and random extra delay so replicas do not run in lockstep
+    ETL_SCHEDULE_INTERVAL_SECONDS: float = Field(300.0, env="ETL_SCHEDULE_INTERVAL_SECONDS")
+    ETL_SCHEDULE_INTERVALS: Dict[str, float] = Field({}, env="ETL_SCHEDULE_INTERVALS")
+    ETL_SCHEDULE_JITTER_SECONDS: float = Field(30.0, env="ETL_SCHEDULE_JITTER_SECONDS")
+    # a source's lease expires this long after its last heartbeat and may then be taken over
+    ETL_LEASE_TTL_SECONDS: float = Field(300.0, env="ETL_LEASE_TTL_SECONDS")
+    # retention (python -m ingestion.retention): finished etl_runs kept per source, older ones are folded
+    # into etl_run_daily; payload bodies no row has referenced for RETENTION_PAYLOAD_DAYS are deleted;
+    # rows deleted per transaction
+    RETENTION_KEEP_RUNS: int = Field(100, env="RETENTION_KEEP_RUNS")
+    RETENTION_PAYLOAD_DAYS: float = Field(30.0, env="RETENTION_PAYLOAD_DAYS")
+    RETENTION_BATCH_SIZE: int = Field(1000, env="RETENTION_BATCH_SIZE")
+    # also run retention after run_all and, in daemon mode, every RETENTION_INTERVAL_SECONDS
+    RETENTION_AFTER_ETL: bool = Field(False, env="RETENTION_AFTER_ETL")
+    RETENTION_INTERVAL_SECONDS: float = Field(3600.0, env="RETENTION_INTERVAL_SECONDS")
+    # zlib level for bodies in the payload store (1 fastest .. 9 smallest)
+    PAYLOAD_COMPRESSION_LEVEL: int = Field(6, env="PAYLOAD_COMPRESSION_LEVEL")
+    # sources run concurrently when > 1
+    ETL_MAX_WORKERS: int = Field(1, env="ETL_MAX_WORKERS")
+    # parse API list responses incrementally while they download
+    SOURCE_STREAM_JSON: bool = Field(True, env="SOURCE_STREAM_JSON")
+    # CSV file, directory of *.csv files, or glob; defaults to ingestion/data/assets.csv
+    CSV_SOURCE_PATH: Optional[str] = Field(None, env="CSV_SOURCE_PATH")
+    # read CSV files with pandas in chunks of CSV_CHUNK_SIZE rows
+    CSV_CHUNKED: bool = Field(False, env="CSV_CHUNKED")
+    CSV_CHUNK_SIZE: int = Field(5000, env="CSV_CHUNK_SIZE")
+    # conditional requests (ETag / If-Modified-Since) against a local body cache
+    HTTP_CACHE_ENABLED: bool = Field(True, env="HTTP_CACHE_ENABLED")
+    HTTP_CACHE_DIR: Optional[str] = Field(None, env="HTTP_CACHE_DIR")
+    # "skip" yields nothing on 304, "replay" re-emits the cached body
+    HTTP_CACHE_ON_NOT_MODIFIED: str = Field("skip", env="HTTP_CACHE_ON_NOT_MODIFIED")
+    HTTP_MAX_RETRIES: int = Field(5, env="HTTP_MAX_RETRIES")
+    HTTP_BACKOFF_SECONDS: float = Field(1.0, env="HTTP_BACKOFF_SECONDS")
+    HTTP_MAX_BACKOFF_SECONDS: float = Field(120.0, env="HTTP_MAX_BACKOFF_SECONDS")
+    # in-process cache of /data, /stats and /health results; 0 entries disables it
+    RESPONSE_CACHE_MAX_ENTRIES: int = Field(1024, env="RESPONSE_CACHE_MAX_ENTRIES")
+    RESPONSE_CACHE_TTL_SECONDS: float = Field(30.0, env="RESPONSE_CACHE_TTL_SECONDS")
+    # how stale the data generation may be before it is re-read from the database
+    RESPONSE_CACHE_GENERATION_TTL_SECONDS: float = Field(1.0, env="RESPONSE_CACHE_GENERATION_TTL_SECONDS")
+
+    # where the ETL process leaves its metrics for the API's /metrics; defaults to the system temp dir
+    METRICS_ETL_FILE: Optional[str] = Field(None, env="METRICS_ETL_FILE")
 
     class Config:
         env_file = ".env"
@@ -1,13 +1,78 @@
-from sqlalchemy import create_engine, text
+from typing import Any, Callable, Dict
+import anyio
+from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.engine import make_url, URL
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import OperationalError
 from .config import settings
 
+# async drivers used when API_ASYNC_DB is set
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def pool_options(url) -> Dict[str, Any]:
+    """Pool settings for ``url``. In-memory SQLite keeps SQLAlchemy's single-connection pool."""
+    url = make_url(url)
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING, "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW,
+                   pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS)
+    return options
+
+
 # create engine from settings; keep simple for tests but use future
-engine = create_engine(settings.DATABASE_URL, future=True)
+engine = create_engine(settings.DATABASE_URL, future=True, **pool_options(settings.DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+# sync database url -> async session factory, created on first use
+_async_sessions: Dict[str, Any] = {}
+
+
+def async_url(url) -> URL:
+    """``url`` with its driver swapped for the asyncio one (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}")
+
+
+def async_session_factory():
+    """Async session factory for the current engine, or None unless API_ASYNC_DB is set."""
+    if not settings.API_ASYNC_DB:
+        return None
+    key = str(engine.url)
+    factory = _async_sessions.get(key)
+    if factory is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        options = pool_options(engine.url)
+        if "pool_size" in options:
+            # aiosqlite defaults to NullPool; pool it like every other file database
+            options["poolclass"] = AsyncAdaptedQueuePool
+        async_engine = create_async_engine(async_url(engine.url), **options)
+        factory = _async_sessions[key] = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return factory
+
+
+async def run_session(fn: Callable[..., Any], *args):
+    """Await ``fn(session, *args)`` from async code.
+
+    With API_ASYNC_DB the function runs on the async engine through
+    ``AsyncSession.run_sync`` (no thread); otherwise it runs in a worker thread
+    with a regular session. Either way ``fn`` is plain synchronous ORM code.
+    """
+    factory = async_session_factory()
+    if factory is None:
+        def call():
+            with SessionLocal() as session:
+                return fn(session, *args)
+        return await anyio.to_thread.run_sync(call)
+    async with factory() as session:
+        return await session.run_sync(fn, *args)
+
 def get_session():
     db = SessionLocal()
     try:
@@ -15,6 +80,27 @@ def get_session():
     finally:
         db.close()
 
+def ensure_schema(metadata, bind=None):
+    """Create missing tables, then add any model columns and indexes missing from existing ones.
+
+    Added columns are always nullable and without server defaults, which every
+    backend accepts in ``ALTER TABLE ... ADD COLUMN``.
+    """
+    bind = bind or engine
+    metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
 def check_connection():
     try:
         with engine.connect() as conn:
@@ -22,3 +108,11 @@ def check_connection():
         return True
     except OperationalError:
         return False
+
+
+async def check_connection_async():
+    try:
+        await run_session(lambda session: session.execute(text("SELECT 1")))
+        return True
+    except OperationalError:
+        return False
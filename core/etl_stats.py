@@ -0,0 +1,89 @@
+# Per-source ETL rollup (etl_source_stats). The ETL updates a source's row in the
+# same transaction that records a run starting or finishing, so /stats and
+# /health read a handful of rows instead of aggregating the etl_runs history.
+from typing import List, Optional
+from sqlalchemy import select, func, case
+from sqlalchemy.orm import Session
+from .models import ETLRun, ETLSourceStats
+
+
+def _row(session: Session, source: str) -> ETLSourceStats:
+    row = session.get(ETLSourceStats, source)
+    if row is None:
+        row = ETLSourceStats(source=source, total_runs=0, success_runs=0, failed_runs=0, total_records_processed=0)
+        session.add(row)
+    return row
+
+
+def run_started(session: Session, run: ETLRun):
+    row = _row(session, run.source)
+    row.last_status = run.status
+    row.last_run_started_at = func.now()
+
+
+def run_finished(session: Session, run: ETLRun, seconds: float):
+    """Fold a finished run into its source's totals; also stamps ``run.run_finished_at``."""
+    run.run_finished_at = func.now()
+    row = _row(session, run.source)
+    processed = run.records_processed or 0
+    row.total_runs = (row.total_runs or 0) + 1
+    row.last_status = run.status
+    if run.status == "success":
+        row.success_runs = (row.success_runs or 0) + 1
+        row.last_success_at = func.now()
+    else:
+        row.failed_runs = (row.failed_runs or 0) + 1
+        row.last_failure_at = func.now()
+        row.last_error = run.error
+    row.last_records_processed = processed
+    row.total_records_processed = (row.total_records_processed or 0) + processed
+    row.last_duration_seconds = round(seconds, 3)
+    row.last_records_per_second = round(processed / seconds, 1) if seconds > 0 else None
+
+
+def backfill(session: Session) -> int:
+    """Build the rollup from etl_runs when it is empty (first start after an upgrade).
+
+    Runs that predate ``run_finished_at`` being recorded count their start time
+    instead. Returns the number of sources written.
+    """
+    if session.execute(select(ETLSourceStats.source).limit(1)).first() is not None:
+        return 0
+    finished = func.coalesce(ETLRun.run_finished_at, ETLRun.run_started_at)
+    totals = session.execute(
+        select(
+            ETLRun.source,
+            func.count(),
+            func.sum(case((ETLRun.status == "success", 1), else_=0)),
+            func.sum(case((ETLRun.status == "failed", 1), else_=0)),
+            func.max(case((ETLRun.status == "success", finished))),
+            func.max(case((ETLRun.status == "failed", finished))),
+            func.coalesce(func.sum(ETLRun.records_processed), 0),
+        ).group_by(ETLRun.source)
+    ).all()
+    for source, total, ok, failed, last_ok, last_failed, processed in totals:
+        last = session.execute(
+            select(ETLRun).where(ETLRun.source == source).order_by(ETLRun.run_started_at.desc(), ETLRun.id.desc()).limit(1)
+        ).scalar_one()
+        last_error = session.execute(
+            select(ETLRun.error).where(ETLRun.source == source, ETLRun.status == "failed")
+            .order_by(ETLRun.run_started_at.desc(), ETLRun.id.desc()).limit(1)
+        ).scalar()
+        session.add(ETLSourceStats(
+            source=source, total_runs=total, success_runs=ok or 0, failed_runs=failed or 0,
+            last_status=last.status, last_run_started_at=last.run_started_at,
+            last_success_at=last_ok, last_failure_at=last_failed, last_error=last_error,
+            last_records_processed=last.records_processed, total_records_processed=processed,
+        ))
+    return len(totals)
+
+
+def all_sources(session: Session) -> List[ETLSourceStats]:
+    return session.execute(select(ETLSourceStats).order_by(ETLSourceStats.source)).scalars().all()
+
+
+def latest(session: Session) -> Optional[ETLSourceStats]:
+    """The source whose run started most recently."""
+    return session.execute(
+        select(ETLSourceStats).order_by(ETLSourceStats.last_run_started_at.desc().nulls_last()).limit(1)
+    ).scalar_one_or_none()
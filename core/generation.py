@@ -0,0 +1,94 @@
+# Data generation counter for the assets table. The ETL bumps it in the same
+# transaction as every batch that changes assets and keeps a running row total
+# next to it; readers use it to tell when cached results are stale. A second
+# counter, ETL_RUNS, moves whenever an ETL run starts or finishes.
+import itertools
+from typing import Dict, Tuple
+from sqlalchemy import event, select, update, func
+from sqlalchemy.orm import Session
+from .models import Asset, DataGeneration
+
+ASSETS = "assets"
+ETL_RUNS = "etl_runs"
+
+# advanced after every commit that moved a counter in this process, so local
+# readers notice without waiting to re-read the table
+_local = itertools.count(1)
+local_version = 0
+
+
+def _committed(session):
+    global local_version
+    local_version = next(_local)
+
+
+def _track(session: Session):
+    if not session.info.get("generation_tracked"):
+        session.info["generation_tracked"] = True
+        event.listen(session, "after_commit", _committed)
+
+
+def ensure(session: Session) -> DataGeneration:
+    """Return the assets generation row, creating it (with a counted total) if missing."""
+    row = session.get(DataGeneration, ASSETS)
+    if row is None:
+        total = session.execute(select(func.count()).select_from(Asset)).scalar_one()
+        row = DataGeneration(name=ASSETS, generation=1, asset_total=total)
+        session.add(row)
+        session.flush()
+    return row
+
+
+def bump(session: Session, assets_inserted: int = 0):
+    """Advance the generation inside the caller's transaction."""
+    updated = session.execute(
+        update(DataGeneration)
+        .where(DataGeneration.name == ASSETS)
+        .values(generation=DataGeneration.generation + 1,
+                asset_total=DataGeneration.asset_total + assets_inserted,
+                updated_at=func.now())
+    ).rowcount
+    if not updated:
+        # the count already includes rows inserted by the caller's transaction
+        ensure(session)
+    _track(session)
+
+
+def touch(session: Session, name: str = ETL_RUNS):
+    """Advance the ``name`` counter inside the caller's transaction."""
+    updated = session.execute(
+        update(DataGeneration)
+        .where(DataGeneration.name == name)
+        .values(generation=DataGeneration.generation + 1, updated_at=func.now())
+    ).rowcount
+    if not updated:
+        session.add(DataGeneration(name=name, generation=1, asset_total=0))
+        session.flush()
+    _track(session)
+
+
+def refresh(session: Session):
+    """Advance the generation and recount the asset total exactly (end of an ETL run)."""
+    ensure(session)
+    total = select(func.count()).select_from(Asset).scalar_subquery()
+    session.execute(
+        update(DataGeneration)
+        .where(DataGeneration.name == ASSETS)
+        .values(generation=DataGeneration.generation + 1, asset_total=total, updated_at=func.now())
+    )
+    _track(session)
+
+
+def current(session: Session) -> Tuple[int, int]:
+    """(generation, asset_total); (0, counted total) before the first ETL write."""
+    row = session.execute(
+        select(DataGeneration.generation, DataGeneration.asset_total).where(DataGeneration.name == ASSETS)
+    ).first()
+    if row is None:
+        return 0, session.execute(select(func.count()).select_from(Asset)).scalar_one()
+    return row.generation, row.asset_total
+
+
+def versions(session: Session) -> Dict[str, int]:
+    """Every counter by name, in one query."""
+    return dict(session.execute(select(DataGeneration.name, DataGeneration.generation)).all())
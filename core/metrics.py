@@ -0,0 +1,192 @@
+# In-process metrics registry with Prometheus text exposition; no client library
+# or collector needed. Counters and histograms are plain dicts behind a lock,
+# keyed by label values. Hot loops should aggregate locally and observe once per
+# batch or run rather than once per record.
+import bisect
+import math
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        lines = []
+        for key, counts, total, n in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def collector(self, fn: Callable[[], None]):
+        """Register ``fn`` to update gauges at scrape time (e.g. pool state)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self, prefix: str = "") -> str:
+        """Prometheus text exposition of every metric whose name starts with ``prefix``."""
+        for fn in self._collectors:
+            fn()
+        lines: List[str] = []
+        for name, metric in sorted(self._metrics.items()):
+            if not name.startswith(prefix):
+                continue
+            samples = metric.samples()
+            if samples:
+                lines += metric.header() + samples
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# textfiles other processes publish for /metrics: the ETL's, and retention's next to it
+TEXTFILES = ("etl", "retention")
+
+
+def etl_textfile(path: Optional[str] = None, name: str = "etl") -> Path:
+    """Textfile for ``name``'s metrics: ``METRICS_ETL_FILE`` for the ETL, a sibling file for the others."""
+    from .config import settings
+    base = Path(path or settings.METRICS_ETL_FILE or Path(tempfile.gettempdir()) / "kasparro-etl-metrics.prom")
+    return base if name == "etl" else base.with_name(f"{base.stem}-{name}{base.suffix}")
+
+
+def write_textfile(prefix: str, path: Optional[str] = None, name: str = "etl"):
+    """Atomically write metrics starting with ``prefix`` to ``name``'s textfile for another process to serve."""
+    target = etl_textfile(path, name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(f"# pid {os.getpid()}\n" + REGISTRY.render(prefix))
+    os.replace(tmp, target)
+
+
+def read_textfile(path: Optional[str] = None) -> str:
+    """Metrics written by other processes with ``write_textfile``, every textfile in ``TEXTFILES``; empty if none."""
+    parts = []
+    for name in TEXTFILES:
+        try:
+            text = etl_textfile(path, name).read_text()
+        except OSError:
+            continue
+        first, _, rest = text.partition("\n")
+        if first != f"# pid {os.getpid()}":  # else written by this process; its values are already in REGISTRY
+            parts.append(rest)
+    return "".join(parts)
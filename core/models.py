@@ -1,15 +1,40 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, func, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Float, func, Boolean, UniqueConstraint, Index, LargeBinary, BigInteger, Date
 from sqlalchemy.orm import relationship
 from .db import Base
 
+# zlib-compressed canonical JSON, one row per distinct body (see core.payloads)
+class Payload(Base):
+    __tablename__ = "payloads"
+    hash = Column(String(32), primary_key=True)
+    body = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # when retention first found no row referencing the body; cleared if it is referenced again
+    unreferenced_at = Column(DateTime(timezone=True), nullable=True)
+
+    @property
+    def value(self):
+        from .payloads import decode
+        return decode(self.body)
+
+
 class RawAsset(Base):
     __tablename__ = "raw_assets"
     id = Column(Integer, primary_key=True)
     source = Column(String, nullable=False)
     record_id = Column(String, nullable=False)
-    payload = Column(JSON, nullable=False)
+    # inline JSON is only left on rows written before the payload store
+    inline_payload = Column("payload", JSON(none_as_null=True), nullable=True)
+    payload_hash = Column(String(32), nullable=True)
+    content_hash = Column(String(32), nullable=True)
     ingested_at = Column(DateTime(timezone=True), server_default=func.now())
-    __table_args__ = (UniqueConstraint('source','record_id',name='uq_raw_source_record'),)
+    stored_payload = relationship(Payload, primaryjoin="foreign(RawAsset.payload_hash) == Payload.hash", viewonly=True)
+    __table_args__ = (UniqueConstraint('source','record_id',name='uq_raw_source_record'),
+                      Index('ix_raw_assets_payload_hash', 'payload_hash'))
+
+    @property
+    def payload(self):
+        return self.stored_payload.value if self.stored_payload is not None else self.inline_payload
 
 class Asset(Base):
     __tablename__ = "assets"
@@ -18,15 +43,30 @@ class Asset(Base):
     name = Column(String, nullable=True)
     external_id = Column(String, nullable=False)
     source = Column(String, nullable=False)
-    run_metadata = Column("metadata", JSON, nullable=True)
+    inline_metadata = Column("metadata", JSON(none_as_null=True), nullable=True)
+    metadata_hash = Column(String(32), nullable=True)
+    content_hash = Column(String(32), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    __table_args__ = (UniqueConstraint('external_id','source',name='uq_asset_external_source'),)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # position in the change feed (core.changes) and whether that change inserted or updated the row
+    change_seq = Column(BigInteger, nullable=True)
+    change_op = Column(String(6), nullable=True)
+    stored_metadata = relationship(Payload, primaryjoin="foreign(Asset.metadata_hash) == Payload.hash", viewonly=True)
+    __table_args__ = (UniqueConstraint('external_id','source',name='uq_asset_external_source'),
+                      Index('ix_assets_change_seq', 'change_seq'),
+                      Index('ix_assets_metadata_hash', 'metadata_hash'))
+
+    @property
+    def run_metadata(self):
+        return self.stored_metadata.value if self.stored_metadata is not None else self.inline_metadata
 
 class Checkpoint(Base):
     __tablename__ = "etl_checkpoints"
     id = Column(Integer, primary_key=True)
     source = Column(String, nullable=False, unique=True)
     last_record_id = Column(String, nullable=True)
+    # source-specific resume point, e.g. {"offset", "line", "fingerprint"} for CSV files
+    position = Column(JSON, nullable=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class ETLRun(Base):
@@ -37,5 +77,90 @@ class ETLRun(Base):
     run_finished_at = Column(DateTime(timezone=True), nullable=True)
     status = Column(String, nullable=False)
     records_processed = Column(Integer, default=0)
+    records_new = Column(Integer, default=0)
+    records_unchanged = Column(Integer, default=0)
+    records_changed = Column(Integer, default=0)
+    records_invalid = Column(Integer, default=0)
+    # quarantine reason -> count for this run
+    validation_errors = Column(JSON, nullable=True)
     error = Column(String, nullable=True)
     injected_failure = Column(Boolean, default=False)
+    __table_args__ = (Index('ix_etl_runs_source_status_finished', 'source', 'status', 'run_finished_at'),)
+
+
+# etl_runs folded per source and UTC day by retention once they fall outside the runs it keeps
+class ETLRunDaily(Base):
+    __tablename__ = "etl_run_daily"
+    source = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    runs = Column(Integer, default=0)
+    success_runs = Column(Integer, default=0)
+    failed_runs = Column(Integer, default=0)
+    records_processed = Column(Integer, default=0)
+    records_new = Column(Integer, default=0)
+    records_unchanged = Column(Integer, default=0)
+    records_changed = Column(Integer, default=0)
+    records_invalid = Column(Integer, default=0)
+    # summed over runs that recorded both their start and finish
+    duration_seconds = Column(Float, default=0.0)
+
+
+# progress of each worker of a sharded run; round is the last dispatched round it has durably written
+class ETLShardProgress(Base):
+    __tablename__ = "etl_shard_progress"
+    run_id = Column(Integer, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    round = Column(Integer, nullable=True)
+    records_processed = Column(Integer, default=0)
+    records_new = Column(Integer, default=0)
+    records_unchanged = Column(Integer, default=0)
+    records_changed = Column(Integer, default=0)
+    records_invalid = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class Quarantine(Base):
+    __tablename__ = "quarantine"
+    id = Column(Integer, primary_key=True)
+    source = Column(String, nullable=False)
+    record_id = Column(String, nullable=False)
+    reason = Column(String, nullable=False)
+    payload = Column(JSON, nullable=True)
+    run_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    __table_args__ = (UniqueConstraint('source','record_id',name='uq_quarantine_source_record'),)
+
+
+# one row per source; owner holds the single-flight ETL lease until expires_at (see ingestion.leases)
+class ETLLease(Base):
+    __tablename__ = "etl_leases"
+    source = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)
+    acquired_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# per-source rollup of etl_runs, written in the same transaction as each run's status
+class ETLSourceStats(Base):
+    __tablename__ = "etl_source_stats"
+    source = Column(String, primary_key=True)
+    total_runs = Column(Integer, nullable=False, default=0)
+    success_runs = Column(Integer, nullable=False, default=0)
+    failed_runs = Column(Integer, nullable=False, default=0)
+    last_status = Column(String, nullable=True)
+    last_run_started_at = Column(DateTime(timezone=True), nullable=True)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+    last_failure_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String, nullable=True)
+    last_records_processed = Column(Integer, nullable=True)
+    total_records_processed = Column(Integer, nullable=False, default=0)
+    last_duration_seconds = Column(Float, nullable=True)
+    last_records_per_second = Column(Float, nullable=True)
+
+
+class DataGeneration(Base):
+    __tablename__ = "data_generation"
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=1)
+    asset_total = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,126 @@
+# Content-addressed payload store. Raw payloads and asset metadata are kept once
+# per distinct body in the ``payloads`` table as zlib-compressed canonical JSON,
+# keyed by the same hash the ETL uses for change detection; raw_assets and
+# assets reference them by hash and read them back through model accessors.
+import hashlib
+import json
+import logging
+import zlib
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy import Table, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.orm import Session
+from .config import settings
+
+logger = logging.getLogger("core.payloads")
+
+# hashes per IN (...) list when loading bodies
+LOAD_CHUNK = 900
+
+
+def canonical(payload: Any) -> bytes:
+    """Key order and whitespace insensitive JSON encoding of ``payload``."""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def row(payload: Any, payload_hash: Optional[str] = None) -> Dict[str, Any]:
+    """``payloads`` table row for ``payload``; ``payload_hash`` skips re-hashing when already known."""
+    data = canonical(payload)
+    return {"hash": payload_hash or digest(data), "body": zlib.compress(data, settings.PAYLOAD_COMPRESSION_LEVEL),
+            "size": len(data)}
+
+
+def decode(body: bytes) -> Any:
+    return json.loads(zlib.decompress(body))
+
+
+def load(session: Session, hashes: Iterable[str]) -> Dict[str, Any]:
+    """Decoded payload for each of ``hashes`` that is stored."""
+    from .models import Payload
+    hashes = [h for h in set(hashes) if h]
+    found: Dict[str, Any] = {}
+    for i in range(0, len(hashes), LOAD_CHUNK):
+        stmt = select(Payload.hash, Payload.body).where(Payload.hash.in_(hashes[i:i + LOAD_CHUNK]))
+        found.update((h, decode(body)) for h, body in session.execute(stmt))
+    return found
+
+
+def ensure(bind: Engine):
+    """Let ``raw_assets.payload`` hold NULL in databases created before the store existed.
+
+    PostgreSQL drops the constraint in place; SQLite cannot, so the table is
+    rebuilt from the current model once, in a single transaction. Run it
+    before ``ensure_schema``; a missing table is left for that to create.
+    """
+    from .models import RawAsset
+    table = RawAsset.__table__
+    legacy = f"{table.name}_legacy"
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+    if legacy in tables:
+        # left behind by a rebuild that older versions ran outside a transaction
+        logger.warning("Finishing interrupted rebuild of %s", table.name)
+        _rebuild_sqlite(bind, table, legacy, create=table.name not in tables)
+        return
+    if table.name not in tables:
+        return
+    columns = inspector.get_columns(table.name)
+    if all(c["nullable"] for c in columns if c["name"] == "payload"):
+        return
+    logger.info("Dropping NOT NULL from raw_assets.payload")
+    if bind.dialect.name != "sqlite":
+        with bind.begin() as conn:
+            conn.execute(text("ALTER TABLE raw_assets ALTER COLUMN payload DROP NOT NULL"))
+        return
+    _rebuild_sqlite(bind, table, table.name, create=True)
+
+
+def _rebuild_sqlite(bind: Engine, table: Table, source: str, create: bool):
+    """Copy the rows of table ``source`` into ``table`` as the model defines it, then drop ``source``.
+
+    When ``source`` is ``table`` itself it is renamed out of the way first.
+    Everything runs in one transaction, driven by hand on the raw connection
+    since pysqlite commits implicitly before DDL. Named indexes of the old
+    table are dropped up front: they keep their names across a rename and
+    would clash with the model's.
+    """
+    legacy = f"{table.name}_legacy"
+    with bind.connect() as conn:
+        indexes = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (source,)
+        ).scalars().all()
+        names = [c["name"] for c in inspect(conn).get_columns(source) if c["name"] in table.c]
+    columns = ", ".join(f'"{name}"' for name in names)
+    statements = [f'DROP INDEX "{name}"' for name in indexes]
+    if source == table.name:
+        statements.append(f"ALTER TABLE {table.name} RENAME TO {legacy}")
+    if create:
+        statements.append(str(CreateTable(table).compile(dialect=bind.dialect)))
+        statements += [str(CreateIndex(index).compile(dialect=bind.dialect)) for index in table.indexes]
+    statements += [
+        f"INSERT OR IGNORE INTO {table.name} ({columns}) SELECT {columns} FROM {legacy}",
+        f"DROP TABLE {legacy}",
+    ]
+    raw = bind.raw_connection()
+    try:
+        driver = raw.driver_connection
+        isolation_level, driver.isolation_level = driver.isolation_level, None
+        cursor = driver.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+            driver.isolation_level = isolation_level
+    finally:
+        raw.close()
@@ -0,0 +1,128 @@
+# Substring search over asset symbol and name for /data?q=. PostgreSQL uses
+# pg_trgm GIN indexes under the usual ILIKE; SQLite keeps an FTS5 trigram table
+# that the ETL refreshes incrementally after each run.
+import logging
+from typing import Dict
+from sqlalchemy import text, case, func, column, Integer
+from sqlalchemy.engine import Connection, Engine
+from core.models import Asset
+
+logger = logging.getLogger("core.search")
+
+# trigram indexes cannot answer queries shorter than this
+MIN_TRIGRAM_QUERY = 3
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_assets_symbol_trgm ON assets USING gin (symbol gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_name_trgm ON assets USING gin (name gin_trgm_ops)",
+]
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS assets_search USING fts5(symbol, name, tokenize='trigram')",
+    "CREATE TABLE IF NOT EXISTS assets_search_state (id INTEGER PRIMARY KEY CHECK (id = 1), watermark TEXT)",
+]
+
+# database url -> whether the search index is usable there
+_available: Dict[str, bool] = {}
+
+
+def ensure(bind: Engine) -> bool:
+    """Create (and on SQLite, build) the search index for ``bind`` once per process.
+
+    Returns False when the backend cannot provide one; callers then fall back
+    to plain ILIKE scans.
+    """
+    key = str(bind.url)
+    if key in _available:
+        return _available[key]
+    ddl = {"postgresql": _PG_DDL, "sqlite": _SQLITE_DDL}.get(bind.dialect.name)
+    ok = False
+    if ddl:
+        try:
+            with bind.begin() as conn:
+                for stmt in ddl:
+                    conn.execute(text(stmt))
+                if bind.dialect.name == "sqlite":
+                    built = conn.execute(text("SELECT 1 FROM assets_search_state WHERE id = 1")).first()
+                    if built is None:
+                        _refresh_sqlite(conn)
+            ok = True
+        except Exception as e:
+            logger.warning("Search index unavailable, falling back to ILIKE scans: %s", e)
+    _available[key] = ok
+    return ok
+
+
+def _refresh_sqlite(conn: Connection):
+    watermark = conn.execute(text("SELECT watermark FROM assets_search_state WHERE id = 1")).scalar()
+    params = {}
+    where = ""
+    if watermark is not None:
+        # >=: SQLite timestamps have second resolution and re-indexing a row is harmless.
+        # Rows with a NULL updated_at predate the column, were covered by the first
+        # (full) build, and get a timestamp from every ETL write, so they are skipped.
+        where = "WHERE updated_at >= :w"
+        params["w"] = watermark
+    conn.execute(text(f"DELETE FROM assets_search WHERE rowid IN (SELECT id FROM assets {where})"), params)
+    conn.execute(text(
+        "INSERT INTO assets_search (rowid, symbol, name) "
+        f"SELECT id, coalesce(symbol, ''), coalesce(name, '') FROM assets {where}"
+    ), params)
+    latest = conn.execute(text("SELECT max(updated_at) FROM assets")).scalar()
+    conn.execute(
+        text("INSERT INTO assets_search_state (id, watermark) VALUES (1, :w) "
+             "ON CONFLICT (id) DO UPDATE SET watermark = excluded.watermark"),
+        {"w": latest if latest is not None else watermark},
+    )
+
+
+def refresh(bind: Engine):
+    """Re-index assets written since the last refresh; called after each ETL run.
+
+    SQLite's FTS5 table is updated incrementally by ``updated_at``. PostgreSQL
+    maintains its GIN indexes itself, so there is nothing to do there.
+    """
+    if bind.dialect.name != "sqlite":
+        ensure(bind)
+        return
+    if str(bind.url) in _available:
+        if not _available[str(bind.url)]:
+            return
+        with bind.begin() as conn:
+            _refresh_sqlite(conn)
+    else:
+        # first use in this process builds or catches up the index
+        if ensure(bind):
+            with bind.begin() as conn:
+                _refresh_sqlite(conn)
+
+
+def _escape_like(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def apply_filter(stmt, q: str, bind: Engine):
+    """Restrict ``stmt`` to assets whose symbol or name contains ``q`` (case-insensitive).
+
+    On SQLite, queries of three or more characters go through the FTS5 trigram
+    index; PostgreSQL answers the ILIKE from its trigram GIN indexes.
+    """
+    if bind.dialect.name == "sqlite" and len(q) >= MIN_TRIGRAM_QUERY and ensure(bind):
+        phrase = '"' + q.replace('"', '""') + '"'
+        matches = text("SELECT rowid FROM assets_search WHERE assets_search MATCH :phrase") \
+            .bindparams(phrase=phrase).columns(column("rowid", Integer))
+        return stmt.where(Asset.id.in_(matches))
+    if bind.dialect.name == "postgresql":
+        ensure(bind)
+    pattern = f"%{_escape_like(q)}%"
+    return stmt.where(Asset.symbol.ilike(pattern, escape="\\") | Asset.name.ilike(pattern, escape="\\"))
+
+
+def rank(q: str):
+    """Ordering key: 0 for an exact symbol match, 1 for a symbol prefix, 2 otherwise."""
+    q_lower = q.lower()
+    return case(
+        (func.lower(Asset.symbol) == q_lower, 0),
+        (func.lower(Asset.symbol).like(_escape_like(q_lower) + "%", escape="\\"), 1),
+        else_=2,
+    )
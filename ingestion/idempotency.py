@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import math
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+from sqlalchemy import select, func, null
+from sqlalchemy.orm import Session
+from core.models import RawAsset
+from core import payloads
+
+logger = logging.getLogger("ingestion.idempotency")
+
+# rough in-memory cost of one key -> content hash entry held in a dict
+BYTES_PER_KEY = 200
+# keys fetched per round-trip while preloading
+LOAD_CHUNK = 10000
+# keys per IN (...) list when resolving Bloom filter hits
+RESOLVE_CHUNK = 900
+
+# lookup results that are not a stored hash
+ABSENT = object()  # definitely not stored
+MAYBE = object()   # may be stored; ask the database
+
+
+def content_hash(payload: Any) -> str:
+    """Stable hash of a JSON-compatible payload (key order and whitespace insensitive)."""
+    return payloads.digest(payloads.canonical(payload))
+
+
+def shard_of(record_id: Optional[str], shards: int) -> int:
+    """Stable shard for ``record_id`` (the same in every process, unlike ``hash``)."""
+    if record_id is None or shards <= 1:
+        return 0
+    return zlib.crc32(record_id.encode("utf-8")) % shards
+
+
+class KeyMap:
+    """Exact in-memory map of record key -> content hash."""
+
+    exact = True
+
+    def __init__(self):
+        self._hashes: Dict[str, Optional[str]] = {}
+
+    def get(self, key: str):
+        return self._hashes.get(key, ABSENT)
+
+    def set(self, key: str, digest: Optional[str]):
+        self._hashes[key] = digest
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter. ``get`` returns ABSENT for keys that are
+    definitely not stored and MAYBE for everything else; hashes are not kept."""
+
+    exact = False
+
+    def __init__(self, num_bits: int, expected_items: int):
+        self.num_bits = max(8, num_bits)
+        ratio = self.num_bits / max(1, expected_items)
+        self.num_hashes = max(1, min(16, round(ratio * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def get(self, key: str):
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return ABSENT
+        return MAYBE
+
+    def set(self, key: str, digest: Optional[str] = None):
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+
+class IdempotencyIndex:
+    """Stored raw record keys and content hashes for one source, preloaded once per run.
+
+    Keys live in an exact ``KeyMap`` when they fit in the memory budget and in a
+    ``BloomFilter`` sized to the budget otherwise. Bloom MAYBE answers are
+    settled by ``resolve`` with one batched query per flush.
+    """
+
+    def __init__(self, source_name: str, keys):
+        self.source_name = source_name
+        self.keys = keys
+
+    @classmethod
+    def load(cls, session: Session, source_name: str, budget_bytes: int,
+             shard: Optional[Tuple[int, int]] = None) -> "IdempotencyIndex":
+        """Preload the keys of ``source_name``; with ``shard=(k, n)`` only those ``shard_of`` maps to ``k``."""
+        count = session.execute(select(func.count()).where(RawAsset.source == source_name)).scalar_one()
+        if shard is not None:
+            count //= shard[1]
+        if count * BYTES_PER_KEY <= budget_bytes:
+            keys = KeyMap()
+            stmt = select(RawAsset.record_id, RawAsset.content_hash)
+        else:
+            keys = BloomFilter(num_bits=budget_bytes * 8, expected_items=count)
+            stmt = select(RawAsset.record_id, null())
+            logger.info("Key count %d for %s exceeds memory budget; using Bloom filter", count, source_name)
+        stmt = stmt.where(RawAsset.source == source_name).execution_options(yield_per=LOAD_CHUNK)
+        if shard is None:
+            for key, digest in session.execute(stmt):
+                keys.set(key, digest)
+        else:
+            k, n = shard
+            for key, digest in session.execute(stmt):
+                if shard_of(key, n) == k:
+                    keys.set(key, digest)
+        return cls(source_name, keys)
+
+    def get(self, key: str):
+        """Stored content hash for ``key`` (None for rows written before hashing), ABSENT or MAYBE."""
+        return self.keys.get(key)
+
+    def set(self, key: str, digest: Optional[str]):
+        self.keys.set(key, digest)
+
+    def resolve(self, session: Session, keys: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Stored content hash for each of ``keys`` that exists in raw_assets."""
+        return resolve_hashes(session, self.source_name, keys)
+
+
+def resolve_hashes(session: Session, source_name: str, keys: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Look up stored content hashes for ``keys`` in batched IN queries."""
+    keys = list(keys)
+    found: Dict[str, Optional[str]] = {}
+    for i in range(0, len(keys), RESOLVE_CHUNK):
+        stmt = select(RawAsset.record_id, RawAsset.content_hash).where(
+            RawAsset.source == source_name, RawAsset.record_id.in_(keys[i:i + RESOLVE_CHUNK]))
+        found.update((key, digest) for key, digest in session.execute(stmt))
+    return found
@@ -0,0 +1,171 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import select, or_
+from core.db import SessionLocal
+from core.models import ETLLease, ETLRun
+from core import etl_stats, generation, metrics
+from core.config import settings
+from ingestion.writer import insert_ignore
+
+logger = logging.getLogger("ingestion.leases")
+
+LEASE_TAKEOVERS = metrics.REGISTRY.counter("etl_lease_takeovers_total", "Expired source leases taken over", ("source",))
+
+# identifies this process in etl_leases.owner; each acquire appends its own token
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseLost(RuntimeError):
+    """Raised when a run finds that its source lease has been taken over."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Lease:
+    """Single-flight lease on one source, shared by every replica through ``etl_leases``.
+
+    ``acquire`` claims the row with one conditional UPDATE that only matches
+    when the lease is free or expired, so at most one owner wins.
+    While held, a background thread extends ``expires_at`` every third of the
+    TTL; a process that dies stops renewing and its lease is taken over once
+    it expires, marking the runs it left in ``running`` as failed. Times are
+    UTC from the replicas' clocks, which are assumed to agree within the TTL.
+    Every acquire claims under a fresh owner token, so two threads of one
+    process exclude each other like two replicas do.
+
+    Writers call ``fence`` before each commit, so a run whose lease was taken
+    over stops with ``LeaseLost`` instead of writing alongside the new owner.
+
+    Use as a context manager; the result is truthy when the lease was won::
+
+        with Lease("csv") as lease:
+            if lease:
+                ...
+    """
+
+    def __init__(self, source: str, ttl: Optional[float] = None, owner: Optional[str] = None, shared: bool = False):
+        self.source = source
+        self.ttl = ttl or settings.ETL_LEASE_TTL_SECONDS
+        # a fixed owner (tests, shard workers acting for their coordinator); otherwise one token per acquire
+        self._fixed_owner = owner
+        self.owner = owner or OWNER
+        # a handle for processes writing on behalf of ``owner`` (shard workers): never acquired or released
+        self.shared = shared
+        self.held = False
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def __bool__(self):
+        return self.held
+
+    def _claim(self, session, now: datetime):
+        table = ETLLease.__table__
+        return session.execute(
+            table.update()
+            .where(table.c.source == self.source,
+                   or_(table.c.owner.is_(None), table.c.expires_at < now))
+            .values(owner=self.owner, acquired_at=now, expires_at=now + timedelta(seconds=self.ttl))
+        ).rowcount == 1
+
+    def acquire(self) -> bool:
+        if self._fixed_owner is None:
+            self.owner = f"{OWNER}:{uuid.uuid4().hex[:8]}"
+        with SessionLocal() as session:
+            insert_ignore(session, ETLLease.__table__, [{"source": self.source}], ("source",))
+            previous = session.execute(select(ETLLease.owner).where(ETLLease.source == self.source)).scalar_one_or_none()
+            if not self._claim(session, _now()):
+                session.rollback()
+                logger.info("Source %s is leased by %s; skipping", self.source, previous)
+                return False
+            if previous is not None:
+                self._abandon(session, previous)
+            session.commit()
+        self.held = True
+        return True
+
+    def _abandon(self, session, previous: str):
+        logger.warning("Taking over expired lease on %s from %s", self.source, previous)
+        LEASE_TAKEOVERS.inc(source=self.source)
+        runs = session.execute(select(ETLRun).where(ETLRun.source == self.source, ETLRun.status == "running")).scalars()
+        for run in runs:
+            run.status = "failed"
+            run.error = f"Abandoned: lease held by {previous} expired"
+            etl_stats.run_finished(session, run, 0.0)
+        generation.touch(session, generation.ETL_RUNS)
+
+    def renew(self) -> bool:
+        table = ETLLease.__table__
+        with SessionLocal() as session:
+            renewed = session.execute(
+                table.update().where(table.c.source == self.source, table.c.owner == self.owner)
+                .values(expires_at=_now() + timedelta(seconds=self.ttl))
+            ).rowcount == 1
+            session.commit()
+        return renewed
+
+    def fence(self, session):
+        """Raise ``LeaseLost`` unless the lease is still ours, extending it if so.
+
+        Call inside a write transaction just before it commits: the check runs
+        in that transaction, so no replica can take the lease over between the
+        check and the commit. A ``shared`` handle only reads the row under a
+        shared lock, so shard workers neither extend the lease nor queue on
+        one another.
+        """
+        if not self.lost and self.shared:
+            owner = session.execute(
+                select(ETLLease.owner).where(ETLLease.source == self.source).with_for_update(read=True)
+            ).scalar_one_or_none()
+            self.lost = owner != self.owner
+        elif not self.lost:
+            table = ETLLease.__table__
+            self.lost = session.execute(
+                table.update().where(table.c.source == self.source, table.c.owner == self.owner)
+                .values(expires_at=_now() + timedelta(seconds=self.ttl))
+            ).rowcount != 1
+        if self.lost:
+            raise LeaseLost(f"Lease on {self.source} was taken over by another replica")
+
+    def release(self):
+        if not self.held:
+            return
+        table = ETLLease.__table__
+        with SessionLocal() as session:
+            session.execute(table.update().where(table.c.source == self.source, table.c.owner == self.owner)
+                            .values(owner=None, expires_at=None))
+            session.commit()
+        self.held = False
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    self.lost = True
+                    logger.error("Lost lease on %s; another replica took it over", self.source)
+                    return
+            except Exception:
+                logger.exception("Failed to renew lease on %s", self.source)
+
+    def __enter__(self) -> "Lease":
+        if self.acquire():
+            self._heartbeat = threading.Thread(target=self._renew_loop, name=f"lease-{self.source}", daemon=True)
+            self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        try:
+            self.release()
+        except Exception:
+            logger.exception("Failed to release lease on %s; it expires in %ss", self.source, self.ttl)
+        return False
@@ -0,0 +1,73 @@
+import argparse
+import logging
+from typing import Any, Dict
+from sqlalchemy import Table, bindparam, select
+from core.db import SessionLocal, engine, ensure_schema
+from core.logging_setup import setup_logging
+from core.models import RawAsset, Asset, Payload
+from core import payloads
+from ingestion.writer import insert_ignore, PAYLOAD_KEY
+
+logger = logging.getLogger("ingestion.migrate_payloads")
+
+# (table, inline JSON column, hash column) moved into the payload store
+TARGETS = (
+    (RawAsset.__table__, "payload", "payload_hash"),
+    (Asset.__table__, "metadata", "metadata_hash"),
+)
+
+
+def _migrate_table(session, table: Table, column: str, hash_column: str, batch_size: int) -> int:
+    converted, last_id = 0, 0
+    inline = table.c[column]
+    values: Dict[str, Any] = {column: None, hash_column: bindparam("digest")}
+    if "updated_at" in table.c:
+        # not a data change; keep updated_at (the search index refreshes by it)
+        values["updated_at"] = table.c.updated_at
+    stmt = table.update().where(table.c.id == bindparam("row_id")).values(values)
+    while True:
+        rows = session.execute(
+            select(table.c.id, inline).where(table.c.id > last_id, inline.isnot(None)).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return converted
+        blobs, updates = {}, []
+        for row_id, value in rows:
+            if value is None:
+                # JSON null written by older versions; nothing to store
+                updates.append({"row_id": row_id, "digest": None})
+                continue
+            blob = payloads.row(value)
+            blobs.setdefault(blob["hash"], blob)
+            updates.append({"row_id": row_id, "digest": blob["hash"]})
+        insert_ignore(session, Payload.__table__, list(blobs.values()), PAYLOAD_KEY)
+        session.execute(stmt, updates)
+        session.commit()
+        converted += len(rows)
+        last_id = rows[-1][0]
+        logger.info("Moved %d %s.%s values into the payload store", converted, table.name, column)
+
+
+def migrate(batch_size: int = 1000) -> Dict[str, int]:
+    """Move inline raw payloads and asset metadata into the payload store.
+
+    Rows are converted in id order, ``batch_size`` per transaction, so the
+    migration can be interrupted and rerun; already converted rows are skipped.
+    Returns the number of rows converted per table.
+    """
+    from core import models
+    payloads.ensure(engine)
+    ensure_schema(models.Base.metadata, bind=engine)
+    converted = {}
+    with SessionLocal() as session:
+        for table, column, hash_column in TARGETS:
+            converted[table.name] = _migrate_table(session, table, column, hash_column, max(1, batch_size))
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline JSON payloads into the compressed payload store")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    setup_logging()
+    print(migrate(args.batch_size))
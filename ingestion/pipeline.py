@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# stages of _process_stream, in order; each one after the first consumes the previous one's queue
+PIPELINE_STAGES = ("fetch", "validate", "write")
+
+# how often a blocked producer checks whether the consumer has gone away
+POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class PipelineStats:
+    """Time each stage spent blocked on its queues and the deepest each queue got.
+
+    ``blocked[stage]`` is only ever updated from that stage's own thread.
+    """
+
+    def __init__(self):
+        self.blocked: Dict[str, float] = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        self.max_depth: Dict[str, int] = {}
+
+
+def record_key(item: Dict[str, Any]) -> Optional[str]:
+    """The source record id of a normalized item, or None when it has none."""
+    raw = item.get("raw")
+    key = item.get("id") or (raw.get("id") if isinstance(raw, dict) else None) or item.get("record_id")
+    return str(key) if key is not None else None
+
+
+def batches(entries: Iterable[Any], size: int) -> Iterator[Tuple[List[Dict[str, Any]], bool]]:
+    """Group source entries into ``(items, ends_batch)`` lists of at most ``size`` items.
+
+    Vectorized sources yield whole chunks (lists); those pass through as one
+    entry with ``ends_batch`` set so the writer flushes after them.
+    """
+    pending: List[Dict[str, Any]] = []
+    for entry in entries:
+        if isinstance(entry, list):
+            if pending:
+                yield pending, False
+                pending = []
+            yield entry, True
+            continue
+        pending.append(entry)
+        if len(pending) >= size:
+            yield pending, False
+            pending = []
+    if pending:
+        yield pending, False
+
+
+def handoff(upstream: Iterable[Any], depth: int, producer: str, consumer: str, stats: PipelineStats,
+            stop: threading.Event) -> Iterator[Any]:
+    """Iterate ``upstream`` in a daemon thread and yield its items through a queue of ``depth``.
+
+    The bounded queue is the backpressure: a producer that gets ``depth`` items
+    ahead blocks until the consumer catches up. Items arrive in order. An
+    exception raised upstream is re-raised here; setting ``stop`` (the consumer
+    gave up) makes the producer thread exit at its next hand-off.
+    """
+    handoff_queue: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    clock = time.perf_counter
+    blocked = stats.blocked
+
+    def put(entry) -> bool:
+        start = clock()
+        try:
+            while not stop.is_set():
+                try:
+                    handoff_queue.put(entry, timeout=POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            blocked[producer] += clock() - start
+
+    def produce():
+        try:
+            for item in upstream:
+                if not put((None, item)):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put((e, None))
+
+    threading.Thread(target=produce, name=f"etl-{producer}", daemon=True).start()
+    max_depth = 0
+    try:
+        while True:
+            max_depth = max(max_depth, handoff_queue.qsize())
+            start = clock()
+            entry = handoff_queue.get()
+            blocked[consumer] += clock() - start
+            if entry is _DONE:
+                return
+            error, item = entry
+            if error is not None:
+                raise error
+            yield item
+    finally:
+        stats.max_depth[producer] = max_depth
@@ -0,0 +1,181 @@
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from core.db import SessionLocal, engine
+from core.models import RawAsset, Asset, Payload, Quarantine
+from core import changes, generation, search, metrics, payloads
+from core.config import settings
+from ingestion import sharding
+from ingestion.leases import Lease
+from ingestion.validation import BatchValidator
+from ingestion.writer import (ASSET_KEY, ASSET_UPDATE, PAYLOAD_KEY, QUARANTINE_KEY, QUARANTINE_UPDATE, BatchWriter,
+                              build_asset_row, insert_ignore, insert_ignore_many, upsert)
+
+logger = logging.getLogger("ingestion.replay")
+
+REPLAY_RECORDS = metrics.REGISTRY.counter("etl_replay_records_total", "Stored payloads re-normalized by --replay",
+                                          ("source", "outcome"))
+
+OUTCOMES = ("new", "changed", "unchanged", "invalid")
+
+
+def default_normalize(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalizer for sources without one in ``SOURCE_NORMALIZERS``: id, symbol and name keys of the payload."""
+    return {"id": payload.get("id"), "symbol": payload.get("symbol"), "name": payload.get("name"), "raw": payload}
+
+
+def _normalizer(source_name: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    from ingestion.run import SOURCE_NORMALIZERS
+    return SOURCE_NORMALIZERS.get(source_name, default_normalize)
+
+
+def _replay_batch(session: Session, source_name: str, rows, normalize, validator: BatchValidator) -> Counter:
+    """Re-normalize one batch of ``(record_id, inline payload, payload hash, stored body)`` rows and upsert the assets."""
+    counts: Counter = Counter()
+    keyed, hashes = [], []
+    for record_id, inline, payload_hash, body in rows:
+        payload = payloads.decode(body) if body is not None else inline
+        keyed.append((record_id, normalize(payload)))
+        hashes.append(payload_hash)
+    results = validator.validate(keyed)
+
+    assets: Dict[str, Dict[str, Any]] = {}
+    blobs: Dict[str, Dict[str, Any]] = {}
+    rejected = []
+    for (record_id, item), payload_hash, (asset, reason) in zip(keyed, hashes, results):
+        payload = item.get("raw") or item
+        if asset is None:
+            rejected.append({"source": source_name, "record_id": record_id, "reason": reason, "payload": payload, "run_id": None})
+            continue
+        row = build_asset_row(asset, payload, payload_hash or payloads.digest(payloads.canonical(payload)))
+        if row["metadata_hash"] == payload_hash:
+            row.pop("metadata")  # the raw payload's body is already in the store
+        else:
+            BatchWriter._offload(blobs, row, "metadata", "metadata_hash")
+        assets[row["external_id"]] = row
+    counts["invalid"] = len(rejected)
+
+    stored = dict(session.execute(
+        select(Asset.external_id, Asset.content_hash).where(Asset.source == source_name, Asset.external_id.in_(list(assets)))
+    ).all())
+    new_rows, changed_rows = [], []
+    for external_id, row in assets.items():
+        if external_id not in stored:
+            new_rows.append(row)
+        elif stored[external_id] != row["content_hash"]:
+            changed_rows.append(row)
+        else:
+            counts["unchanged"] += 1
+    counts["new"], counts["changed"] = len(new_rows), len(changed_rows)
+
+    table = Asset.__table__
+    changes.stamp(session, new_rows, changed_rows)
+    insert_ignore_many(session, Payload.__table__, list(blobs.values()), PAYLOAD_KEY)
+    inserted = insert_ignore(session, table, new_rows, ASSET_KEY)
+    upsert(session, table, changed_rows, ASSET_KEY, ASSET_UPDATE)
+    upsert(session, Quarantine.__table__, rejected, QUARANTINE_KEY, QUARANTINE_UPDATE)
+    if new_rows or changed_rows:
+        generation.bump(session, inserted)
+    changes.assign(session, source_name, len(new_rows) + len(changed_rows))
+    session.commit()
+    return counts
+
+
+def _replay_range(url: Optional[str], source_name: str, low: int, high: int, batch_size: int) -> Dict[str, int]:
+    """Replay the ``raw_assets`` rows of ``source_name`` with ids in ``[low, high]``.
+
+    Rows are read in keyset batches on the primary key, each committed on its
+    own, so no read cursor stays open across writes. ``url`` opens a fresh
+    engine (worker processes); None uses the process-wide session factory.
+    """
+    session = sharding.worker_session(url) if url else SessionLocal()
+    normalize = _normalizer(source_name)
+    validator = BatchValidator(source_name)
+    counts: Counter = Counter()
+    stmt = (
+        select(RawAsset.id, RawAsset.record_id, RawAsset.inline_payload, RawAsset.payload_hash, Payload.body)
+        .outerjoin(Payload, Payload.hash == RawAsset.payload_hash)
+        .where(RawAsset.source == source_name, RawAsset.id <= high)
+        .order_by(RawAsset.id)
+        .limit(batch_size)
+    )
+    try:
+        last = low - 1
+        while True:
+            rows = session.execute(stmt.where(RawAsset.id > last)).all()
+            if not rows:
+                break
+            last = rows[-1][0]
+            counts.update(_replay_batch(session, source_name, [row[1:] for row in rows], normalize, validator))
+        return dict(counts)
+    finally:
+        session.close()
+        if url:
+            session.get_bind().dispose()
+
+
+def _ranges(low: int, high: int, parts: int) -> List[Tuple[int, int]]:
+    """Split ``[low, high]`` into at most ``parts`` disjoint, contiguous id ranges."""
+    step = max(1, -(-(high - low + 1) // parts))
+    return [(start, min(high, start + step - 1)) for start in range(low, high + 1, step)]
+
+
+def replay_source(source_name: str, workers: int = 1, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Rebuild the assets of one source from its stored raw payloads; no network calls.
+
+    With ``workers`` above 1 (and a database other processes can open) the id
+    range is split into disjoint slices replayed by that many processes.
+    """
+    batch_size = batch_size or settings.ETL_BATCH_SIZE
+    start = time.monotonic()
+    with Lease(source_name) as lease:
+        if not lease:
+            return {"status": "skipped", "error": "leased by another replica"}
+        with SessionLocal() as session:
+            low, high = session.execute(
+                select(func.min(RawAsset.id), func.max(RawAsset.id)).where(RawAsset.source == source_name)
+            ).one()
+        counts: Counter = Counter()
+        if low is not None:
+            ranges = _ranges(low, high, workers)
+            if len(ranges) > 1 and sharding.supported(engine):
+                url = engine.url.render_as_string(hide_password=False)
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as pool:
+                    futures = [pool.submit(_replay_range, url, source_name, lo, hi, batch_size) for lo, hi in ranges]
+                    for future in futures:
+                        counts.update(future.result())
+            else:
+                counts.update(_replay_range(None, source_name, low, high, batch_size))
+        # before the generation bump, so /data?q= results cached meanwhile are invalidated by it
+        if counts["new"] or counts["changed"]:
+            try:
+                search.refresh(engine)
+            except Exception:
+                logger.exception("Search index refresh failed after replaying %s", source_name)
+        with SessionLocal() as session:
+            generation.refresh(session)
+            generation.touch(session, generation.ETL_RUNS)
+            session.commit()
+    for outcome in OUTCOMES:
+        REPLAY_RECORDS.inc(counts[outcome], source=source_name, outcome=outcome)
+    outcome = {"status": "success", **{k: counts[k] for k in OUTCOMES}, "seconds": round(time.monotonic() - start, 3)}
+    logger.info("Replayed %s", source_name, extra={"source": source_name, **outcome})
+    return outcome
+
+
+def replay(sources: Optional[Iterable[str]] = None, workers: Optional[int] = None,
+           batch_size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """Replay ``sources`` (default: every source with stored payloads) and return the outcome per source."""
+    from ingestion.run import _ensure_tables
+    _ensure_tables()
+    if sources is None:
+        with SessionLocal() as session:
+            sources = session.execute(select(RawAsset.source).distinct().order_by(RawAsset.source)).scalars().all()
+    workers = workers or settings.ETL_SHARDS
+    return {name: replay_source(name, workers=workers, batch_size=batch_size) for name in sources}
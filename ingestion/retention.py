@@ -0,0 +1,177 @@
+import argparse
+import logging
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import select, delete, exists, update
+from core.db import SessionLocal
+from core.logging_setup import setup_logging
+from core.models import ETLRun, ETLRunDaily, ETLShardProgress, Payload, RawAsset, Asset
+from core import metrics
+from core.config import settings
+from ingestion.leases import Lease
+
+logger = logging.getLogger("ingestion.retention")
+
+RETENTION_DELETED = metrics.REGISTRY.counter("retention_rows_deleted_total", "Rows reclaimed by retention", ("table",))
+RETENTION_SECONDS = metrics.REGISTRY.histogram("retention_duration_seconds", "Retention pass wall time")
+
+# lease name that keeps retention passes from overlapping across replicas
+LEASE_NAME = "retention"
+
+
+def _utc_day(value: datetime):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _fold(session, rows) -> None:
+    """Add finished runs ``rows`` into their ``etl_run_daily`` buckets."""
+    buckets: Dict[tuple, ETLRunDaily] = {}
+    for row in rows:
+        finished = row.run_finished_at or row.run_started_at
+        key = (row.source, _utc_day(finished))
+        daily = buckets.get(key)
+        if daily is None:
+            daily = buckets[key] = session.get(ETLRunDaily, key) or ETLRunDaily(
+                source=key[0], day=key[1], runs=0, success_runs=0, failed_runs=0, records_processed=0, records_new=0,
+                records_unchanged=0, records_changed=0, records_invalid=0, duration_seconds=0.0)
+            session.add(daily)
+        daily.runs += 1
+        daily.success_runs += row.status == "success"
+        daily.failed_runs += row.status == "failed"
+        daily.records_processed += row.records_processed or 0
+        daily.records_new += row.records_new or 0
+        daily.records_unchanged += row.records_unchanged or 0
+        daily.records_changed += row.records_changed or 0
+        daily.records_invalid += row.records_invalid or 0
+        if row.run_finished_at and row.run_started_at:
+            daily.duration_seconds += max(0.0, (row.run_finished_at - row.run_started_at).total_seconds())
+
+
+def compact_runs(source: str, keep: int, batch_size: int) -> Dict[str, int]:
+    """Fold the finished runs of ``source`` older than its newest ``keep`` into daily summaries and delete them.
+
+    Each batch of ``batch_size`` runs is summarized, deleted (with its shard
+    progress rows) and committed in one short transaction; runs still in
+    ``running`` are left alone.
+    """
+    deleted = {"etl_runs": 0, "etl_shard_progress": 0}
+    columns = (ETLRun.id, ETLRun.source, ETLRun.status, ETLRun.run_started_at, ETLRun.run_finished_at,
+               ETLRun.records_processed, ETLRun.records_new, ETLRun.records_unchanged, ETLRun.records_changed,
+               ETLRun.records_invalid)
+    with SessionLocal() as session:
+        cutoff = session.execute(
+            select(ETLRun.id).where(ETLRun.source == source).order_by(ETLRun.id.desc()).offset(keep).limit(1)
+        ).scalar()
+        if cutoff is None:
+            return deleted
+        while True:
+            rows = session.execute(
+                select(*columns).where(ETLRun.source == source, ETLRun.id <= cutoff, ETLRun.status != "running")
+                .order_by(ETLRun.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return deleted
+            ids = [row.id for row in rows]
+            _fold(session, rows)
+            deleted["etl_shard_progress"] += session.execute(
+                delete(ETLShardProgress).where(ETLShardProgress.run_id.in_(ids))).rowcount
+            deleted["etl_runs"] += session.execute(delete(ETLRun).where(ETLRun.id.in_(ids))).rowcount
+            session.commit()
+
+
+def prune_payloads(older_than: datetime, batch_size: int, now: Optional[datetime] = None) -> int:
+    """Delete payload bodies that no raw row or asset has referenced since before ``older_than``.
+
+    Bodies are superseded when a record changes: its row then points at the new
+    hash. Each pass stamps newly unreferenced bodies with ``unreferenced_at``
+    (``now``), clears the stamp on bodies referenced again, and deletes those
+    stamped before ``older_than``, so a body is kept for the whole window after
+    it was superseded however old it is. Bodies are walked in hash order,
+    ``batch_size`` per transaction, and the reference check is part of each
+    statement. Callers must keep writers away meanwhile (``run`` holds every
+    source's lease), since a writer may point a row back at an existing body
+    without rewriting it.
+    """
+    now = now or datetime.now(timezone.utc)
+    deleted, last = 0, ""
+    unreferenced = (~exists().where(RawAsset.payload_hash == Payload.hash)
+                    & ~exists().where(Asset.metadata_hash == Payload.hash))
+    with SessionLocal() as session:
+        while True:
+            hashes = session.execute(
+                select(Payload.hash).where(Payload.hash > last).order_by(Payload.hash).limit(batch_size)
+            ).scalars().all()
+            if not hashes:
+                return deleted
+            last = hashes[-1]
+            batch = Payload.hash.in_(hashes)
+            for stmt in (
+                update(Payload).where(batch, Payload.unreferenced_at.isnot(None), ~unreferenced).values(unreferenced_at=None),
+                update(Payload).where(batch, Payload.unreferenced_at.is_(None), unreferenced).values(unreferenced_at=now),
+            ):
+                session.execute(stmt.execution_options(synchronize_session=False))
+            deleted += session.execute(
+                delete(Payload).where(batch, Payload.unreferenced_at < older_than, unreferenced)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+
+
+def _sources() -> List[str]:
+    from ingestion.run import SOURCE_CLASSES
+    with SessionLocal() as session:
+        stored = session.execute(select(ETLRun.source).distinct()).scalars().all()
+        stored += session.execute(select(RawAsset.source).distinct()).scalars().all()
+    return sorted(set(SOURCE_CLASSES) | set(stored))
+
+
+def run(keep_runs: Optional[int] = None, payload_days: Optional[float] = None,
+        batch_size: Optional[int] = None) -> Dict[str, int]:
+    """One retention pass over every source; returns the rows deleted per table.
+
+    Payload pruning needs every source's lease and is skipped (until the next
+    pass) when any source is being ingested.
+    """
+    from ingestion.run import _ensure_tables
+    keep_runs = settings.RETENTION_KEEP_RUNS if keep_runs is None else keep_runs
+    payload_days = settings.RETENTION_PAYLOAD_DAYS if payload_days is None else payload_days
+    batch_size = max(1, batch_size or settings.RETENTION_BATCH_SIZE)
+    start = time.monotonic()
+    _ensure_tables()
+    deleted = {"etl_runs": 0, "etl_shard_progress": 0, "payloads": 0}
+    with Lease(LEASE_NAME) as lease:
+        if not lease:
+            logger.info("Retention is already running on another replica")
+            return deleted
+        sources = _sources()
+        for source in sources:
+            for table, n in compact_runs(source, max(0, keep_runs), batch_size).items():
+                deleted[table] += n
+        with ExitStack() as stack:
+            leases = [stack.enter_context(Lease(name)) for name in sources]
+            if all(leases):
+                now = datetime.now(timezone.utc)
+                deleted["payloads"] = prune_payloads(now - timedelta(days=payload_days), batch_size, now)
+            else:
+                logger.info("Skipping payload pruning: a source is being ingested")
+    for table, n in deleted.items():
+        RETENTION_DELETED.inc(n, table=table)
+    RETENTION_SECONDS.observe(time.monotonic() - start)
+    # its own textfile: the ETL rewrites METRICS_ETL_FILE with etl_* metrics only
+    metrics.write_textfile("retention_", name="retention")
+    logger.info("Retention pass finished", extra=deleted)
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact etl_runs history and prune superseded payload bodies")
+    parser.add_argument("--keep-runs", type=int, help="finished runs kept per source (default RETENTION_KEEP_RUNS)")
+    parser.add_argument("--payload-days", type=float, help="days a payload body stays unreferenced before it is deleted")
+    parser.add_argument("--batch-size", type=int, help="rows deleted per transaction")
+    args = parser.parse_args()
+    setup_logging()
+    print(run(args.keep_runs, args.payload_days, args.batch_size))
@@ -1,37 +1,155 @@
 import os
+import time
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, Dict, Any
 from sqlalchemy import select
-from core.db import SessionLocal, engine
-from core.models import RawAsset, Asset, Checkpoint, ETLRun
+from core.db import SessionLocal, engine, ensure_schema
+from core.models import Checkpoint, ETLRun
+from core import changes, generation, search, etl_stats, metrics, payloads
+from ingestion.writer import BatchWriter
+from ingestion.idempotency import IdempotencyIndex
+from ingestion.validation import BatchValidator
+from ingestion.leases import Lease
+from ingestion import sharding
+from ingestion.sharding import ShardedRun
+from ingestion.pipeline import PIPELINE_STAGES, PipelineStats, batches, handoff, record_key
 from ingestion.sources.coinpaprika import CoinPaprikaSource
 from ingestion.sources.coingecko import CoinGeckoSource
 from ingestion.sources.csv_source import CSVSource
-from schemas.asset import AssetSchema
 from core.config import settings
 
 logger = logging.getLogger("ingestion")
 
+# source name -> zero-arg factory, in run order. The built-in entries look the
+# class up at call time so the module-level names can be swapped (tests).
 SOURCE_CLASSES = {
-    "coinpaprika": CoinPaprikaSource,
-    "coingecko": CoinGeckoSource,
-    "csv": CSVSource,
+    "coinpaprika": lambda: CoinPaprikaSource(),
+    "coingecko": lambda: CoinGeckoSource(),
+    "csv": lambda: CSVSource(),
 }
 
+# source name -> function turning a stored raw payload back into a normalized
+# item, used by ``--replay``; sources without an entry use replay.default_normalize
+SOURCE_NORMALIZERS = {
+    "coinpaprika": CoinPaprikaSource.normalize,
+    "coingecko": CoinGeckoSource.normalize,
+    "csv": CSVSource.normalize,
+}
+
+
+STAGES = ("fetch", "validate", "raw_write", "asset_upsert", "checkpoint")
+
+ETL_STAGE_SECONDS = metrics.REGISTRY.histogram("etl_stage_seconds", "Seconds spent per ETL stage in one run", ("source", "stage"))
+ETL_RUN_SECONDS = metrics.REGISTRY.histogram("etl_run_duration_seconds", "ETL run wall time", ("source", "status"))
+ETL_RECORDS = metrics.REGISTRY.counter("etl_records_processed_total", "Valid records processed", ("source",))
+ETL_RECORDS_PER_SECOND = metrics.REGISTRY.gauge("etl_records_per_second", "Throughput of the last run", ("source",))
+ETL_STAGE_BLOCKED = metrics.REGISTRY.histogram("etl_stage_blocked_seconds", "Seconds a pipeline stage waited on its queues in one run", ("source", "stage"))
+ETL_QUEUE_DEPTH = metrics.REGISTRY.gauge("etl_queue_max_depth", "Deepest a pipeline queue got in the last run, in batches", ("source", "queue"))
+
+
+class ETLRunError(RuntimeError):
+    """Raised by a concurrent ``run_all`` when one or more sources failed."""
+
+    def __init__(self, message: str, outcomes: Dict[str, Dict[str, Any]]):
+        super().__init__(message)
+        self.outcomes = outcomes
+
 
 def _ensure_tables():
     from core import models
-    models.Base.metadata.create_all(bind=engine)
+    payloads.ensure(engine)
+    ensure_schema(models.Base.metadata, bind=engine)
+    with SessionLocal() as session:
+        generation.ensure(session)
+        generation.touch(session, generation.ETL_RUNS)
+        etl_stats.backfill(session)
+        changes.ensure(session)
+        changes.backfill(session)
+        session.commit()
+    search.ensure(engine)
+
+
+def _timed(items: Iterable[Any], timings: Dict[str, float], stage: str) -> Iterable[Any]:
+    """Iterate ``items``, adding the time spent producing each one to ``timings[stage]``."""
+    clock = time.perf_counter
+    it = iter(items)
+    while True:
+        start = clock()
+        try:
+            entry = next(it)
+        except StopIteration:
+            timings[stage] += clock() - start
+            return
+        timings[stage] += clock() - start
+        yield entry
+
+
+def _observe_run(source_name: str, status: str, timings: Dict[str, float], processed: int, seconds: float,
+                 pipeline: PipelineStats):
+    for stage in STAGES:
+        ETL_STAGE_SECONDS.observe(timings[stage], source=source_name, stage=stage)
+    if pipeline.max_depth:
+        for stage in PIPELINE_STAGES:
+            ETL_STAGE_BLOCKED.observe(pipeline.blocked[stage], source=source_name, stage=stage)
+        for name, depth in pipeline.max_depth.items():
+            ETL_QUEUE_DEPTH.set(depth, source=source_name, queue=name)
+    ETL_RUN_SECONDS.observe(seconds, source=source_name, status=status)
+    ETL_RECORDS.inc(processed, source=source_name)
+    if seconds > 0:
+        ETL_RECORDS_PER_SECOND.set(processed / seconds, source=source_name)
+    metrics.write_textfile("etl_")
+
 
+def _process_stream(source_name: str, items: Iterable[Dict[str, Any]], fail_after: int | None = None, batch_size: int | None = None,
+                    lease: Lease | None = None):
+    """Process a stream of items from a single source. Uses its own session.
 
-def _process_stream(source_name: str, items: Iterable[Dict[str, Any]], fail_after: int | None = None):
-    """Process a stream of items from a single source. Uses its own session."""
+    Records are buffered and written in batches of ``batch_size`` (default
+    ``settings.ETL_BATCH_SIZE``); each batch lands in a single transaction
+    together with its checkpoint and run counter update. Stored keys and
+    content hashes are preloaded once into an ``IdempotencyIndex``; records are
+    classified as new, unchanged or changed, unchanged ones are not written,
+    and the per-category counts are kept on the ``ETLRun``.
+
+    Sources that prepare records in vectorized chunks (``CSVSource`` in
+    chunked mode) yield lists of items instead; each chunk ends a batch.
+
+    Fetching (iterating ``items``), validation and writing run as a pipeline
+    of three threads joined by queues holding at most
+    ``settings.ETL_PIPELINE_DEPTH`` batches each, so downloads and parsing
+    continue while a batch commits and a slow stage holds back the ones
+    before it. Only the write stage (the calling thread) uses the session.
+    A depth of 0 runs all three stages in the calling thread.
+
+    With ``settings.ETL_SHARDS`` above 1, validation and writes move to that
+    many worker processes instead (see ``ingestion.sharding.ShardedRun``);
+    this process only reads the source and advances the checkpoint.
+
+    Time per stage, time each stage spent blocked on a queue and the deepest
+    each queue got are summed locally and published to ``core.metrics`` once
+    the run ends.
+
+    With ``lease`` (the source's ``Lease``) every commit is fenced on it: once
+    another replica has taken the lease over the run fails with ``LeaseLost``
+    and nothing more is written.
+    """
     session = SessionLocal()
     processed = 0
     run = None
+    writer = None
+    started = time.monotonic()
+    timings = dict.fromkeys(STAGES, 0.0)
+    pipeline = PipelineStats()
+    stop = threading.Event()
+    clock = time.perf_counter
     try:
         run = ETLRun(source=source_name, status="running")
         session.add(run)
+        etl_stats.run_started(session, run)
+        generation.touch(session, generation.ETL_RUNS)
         session.commit()
         
         checkpoint = session.execute(select(Checkpoint).where(Checkpoint.source==source_name)).scalar_one_or_none()
@@ -40,62 +158,94 @@ def _process_stream(source_name: str, items: Iterable[Dict[str, Any]], fail_afte
             session.add(checkpoint)
             session.commit()
 
-        last_seen = checkpoint.last_record_id
-        for item in items:
-            record_id = str(item.get("id") or item.get("raw", {}).get("id") or item.get("record_id"))
-            # incremental: if we've already seen this record, skip it (resume after checkpoint)
-            if last_seen and record_id == last_seen:
-                logger.info("Reached checkpoint record for source %s at %s; skipping to resume", source_name, record_id)
-                continue
-
-            # write raw (idempotent)
-            exists = session.execute(select(RawAsset).where(RawAsset.source==source_name, RawAsset.record_id==record_id)).scalar_one_or_none()
-            if not exists:
-                raw = RawAsset(source=source_name, record_id=record_id, payload=item.get("raw") or item)
-                session.add(raw)
-                session.commit()
-
-            # validate and normalize
+        shards = settings.ETL_SHARDS
+        if shards > 1 and not sharding.supported(session.get_bind()):
+            logger.warning("ETL_SHARDS needs a database other processes can open; running %s unsharded", source_name)
+            shards = 1
+        if shards > 1:
+            sharded = ShardedRun(session, source_name, run, checkpoint, shards, batch_size or settings.ETL_BATCH_SIZE,
+                                 fail_after=fail_after, depth=settings.ETL_PIPELINE_DEPTH, lease=lease)
             try:
-                asset_in = AssetSchema(external_id=record_id, symbol=item.get("symbol"), name=item.get("name"), source=source_name, metadata=item.get("raw"))
-            except Exception as e:
-                logger.exception("Validation failed for record %s: %s", record_id, e)
-                continue
-
-            # upsert asset idempotently
-            existing_asset = session.execute(select(Asset).where(Asset.external_id==asset_in.external_id, Asset.source==asset_in.source)).scalar_one_or_none()
-            if not existing_asset:
-                new_asset = Asset(external_id=asset_in.external_id, symbol=asset_in.symbol, name=asset_in.name, source=asset_in.source, run_metadata=asset_in.metadata)
-                session.add(new_asset)
-                session.commit()
+                processed = sharded.run_stream(_timed(items, timings, "fetch"))
+            finally:
+                for stage, seconds in sharded.timings.items():
+                    timings[stage] += seconds
+        else:
+            index = None
+            if settings.ETL_IDEMPOTENCY_MEMORY_MB > 0:
+                index = IdempotencyIndex.load(session, source_name, settings.ETL_IDEMPOTENCY_MEMORY_MB * 1024 * 1024)
+            writer = BatchWriter(session, source_name, run, checkpoint, batch_size=batch_size or settings.ETL_BATCH_SIZE, index=index,
+                                 lease=lease)
+            validator = BatchValidator(source_name)
 
-            # update checkpoint transactionally
-            checkpoint.last_record_id = record_id
-            session.add(checkpoint)
-            session.commit()
+            def validated(chunks):
+                for records, ends_batch in chunks:
+                    validate_start = clock()
+                    # every record is classified, the checkpoint record too: unchanged ones cost no writes,
+                    # and resumable sources already seek past the checkpoint themselves
+                    keyed = [(record_key(item), item) for item in records]
+                    results = validator.validate(keyed)
+                    timings["validate"] += clock() - validate_start
+                    yield keyed, results, ends_batch
 
-            processed += 1
-            run.records_processed = processed
-            session.add(run)
-            session.commit()
+            depth = settings.ETL_PIPELINE_DEPTH
+            stages = batches(_timed(items, timings, "fetch"), writer.batch_size)
+            if depth > 0:
+                stages = handoff(stages, depth, "fetch", "validate", pipeline, stop)
+            stages = validated(stages)
+            if depth > 0:
+                stages = handoff(stages, depth, "validate", "write", pipeline, stop)
 
-            # failure injection (checkpoint already committed above, safe to fail)
-            if fail_after and processed >= fail_after:
-                run.injected_failure = True
-                run.status = "failed"
-                session.add(run)
-                session.commit()
-                raise RuntimeError(f"Injected failure after {processed} records")
+            # write stage: the only one touching the session, so checkpoints advance only past flushed batches
+            invalid = Counter()
+            for keyed, results, ends_batch in stages:
+                for (record_id, item), (asset_in, reason) in zip(keyed, results):
+                    if not writer.add_validated(record_id, item, asset_in, reason):
+                        invalid[reason] += 1
+                        continue
+                    processed += 1
 
+                    # failure injection: flush first so the checkpoint covers everything processed so far
+                    if fail_after and processed >= fail_after:
+                        writer.flush()
+                        run.injected_failure = True
+                        run.status = "failed"
+                        session.add(run)
+                        generation.touch(session, generation.ETL_RUNS)
+                        session.commit()
+                        raise RuntimeError(f"Injected failure after {processed} records")
+                if invalid:
+                    run.records_invalid = sum(invalid.values())
+                    run.validation_errors = dict(invalid)
+                if ends_batch:
+                    writer.flush()
+
+            writer.flush()
+        # before the final generation bump, so /data?q= results cached meanwhile are invalidated by it
+        try:
+            if run.records_new or run.records_changed:
+                search.refresh(engine)
+        except Exception:
+            logger.exception("Search index refresh failed for %s; /data?q= falls back to older results", source_name)
         run.status = "success"
         session.add(run)
+        etl_stats.run_finished(session, run, time.monotonic() - started)
+        # recount the maintained asset total once per run; readers refresh filtered totals
+        generation.refresh(session)
+        generation.touch(session, generation.ETL_RUNS)
+        if lease is not None:
+            lease.fence(session)
         session.commit()
+        return writer.processed if writer is not None else processed
     except Exception as e:
         try:
+            session.rollback()
             if run:
                 run.status = "failed"
                 run.error = str(e)
                 session.add(run)
+                etl_stats.run_finished(session, run, time.monotonic() - started)
+                generation.touch(session, generation.ETL_RUNS)
                 session.commit()
         except Exception as commit_err:
             logger.exception("Failed to commit error state: %s", commit_err)
@@ -103,19 +253,139 @@ def _process_stream(source_name: str, items: Iterable[Dict[str, Any]], fail_afte
         logger.exception("ETL run failed for %s", source_name)
         raise
     finally:
+        # upstream stage threads exit at their next hand-off
+        stop.set()
+        try:
+            if writer is not None:
+                timings.update(writer.timings)
+            _observe_run(source_name, run.status if run is not None else "failed", timings,
+                         writer.processed if writer is not None else processed, time.monotonic() - started, pipeline)
+        except Exception:
+            logger.exception("Failed to record metrics for %s", source_name)
         session.close()
 
 
-def run_all():
+def _load_position(source_name: str) -> Dict[str, Any] | None:
+    with SessionLocal() as session:
+        return session.execute(select(Checkpoint.position).where(Checkpoint.source == source_name)).scalar_one_or_none()
+
+
+def _open_stream(source_name: str, src) -> Iterable[Dict[str, Any]]:
+    """Items of ``src``, resumed from the checkpointed position when the source supports it."""
+    if getattr(src, "supports_resume", False):
+        return src.list_assets(resume=_load_position(source_name))
+    return src.list_assets()
+
+
+SKIPPED = {"status": "skipped", "records_processed": None, "error": "leased by another replica"}
+
+
+def run_retention():
+    """One ``ingestion.retention`` pass after ETL work; failures are logged, never raised."""
+    from ingestion import retention
+    try:
+        retention.run()
+    except Exception:
+        logger.exception("Retention pass failed")
+
+
+def _ingest(name: str, src, lease: Lease, fail_after: int | None = None) -> int:
+    """``_process_stream`` over ``src``, then ``src.finish(success)`` when the source has one.
+
+    Sources use ``finish`` to keep fetch state (HTTP cache validators) only
+    once the records read with it are committed.
+    """
+    finish = getattr(src, "finish", None)
+    try:
+        processed = _process_stream(name, _open_stream(name, src), fail_after=fail_after, lease=lease)
+    except BaseException:
+        if finish is not None:
+            finish(False)
+        raise
+    if finish is not None:
+        finish(True)
+    return processed
+
+
+def _run_source(name: str, fail_after: int | None = None, src=None) -> Dict[str, Any]:
+    """Run one source end to end under its lease and describe the outcome. Never raises.
+
+    ``src`` reuses an existing source object (the daemon keeps them warm);
+    otherwise one is built from ``SOURCE_CLASSES``.
+    """
+    logger.info("Starting source %s", name)
+    start = time.monotonic()
+    try:
+        with Lease(name) as lease:
+            if not lease:
+                return dict(SKIPPED, seconds=0.0)
+            src = src if src is not None else SOURCE_CLASSES[name]()
+            processed = _ingest(name, src, lease, fail_after)
+        outcome = {"status": "success", "records_processed": processed, "error": None}
+    except Exception as e:
+        outcome = {"status": "failed", "records_processed": None, "error": str(e)}
+    outcome["seconds"] = round(time.monotonic() - start, 3)
+    logger.info("Finished source %s", name, extra={"source": name, **outcome})
+    return outcome
+
+
+def run_all(max_workers: int | None = None) -> Dict[str, Dict[str, Any]]:
+    """Run every source in ``SOURCE_CLASSES`` and return the outcome per source.
+
+    With ``max_workers`` (default ``settings.ETL_MAX_WORKERS``) above 1 the
+    sources run concurrently, each with its own session and ``ETLRun`` row; a
+    failing source does not stop the others, and an ``ETLRunError`` carrying
+    every outcome is raised once all of them have finished. Sequentially, the
+    first failure aborts the run as before. With ``RETENTION_AFTER_ETL`` a
+    retention pass follows the sources.
+
+    Each source runs under its ``Lease``; one leased by another replica is
+    skipped and reported with status ``skipped``.
+    """
     _ensure_tables()
     fail_after_env = settings.ETL_FAIL_AFTER_N_RECORDS
     fail_after = int(fail_after_env) if fail_after_env else None
-    # sources in order
-    sources = [("coinpaprika", CoinPaprikaSource()), ("coingecko", CoinGeckoSource()), ("csv", CSVSource())]
-    for name, src in sources:
-        logger.info("Starting source %s", name)
-        _process_stream(name, src.list_assets(), fail_after=fail_after)
+    workers = min(max_workers or settings.ETL_MAX_WORKERS, len(SOURCE_CLASSES))
+
+    if workers <= 1:
+        outcomes = {}
+        for name in SOURCE_CLASSES:
+            logger.info("Starting source %s", name)
+            with Lease(name) as lease:
+                if not lease:
+                    outcomes[name] = dict(SKIPPED)
+                    continue
+                processed = _ingest(name, SOURCE_CLASSES[name](), lease, fail_after)
+            outcomes[name] = {"status": "success", "records_processed": processed, "error": None}
+        if settings.RETENTION_AFTER_ETL:
+            run_retention()
+        return outcomes
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etl") as pool:
+        futures = {name: pool.submit(_run_source, name, fail_after) for name in SOURCE_CLASSES}
+        outcomes = {name: fut.result() for name, fut in futures.items()}
+    if settings.RETENTION_AFTER_ETL:
+        run_retention()
+
+    failed = sorted(name for name, o in outcomes.items() if o["status"] == "failed")
+    if failed:
+        raise ETLRunError(f"ETL failed for sources: {', '.join(failed)}", outcomes)
+    return outcomes
 
 
 if __name__ == "__main__":
-    run_all()
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the ETL for every source")
+    parser.add_argument("--daemon", action="store_true", help="stay resident and run each source on its schedule")
+    parser.add_argument("--replay", action="store_true", help="re-normalize stored raw payloads instead of fetching")
+    parser.add_argument("--source", action="append", help="with --replay: only this source (repeatable)")
+    parser.add_argument("--workers", type=int, help="with --replay: worker processes per source (default ETL_SHARDS)")
+    args = parser.parse_args()
+    if args.replay:
+        from ingestion.replay import replay
+        replay(args.source, workers=args.workers)
+    elif args.daemon:
+        from ingestion.scheduler import Scheduler
+        Scheduler().serve()
+    else:
+        run_all()
@@ -0,0 +1,111 @@
+import logging
+import random
+import signal
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from core.config import settings
+from ingestion import run as etl
+
+logger = logging.getLogger("ingestion.scheduler")
+
+# upper bound on how long the loop sleeps, so finished runs are rescheduled promptly
+POLL_SECONDS = 1.0
+
+
+class Scheduler:
+    """Resident ETL loop: runs each source every ``interval`` seconds plus up to ``jitter``.
+
+    Tables are ensured once at startup and source objects are built once and
+    reused, so HTTP sessions, their caches and pooled DB connections stay warm
+    between runs. Every run goes through ``ingestion.run._run_source`` and so
+    holds the source's lease; a source that another replica is running is
+    skipped and retried on its next slot. A source never overlaps itself in
+    this process; up to ``max_workers`` different sources run at once.
+
+    With ``RETENTION_AFTER_ETL`` a retention pass is also started every
+    ``retention_interval`` seconds, in the same pool.
+    """
+
+    def __init__(self, factories: Optional[Dict[str, Callable[[], Any]]] = None,
+                 intervals: Optional[Dict[str, float]] = None, default_interval: Optional[float] = None,
+                 jitter: Optional[float] = None, max_workers: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic, retention_interval: Optional[float] = None):
+        self.factories = factories if factories is not None else etl.SOURCE_CLASSES
+        self.intervals = intervals if intervals is not None else settings.ETL_SCHEDULE_INTERVALS
+        self.default_interval = settings.ETL_SCHEDULE_INTERVAL_SECONDS if default_interval is None else default_interval
+        self.jitter = settings.ETL_SCHEDULE_JITTER_SECONDS if jitter is None else jitter
+        self.max_workers = max(1, max_workers or settings.ETL_MAX_WORKERS)
+        self.clock = clock
+        if retention_interval is None:
+            retention_interval = settings.RETENTION_INTERVAL_SECONDS if settings.RETENTION_AFTER_ETL else 0
+        self.retention_interval = retention_interval
+        self.last_outcomes: Dict[str, Dict[str, Any]] = {}
+        self._sources: Dict[str, Any] = {}
+        self._running: Dict[str, Future] = {}
+        # first runs are spread over the jitter window
+        now = clock()
+        self._next_due = {name: now + self._jitter() for name in self.factories}
+        self._retention: Optional[Future] = None
+        self._retention_due = now + self.retention_interval
+
+    def _jitter(self) -> float:
+        return random.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+
+    def interval(self, name: str) -> float:
+        return self.intervals.get(name, self.default_interval)
+
+    def source(self, name: str):
+        """The long-lived source object for ``name``, built on first use."""
+        src = self._sources.get(name)
+        if src is None:
+            src = self._sources[name] = self.factories[name]()
+        return src
+
+    def run_source(self, name: str) -> Dict[str, Any]:
+        fail_after = settings.ETL_FAIL_AFTER_N_RECORDS
+        try:
+            src = self.source(name)
+        except Exception as e:
+            logger.exception("Could not create source %s", name)
+            return {"status": "failed", "records_processed": None, "error": str(e), "seconds": 0.0}
+        return etl._run_source(name, int(fail_after) if fail_after else None, src=src)
+
+    def poll(self, pool: ThreadPoolExecutor) -> float:
+        """Reschedule finished runs, start due sources, and return seconds until the next one is due."""
+        now = self.clock()
+        for name, future in list(self._running.items()):
+            if not future.done():
+                continue
+            del self._running[name]
+            self.last_outcomes[name] = outcome = future.result()
+            self._next_due[name] = now + self.interval(name) + self._jitter()
+            logger.info("Next run of %s in %.0fs", name, self._next_due[name] - now, extra={"source": name, **outcome})
+        for name, due in self._next_due.items():
+            if name not in self._running and due <= now:
+                self._running[name] = pool.submit(self.run_source, name)
+        waiting = [due for name, due in self._next_due.items() if name not in self._running]
+        if self.retention_interval > 0:
+            if self._retention is not None and self._retention.done():
+                self._retention = None
+                self._retention_due = now + self.retention_interval
+            if self._retention is None:
+                if self._retention_due <= now:
+                    self._retention = pool.submit(etl.run_retention)
+                else:
+                    waiting.append(self._retention_due)
+        return max(0.0, min(waiting) - now) if waiting else POLL_SECONDS
+
+    def serve(self, stop: Optional[threading.Event] = None):
+        """Run until ``stop`` is set (or SIGTERM / SIGINT in the main thread); in-flight runs finish first."""
+        stop = stop or threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: stop.set())
+        etl._ensure_tables()
+        logger.info("ETL scheduler started for %s", ", ".join(self.factories))
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="etl") as pool:
+            while not stop.is_set():
+                stop.wait(min(self.poll(pool), POLL_SECONDS))
+        logger.info("ETL scheduler stopped")
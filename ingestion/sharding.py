@@ -0,0 +1,260 @@
+import logging
+import multiprocessing
+import queue
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from core.db import pool_options
+from core.models import Checkpoint, ETLRun, ETLShardProgress
+from core import generation
+from core.config import settings
+from ingestion.idempotency import IdempotencyIndex, shard_of
+from ingestion.leases import Lease
+from ingestion.pipeline import batches, record_key
+from ingestion.validation import BatchValidator
+from ingestion.writer import BatchWriter, NEW, UNCHANGED, CHANGED
+
+logger = logging.getLogger("ingestion.sharding")
+
+# how long a worker waits for SQLite's write lock before failing the run
+SQLITE_BUSY_TIMEOUT_SECONDS = 120
+# how often the coordinator checks that its workers are still alive while it waits
+POLL_SECONDS = 0.5
+
+# worker -> coordinator message kinds besides a round number
+_DONE, _ERROR = "done", "error"
+
+
+def supported(bind: Engine) -> bool:
+    """Whether worker processes can open their own connections to ``bind``'s database."""
+    url = bind.url
+    return not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"))
+
+
+def worker_session(url: str) -> Session:
+    """Session on a fresh engine for ``url``, for use in a worker process; close its bind when done."""
+    options = pool_options(url)
+    if make_url(url).get_backend_name() == "sqlite":
+        # SQLite has one writer at a time; workers queue on the lock instead of failing
+        options["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_SECONDS}
+    engine = create_engine(url, future=True, **options)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)()
+
+
+def _worker(url: str, source_name: str, run_id: int, shard: int, shards: int, batch_size: int, budget_bytes: int,
+            inbox, outbox, lease_owner: Optional[str] = None):
+    """Validate and write the records of one shard, acknowledging each round once it is durable.
+
+    With ``lease_owner`` (the coordinator's lease token) every flush is fenced
+    on the source lease, so a worker stops writing once it has been taken over.
+    """
+    session = worker_session(url)
+    clock = time.perf_counter
+    timings = {"validate": 0.0}
+    try:
+        index = None
+        if budget_bytes > 0:
+            index = IdempotencyIndex.load(session, source_name, budget_bytes, shard=(shard, shards))
+        lease = Lease(source_name, owner=lease_owner, shared=True) if lease_owner else None
+        writer = BatchWriter(session, source_name, None, None, batch_size=batch_size, index=index, run_id=run_id,
+                             lease=lease)
+        validator = BatchValidator(source_name)
+        progress = ETLShardProgress(run_id=run_id, shard=shard, records_processed=0, records_new=0,
+                                    records_unchanged=0, records_changed=0, records_invalid=0)
+        session.add(progress)
+        session.commit()
+        invalid: Counter = Counter()
+        while True:
+            message = inbox.get()
+            if message is None:
+                break
+            round_no, records = message
+            last_valid = -1
+            if records:
+                start = clock()
+                results = validator.validate([(record_id, item) for _, record_id, item in records])
+                timings["validate"] += clock() - start
+                for (position, record_id, item), (asset, reason) in zip(records, results):
+                    if writer.add_validated(record_id, item, asset, reason):
+                        last_valid = position
+                    else:
+                        invalid[reason] += 1
+                writer.flush()
+                # after the data commit: progress may lag what is durable, never lead it
+                progress.round = round_no
+                progress.records_processed = writer.processed
+                progress.records_new = writer.counts[NEW]
+                progress.records_unchanged = writer.counts[UNCHANGED]
+                progress.records_changed = writer.counts[CHANGED]
+                progress.records_invalid = sum(invalid.values())
+                session.commit()
+            outbox.put((shard, round_no, last_valid, {"processed": writer.processed, "invalid": dict(invalid), **writer.counts}))
+        timings.update(writer.timings)
+        outbox.put((shard, _DONE, timings))
+    except BaseException as e:
+        logger.exception("Shard %d of %s failed", shard, source_name)
+        outbox.put((shard, _ERROR, f"{type(e).__name__}: {e}"))
+    finally:
+        session.close()
+        session.get_bind().dispose()
+
+
+class ShardedRun:
+    """Runs one source across ``shards`` worker processes, partitioned by ``shard_of(record_id)``.
+
+    The calling process reads the source and deals each round of
+    ``batch_size * shards`` items out to the workers over bounded queues. Each worker owns its own engine and session, validates its
+    share and writes it (disjoint keys, so workers never contend on rows),
+    recording its progress in ``etl_shard_progress``. A round is durable once
+    every shard has acknowledged it; only then does the coordinator move the
+    checkpoint and the ``ETLRun`` counters past it, in round order.
+
+    On SQLite the workers still validate in parallel but their writes take
+    turns on the database lock.
+    """
+
+    def __init__(self, session: Session, source_name: str, run: ETLRun, checkpoint: Checkpoint, shards: int,
+                 batch_size: int, fail_after: Optional[int] = None, depth: int = 2, lease=None):
+        self.session = session
+        self.source_name = source_name
+        self.run = run
+        self.checkpoint = checkpoint
+        self.shards = shards
+        self.batch_size = batch_size
+        self.fail_after = fail_after
+        self.depth = max(1, depth)
+        # the run's ingestion.leases.Lease; checkpoint commits and the workers' flushes are fenced on it
+        self.lease = lease
+        self.processed = 0
+        self.timings: Dict[str, float] = {}
+        # round -> (record ids in dispatch order, last source position in the round)
+        self._rounds: Dict[int, tuple] = {}
+        # round -> highest index of a valid record any shard reported
+        self._last_valid: Dict[int, int] = {}
+        self._acked = [-1] * shards
+        self._stats: List[Dict[str, Any]] = [{} for _ in range(shards)]
+        self._done = [False] * shards
+        self._committed = -1
+
+    def run_stream(self, entries: Iterable[Any]) -> int:
+        """Process ``entries`` and return the number of valid records written."""
+        ctx = multiprocessing.get_context("spawn")
+        url = self.session.get_bind().url.render_as_string(hide_password=False)
+        budget = settings.ETL_IDEMPOTENCY_MEMORY_MB * 1024 * 1024 // self.shards
+        self._inboxes = [ctx.Queue(maxsize=self.depth) for _ in range(self.shards)]
+        self._outbox = ctx.Queue()
+        self._workers = [
+            ctx.Process(target=_worker, name=f"etl-{self.source_name}-{k}", daemon=True,
+                        args=(url, self.source_name, self.run.id, k, self.shards, self.batch_size, budget,
+                              self._inboxes[k], self._outbox, self.lease.owner if self.lease is not None else None))
+            for k in range(self.shards)
+        ]
+        try:
+            for worker in self._workers:
+                worker.start()
+            round_no = 0
+            for records, _ in batches(entries, self.batch_size * self.shards):
+                ids: List[Optional[str]] = []
+                position = None
+                parts: List[list] = [[] for _ in range(self.shards)]
+                for item in records:
+                    record_id = record_key(item)
+                    parts[shard_of(record_id, self.shards)].append((len(ids), record_id, item))
+                    ids.append(record_id)
+                    if item.get("position") is not None:
+                        position = item["position"]
+                self._rounds[round_no] = (ids, position)
+                for k, part in enumerate(parts):
+                    self._send(k, (round_no, part))
+                self._collect(block=False)
+                round_no += 1
+            for k in range(self.shards):
+                self._send(k, None)
+            while not all(self._done):
+                self._collect(block=True)
+            return self.processed
+        finally:
+            for worker in self._workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+    def _send(self, shard: int, message):
+        """Put ``message`` on a shard's bounded queue, handling acknowledgements while it is full."""
+        while True:
+            try:
+                self._inboxes[shard].put(message, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                self._collect(block=False)
+
+    def _check_workers(self):
+        for k, worker in enumerate(self._workers):
+            if not self._done[k] and not worker.is_alive():
+                raise RuntimeError(f"Shard {k} of {self.source_name} exited unexpectedly (exit code {worker.exitcode})")
+
+    def _collect(self, block: bool):
+        while True:
+            try:
+                message = self._outbox.get(timeout=POLL_SECONDS) if block else self._outbox.get_nowait()
+            except queue.Empty:
+                self._check_workers()
+                if block:
+                    continue
+                return
+            self._handle(*message)
+            if block:
+                return
+
+    def _handle(self, shard: int, kind, *rest):
+        if kind == _ERROR:
+            raise RuntimeError(f"Shard {shard} of {self.source_name} failed: {rest[0]}")
+        if kind == _DONE:
+            self._done[shard] = True
+            for stage, seconds in rest[0].items():
+                self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+            return
+        last_valid, stats = rest
+        self._acked[shard] = kind
+        self._stats[shard] = stats
+        if last_valid > self._last_valid.get(kind, -1):
+            self._last_valid[kind] = last_valid
+        self._advance()
+
+    def _advance(self):
+        """Move the checkpoint and run counters through every round all shards have written."""
+        watermark = min(self._acked)
+        if watermark <= self._committed:
+            return
+        while self._committed < watermark:
+            self._committed += 1
+            ids, position = self._rounds.pop(self._committed)
+            last_valid = self._last_valid.pop(self._committed, -1)
+            if last_valid >= 0:
+                self.checkpoint.last_record_id = ids[last_valid]
+            if position is not None:
+                self.checkpoint.position = position
+        totals: Counter = Counter()
+        invalid: Counter = Counter()
+        for stats in self._stats:
+            totals.update({k: v for k, v in stats.items() if k != "invalid"})
+            invalid.update(stats.get("invalid", {}))
+        self.processed = totals["processed"]
+        run = self.run
+        run.records_processed = self.processed
+        run.records_new, run.records_unchanged, run.records_changed = totals[NEW], totals[UNCHANGED], totals[CHANGED]
+        if invalid:
+            run.records_invalid = sum(invalid.values())
+            run.validation_errors = dict(invalid)
+        if self.fail_after and self.processed >= self.fail_after:
+            run.injected_failure = True
+            run.status = "failed"
+            generation.touch(self.session, generation.ETL_RUNS)
+            self.session.commit()
+            raise RuntimeError(f"Injected failure after {self.processed} records")
+        if self.lease is not None:
+            self.lease.fence(self.session)
+        self.session.commit()
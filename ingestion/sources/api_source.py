@@ -0,0 +1,25 @@
+from typing import Any, Dict, Optional
+from ingestion.sources.http_cache import HTTPCache
+
+
+class APISource:
+    """Behaviour shared by the JSON list API sources (CoinGecko, CoinPaprika).
+
+    Subclasses set ``self.cache`` and yield ``normalize``d items from ``list_assets``.
+    """
+
+    cache: Optional[HTTPCache] = None
+
+    @staticmethod
+    def normalize(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalized item for one API record (also used to replay stored payloads)."""
+        return {"id": item.get("id"), "symbol": item.get("symbol"), "name": item.get("name"), "raw": item}
+
+    def finish(self, success: bool):
+        """Keep the fetched bodies' cache entries only if the run that read them committed."""
+        if not self.cache:
+            return
+        if success:
+            self.cache.commit()
+        else:
+            self.cache.discard()
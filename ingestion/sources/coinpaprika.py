@@ -1,19 +1,22 @@
 import requests
 from typing import Iterator, Dict, Any, Optional
 from core.config import settings
+from ingestion.sources.http_client import get_json_array
+from ingestion.sources.api_source import APISource
+from ingestion.sources.http_cache import HTTPCache
 
 API_BASE = "https://api.coinpaprika.com/v1"
 
-class CoinPaprikaSource:
-    def __init__(self, api_key: Optional[str] = None):
+class CoinPaprikaSource(APISource):
+    def __init__(self, api_key: Optional[str] = None, stream: Optional[bool] = None):
         self.api_key = api_key or settings.COINPAPRIKA_API_KEY
+        self.stream = settings.SOURCE_STREAM_JSON if stream is None else stream
         self.session = requests.Session()
+        self.cache = HTTPCache.from_settings()
         if self.api_key:
             self.session.headers.update({"x-api-key": self.api_key})
 
     def list_assets(self) -> Iterator[Dict[str, Any]]:
         url = f"{API_BASE}/coins"
-        resp = self.session.get(url, timeout=30)
-        resp.raise_for_status()
-        for item in resp.json():
-            yield {"id": item.get("id"), "symbol": item.get("symbol"), "name": item.get("name"), "raw": item}
+        for item in get_json_array(self.session, url, stream=self.stream, timeout=30, cache=self.cache):
+            yield self.normalize(item)
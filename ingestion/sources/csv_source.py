@@ -1,17 +1,164 @@
 import csv
-from typing import Iterator, Dict, Any
+import glob
+import hashlib
+import logging
+from typing import Iterator, Dict, Any, List, Optional
 from pathlib import Path
+from core.config import settings
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 
+# bytes hashed from the start of the file to detect a replaced file
+FINGERPRINT_HEAD_BYTES = 64 * 1024
+
+logger = logging.getLogger("ingestion.csv")
+
+
 class CSVSource:
-    def __init__(self, path: str = None):
+    """Rows of one or more CSV files.
+
+    ``path`` may be a file, a directory (every ``*.csv`` in it) or a glob
+    pattern; files are read in sorted order. Rows are read one at a time with
+    ``csv.DictReader``, or with ``chunked`` through ``pandas.read_csv`` in
+    chunks of ``chunksize``; chunked mode yields one list of items per chunk.
+    """
+
+    # list_assets accepts a resume position stored by the ETL checkpoint
+    supports_resume = True
+
+    def __init__(self, path: str = None, chunked: Optional[bool] = None, chunksize: Optional[int] = None):
+        path = path or settings.CSV_SOURCE_PATH
         self.path = Path(path) if path else DATA_DIR / "assets.csv"
+        self.chunked = settings.CSV_CHUNKED if chunked is None else chunked
+        self.chunksize = chunksize or settings.CSV_CHUNK_SIZE
+
+    def files(self) -> List[Path]:
+        if self.path.is_dir():
+            return sorted(self.path.glob("*.csv"))
+        if self.path.exists():
+            return [self.path]
+        return sorted(Path(p) for p in glob.glob(str(self.path)))
+
+    def fingerprint(self, path: Optional[Path] = None) -> Dict[str, Any]:
+        """Identity of a file (default: ``self.path``): size, mtime and a hash of its head."""
+        path = path or self.path
+        stat = path.stat()
+        with path.open("rb") as fh:
+            head = hashlib.sha256(fh.read(FINGERPRINT_HEAD_BYTES)).hexdigest()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "head_sha256": head}
+
+    def _resume_plan(self, files: List[Path], resume: Optional[Dict[str, Any]]):
+        """Index of the file to resume in and the position within it, or (0, None)
+        to scan everything. Files before the resume file were completed earlier."""
+        if not resume:
+            return 0, None
+        file = resume.get("file")
+        paths = [str(p) for p in files]
+        if file is None and len(files) == 1:
+            file = paths[0]
+        if file not in paths:
+            return 0, None
+        idx = paths.index(file)
+        fingerprint = self.fingerprint(files[idx])
+        if resume.get("fingerprint") != fingerprint:
+            logger.info("CSV file %s changed since the last checkpoint; rescanning from the start", file)
+            return 0, None
+        return idx, resume
+
+    @staticmethod
+    def normalize(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalized item for one CSV row (also used to replay stored payloads).
+
+        Matches ``_read_chunks`` column for column: values are stripped and
+        blank ones count as missing, so both modes key a row the same way.
+        """
+        id_, external_id, symbol, name = (_clean(row.get(col)) for col in ("id", "external_id", "symbol", "name"))
+        return {"id": id_ or external_id or symbol, "symbol": symbol, "name": name, "raw": row}
 
-    def list_assets(self) -> Iterator[Dict[str, Any]]:
-        if not self.path.exists():
-            return
-        with self.path.open("r", encoding="utf-8") as fh:
-            reader = csv.DictReader(fh)
+    def list_assets(self, resume: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """Yield items carrying a ``position`` to resume from just past them.
+
+        Given a ``resume`` position whose file fingerprint still matches, files
+        already completed are skipped and the current one is seeked (row mode)
+        or fast-forwarded (chunked mode) instead of rescanned.
+        """
+        files = self.files()
+        start_idx, start = self._resume_plan(files, resume)
+        for idx in range(start_idx, len(files)):
+            pos = start if idx == start_idx else None
+            if self.chunked:
+                yield from self._read_chunks(files[idx], pos)
+            else:
+                yield from self._read_rows(files[idx], pos)
+
+    def _read_rows(self, path: Path, resume: Optional[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        fingerprint = self.fingerprint(path)
+        state = {"offset": 0, "line": 0}
+
+        def lines(fh):
+            for raw in iter(fh.readline, b""):
+                state["offset"] += len(raw)
+                state["line"] += 1
+                yield raw.decode("utf-8")
+
+        with path.open("rb") as fh:
+            source_lines = lines(fh)
+            fieldnames = next(csv.reader(source_lines), None)
+            if fieldnames is None:
+                return
+            if resume and state["offset"] < resume.get("offset", 0) <= fingerprint["size"]:
+                fh.seek(resume["offset"])
+                state.update(offset=resume["offset"], line=resume.get("line", 0))
+                logger.info("Resuming CSV %s at line %d (byte %d)", path, state["line"], state["offset"])
+            reader = csv.DictReader(source_lines, fieldnames=fieldnames)
             for row in reader:
-                yield {"id": row.get("id") or row.get("external_id") or row.get("symbol"), "symbol": row.get("symbol"), "name": row.get("name"), "raw": row}
+                position = {"file": str(path), "offset": state["offset"], "line": state["line"], "fingerprint": fingerprint}
+                item = self.normalize(row)
+                item["position"] = position
+                yield item
+
+    def _read_chunks(self, path: Path, resume: Optional[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """Vectorized path: id/symbol/name extraction, null handling and in-file
+        deduplication (first occurrence wins) are column operations per chunk;
+        the values agree with ``normalize``."""
+        import pandas as pd
+
+        fingerprint = self.fingerprint(path)
+        rows_done = resume.get("rows", 0) if resume else 0
+        if rows_done:
+            logger.info("Resuming CSV %s after %d rows", path, rows_done)
+        seen = set()
+        reader = pd.read_csv(path, chunksize=self.chunksize, dtype=str, keep_default_na=False,
+                             skiprows=range(1, rows_done + 1) if rows_done else None, encoding="utf-8")
+        with reader:
+            for frame in reader:
+                rows_done += len(frame)
+                normalized = frame.apply(lambda col: col.str.strip())
+                normalized = normalized.where(normalized != "")
+                ids = None
+                for col in ("id", "external_id", "symbol"):
+                    if col in normalized:
+                        ids = normalized[col] if ids is None else ids.fillna(normalized[col])
+                if ids is None:
+                    continue
+                keep = ids.notna() & ~ids.duplicated() & ~ids.isin(seen)
+                seen.update(ids[keep])
+
+                raw = frame[keep].to_dict("records")
+                columns = [_nullable(normalized[col][keep]) if col in normalized else [None] * len(raw) for col in ("symbol", "name")]
+                chunk = [{"id": i, "symbol": s, "name": n, "raw": r} for i, s, n, r in zip(ids[keep], *columns, raw)]
+                if chunk:
+                    chunk[-1]["position"] = {"file": str(path), "rows": rows_done, "fingerprint": fingerprint}
+                    yield chunk
+
+
+def _nullable(column):
+    """Column values as a list with missing entries as None instead of NaN."""
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+def _clean(value: Any) -> Optional[str]:
+    """A CSV cell stripped of surrounding whitespace; blank or missing cells are None."""
+    if value is None:
+        return None
+    return str(value).strip() or None
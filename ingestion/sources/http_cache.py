@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+from core.config import settings
+
+logger = logging.getLogger("ingestion.http_cache")
+
+READ_CHUNK = 64 * 1024
+
+
+class HTTPCache:
+    """File-backed cache of HTTP validators and gzip-compressed bodies.
+
+    Each URL gets ``<key>.json`` (ETag / Last-Modified) and ``<key>.json.gz``
+    (the last full body). A body read to the end is only staged; ``commit``
+    publishes it once the records parsed from it are durable, and ``discard``
+    drops it, so neither an interrupted download nor a failed ETL run leaves
+    validators behind that would make the next run skip unwritten records.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # url -> (staged body file, validators), published by commit()
+        self._staged: Dict[str, tuple] = {}
+
+    @classmethod
+    def from_settings(cls) -> Optional["HTTPCache"]:
+        if not settings.HTTP_CACHE_ENABLED:
+            return None
+        return cls(settings.HTTP_CACHE_DIR or os.path.join(tempfile.gettempdir(), "kasparro-http-cache"))
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return self.directory / f"{key}.json", self.directory / f"{key}.json.gz"
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Conditional request headers for ``url``; empty when nothing usable is cached."""
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return {}
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def read_body(self, url: str) -> Iterator[bytes]:
+        """Yield the cached body for ``url`` in decompressed chunks."""
+        _, body_path = self._paths(url)
+        with gzip.open(body_path, "rb") as fh:
+            while True:
+                chunk = fh.read(READ_CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+
+    def store(self, url: str, headers, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass ``chunks`` through while compressing them into the cache.
+
+        The body is staged for ``commit`` only if the iterator is exhausted;
+        responses without an ETag or Last-Modified are passed through untouched.
+        """
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if not etag and not last_modified:
+            yield from chunks
+            return
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as gz:
+                for chunk in chunks:
+                    gz.write(chunk)
+                    yield chunk
+            self._drop(url)
+            self._staged[url] = (tmp_name, {"url": url, "etag": etag, "last_modified": last_modified})
+            complete = True
+        finally:
+            if not complete and os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+    def _drop(self, url: str):
+        staged = self._staged.pop(url, None)
+        if staged is not None and os.path.exists(staged[0]):
+            os.unlink(staged[0])
+
+    def commit(self):
+        """Publish every staged entry; call once the records read from them are committed."""
+        for url, (tmp_name, meta) in list(self._staged.items()):
+            meta_path, body_path = self._paths(url)
+            if meta_path.exists():
+                meta_path.unlink()
+            os.replace(tmp_name, body_path)
+            meta_path.write_text(json.dumps(meta))
+            del self._staged[url]
+            logger.info("Cached response body for %s", url)
+
+    def discard(self):
+        """Drop every staged entry; the next request for those URLs is unconditional."""
+        for url in list(self._staged):
+            self._drop(url)
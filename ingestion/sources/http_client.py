@@ -0,0 +1,173 @@
+import codecs
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional
+import requests
+from core.config import settings
+from ingestion.sources.http_cache import HTTPCache
+
+logger = logging.getLogger("ingestion.http")
+
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_WHITESPACE = " \t\n\r"
+
+
+class RetryAfterTooLong(requests.HTTPError):
+    """A 429/5xx whose ``Retry-After`` asks for a longer wait than ``HTTP_MAX_BACKOFF_SECONDS``."""
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Incrementally decode a top-level JSON array from a stream of byte chunks.
+
+    Elements are yielded as soon as they are complete, so memory use is bounded
+    by the largest single element rather than by the whole document.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            eof = True
+            buf, pos = buf[pos:] + utf8.decode(b"", final=True), 0
+            return False
+        buf, pos = buf[pos:] + utf8.decode(chunk), 0
+        return True
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buf):
+            if more():
+                continue
+            raise ValueError("Unexpected end of JSON array")
+
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                raise ValueError(f"Expected a JSON array, got {ch!r}")
+            started = True
+            pos += 1
+            continue
+        if ch == "]":
+            return
+        if ch == ",":
+            pos += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if more():
+                continue
+            raise
+        # a scalar at the end of the buffer may still be growing (e.g. 12 -> 1234)
+        if end >= len(buf) and more():
+            continue
+        pos = end
+        yield value
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    """Seconds requested by a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def request_with_retry(session: requests.Session, url: str, headers: Optional[dict] = None, stream: bool = False,
+                       timeout: int = 30, max_retries: Optional[int] = None) -> requests.Response:
+    """GET with exponential backoff on connection errors, 429 and 5xx.
+
+    ``Retry-After`` is honoured in full when present; a server asking for
+    longer than ``settings.HTTP_MAX_BACKOFF_SECONDS`` fails the request at
+    once with ``RetryAfterTooLong`` rather than being retried early. The last
+    response is returned as-is once retries are exhausted, so callers still
+    ``raise_for_status()``.
+    """
+    retries = settings.HTTP_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            resp = session.get(url, headers=headers, stream=stream, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries:
+                raise
+            delay, reason = None, str(e)
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                return resp
+            delay, reason = _retry_after(resp), f"HTTP {resp.status_code}"
+            resp.close()
+            if delay is not None and delay > settings.HTTP_MAX_BACKOFF_SECONDS:
+                raise RetryAfterTooLong(
+                    f"{url} returned HTTP {resp.status_code} with Retry-After {delay:.0f}s, "
+                    f"over HTTP_MAX_BACKOFF_SECONDS ({settings.HTTP_MAX_BACKOFF_SECONDS:.0f}s)", response=resp)
+
+        if delay is None:
+            delay = min(settings.HTTP_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.0),
+                        settings.HTTP_MAX_BACKOFF_SECONDS)
+        attempt += 1
+        logger.warning("Retrying %s in %.1fs (attempt %d/%d): %s", url, delay, attempt, retries, reason)
+        time.sleep(delay)
+
+
+def get_json_array(session: requests.Session, url: str, stream: bool = True, timeout: int = 30,
+                   cache: Optional[HTTPCache] = None, on_not_modified: Optional[str] = None) -> Iterator[Any]:
+    """GET ``url`` and yield the elements of the JSON array it returns.
+
+    With ``stream`` the body is parsed while it downloads; otherwise it is
+    fully read and decoded first. With a ``cache`` the request is conditional:
+    a 304 either yields nothing (``on_not_modified="skip"``) or replays the
+    cached body (``"replay"``), defaulting to ``settings.HTTP_CACHE_ON_NOT_MODIFIED``.
+    """
+    mode = on_not_modified or settings.HTTP_CACHE_ON_NOT_MODIFIED
+    headers = cache.validators(url) if cache else {}
+    resp = request_with_retry(session, url, headers=headers, stream=True, timeout=timeout)
+    with resp:
+        if resp.status_code == 304 and cache:
+            if mode == "replay":
+                logger.info("%s not modified; replaying cached body", url)
+                yield from iter_json_array(cache.read_body(url))
+            else:
+                logger.info("%s not modified; skipping", url)
+            return
+        resp.raise_for_status()
+
+        chunks = resp.iter_content(chunk_size=CHUNK_SIZE)
+        if cache:
+            chunks = cache.store(url, resp.headers, chunks)
+        if not stream:
+            yield from json.loads(b"".join(chunks))
+            return
+        chunks = iter(chunks)
+        yield from iter_json_array(chunks)
+        # drain trailing bytes so the cache entry is finalised
+        for _ in chunks:
+            pass
@@ -0,0 +1,56 @@
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pydantic import ValidationError
+from schemas.asset import AssetSchema
+
+logger = logging.getLogger("ingestion.validation")
+
+# reasons are short and categorical so they can be counted per run
+MISSING_ID = "missing id"
+MISSING_SYMBOL = "missing symbol"
+
+
+def _reason(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+class BatchValidator:
+    """Validates a batch of normalized items for one source.
+
+    Rows whose fields already have the expected types (``symbol`` a non-empty
+    str, ``name`` str or None, ``raw`` dict or None) skip pydantic validation
+    and are built with ``AssetSchema.construct``; only the remaining rows go
+    through full ``AssetSchema`` validation. Rejected rows come back with a
+    reason instead of being logged one traceback at a time.
+    """
+
+    def __init__(self, source_name: str):
+        self.source_name = source_name
+        self.errors: Counter = Counter()
+
+    def validate(self, records: Sequence[Tuple[Optional[str], Dict[str, Any]]]
+                 ) -> List[Tuple[Optional[AssetSchema], Optional[str]]]:
+        """``(asset, None)`` or ``(None, reason)`` for each ``(record_id, item)``, in order."""
+        results = []
+        source = self.source_name
+        construct = AssetSchema.construct
+        for record_id, item in records:
+            symbol, name, raw = item.get("symbol"), item.get("name"), item.get("raw")
+            if record_id is None:
+                results.append((None, MISSING_ID))
+            elif symbol is None or symbol == "":
+                results.append((None, MISSING_SYMBOL))
+            elif type(symbol) is str and (name is None or type(name) is str) and (raw is None or type(raw) is dict):
+                results.append((construct(external_id=record_id, symbol=symbol, name=name, source=source, metadata=raw), None))
+            else:
+                try:
+                    results.append((AssetSchema(external_id=record_id, symbol=symbol, name=name, source=source, metadata=raw), None))
+                except ValidationError as e:
+                    results.append((None, _reason(e)))
+        batch = Counter(reason for _, reason in results if reason is not None)
+        if batch:
+            self.errors.update(batch)
+            logger.warning("Quarantined %d of %d records for %s", sum(batch.values()), len(records), source,
+                           extra={"source": source, "reasons": dict(batch)})
+        return results
@@ -0,0 +1,330 @@
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import Table, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from core.models import RawAsset, Asset, Checkpoint, ETLRun, Quarantine, Payload
+from core import changes, generation, payloads
+from schemas.asset import AssetSchema
+from ingestion.idempotency import IdempotencyIndex, ABSENT, MAYBE, content_hash, resolve_hashes
+
+logger = logging.getLogger("ingestion.writer")
+
+# upper bound on bind parameters per statement (SQLite builds before 3.32 cap this at 999)
+_MAX_PARAMS = {"sqlite": 999, "postgresql": 32767}
+
+RAW_KEY = ("source", "record_id")
+ASSET_KEY = ("external_id", "source")
+PAYLOAD_KEY = ("hash",)
+# inline payload/metadata columns are left out of written rows, so upserts set them to NULL
+# and clear legacy copies
+RAW_UPDATE = ("payload", "payload_hash", "content_hash")
+ASSET_UPDATE = ("symbol", "name", "metadata", "metadata_hash", "content_hash", "change_seq", "change_op")
+QUARANTINE_KEY = ("source", "record_id")
+QUARANTINE_UPDATE = ("reason", "payload", "run_id")
+
+NEW, UNCHANGED, CHANGED = "new", "unchanged", "changed"
+
+
+def _chunks(rows: List[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _dialect_insert(session: Session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert, _MAX_PARAMS[dialect]
+    if dialect == "postgresql":
+        return postgresql.insert, _MAX_PARAMS[dialect]
+    return None, None
+
+
+def insert_ignore(session: Session, table: Table, rows: List[Dict[str, Any]], key: Sequence[str]) -> int:
+    """Multi-row INSERT that silently skips rows whose natural key already exists.
+
+    Rows are keyed by column name. Uses ``INSERT ... ON CONFLICT DO NOTHING``
+    on SQLite and PostgreSQL; other dialects check each key before inserting.
+    Returns the number of rows inserted.
+    """
+    if not rows:
+        return 0
+    inserted = 0
+    insert, max_params = _dialect_insert(session)
+    if insert is not None:
+        for chunk in _chunks(rows, max(1, max_params // len(rows[0]))):
+            inserted += session.execute(insert(table).values(chunk).on_conflict_do_nothing(index_elements=list(key))).rowcount
+        return inserted
+
+    for row in rows:
+        cond = [table.c[k] == row[k] for k in key]
+        if session.execute(select(table.c[key[0]]).where(*cond)).first() is None:
+            session.execute(table.insert().values(**row))
+            inserted += 1
+    return inserted
+
+
+def insert_ignore_many(session: Session, table: Table, rows: List[Dict[str, Any]], key: Sequence[str]):
+    """``insert_ignore`` as a single executemany of one cached statement.
+
+    Cheaper than multi-row VALUES for wide or numerous rows, whose statement is
+    compiled afresh for every distinct row count; the inserted count is not
+    reported.
+    """
+    if not rows:
+        return
+    insert, _ = _dialect_insert(session)
+    if insert is None:
+        insert_ignore(session, table, rows, key)
+        return
+    session.execute(insert(table).on_conflict_do_nothing(index_elements=list(key)), rows)
+
+
+def upsert(session: Session, table: Table, rows: List[Dict[str, Any]], key: Sequence[str], update_cols: Sequence[str]):
+    """Multi-row INSERT that overwrites ``update_cols`` of rows whose natural key exists.
+
+    ``updated_at`` is refreshed when the table has one. Rows must be unique by
+    ``key`` within a call (PostgreSQL refuses to update a row twice).
+    """
+    if not rows:
+        return
+    insert, max_params = _dialect_insert(session)
+    if insert is not None:
+        for chunk in _chunks(rows, max(1, max_params // len(rows[0]))):
+            stmt = insert(table).values(chunk)
+            set_ = {c: stmt.excluded[c] for c in update_cols}
+            if "updated_at" in table.c:
+                set_["updated_at"] = func.now()
+            session.execute(stmt.on_conflict_do_update(index_elements=list(key), set_=set_))
+        return
+
+    for row in rows:
+        cond = [table.c[k] == row[k] for k in key]
+        values = {c: row.get(c) for c in update_cols}
+        if "updated_at" in table.c:
+            values["updated_at"] = func.now()
+        if session.execute(table.update().where(*cond).values(**values)).rowcount == 0:
+            session.execute(table.insert().values(**row))
+
+
+def build_asset_row(asset: AssetSchema, payload: Any, payload_hash: str) -> Dict[str, Any]:
+    """``assets`` row for ``asset``; metadata equal to ``payload`` reuses its hash.
+
+    ``metadata`` holds the body until it is moved to the payload store
+    (``BatchWriter._offload``).
+    """
+    metadata = asset.metadata
+    if metadata is None:
+        metadata_hash = None
+    else:
+        metadata_hash = payload_hash if metadata == payload else content_hash(metadata)
+    return {
+        "external_id": asset.external_id,
+        "symbol": asset.symbol,
+        "name": asset.name,
+        "source": asset.source,
+        "metadata": metadata,
+        "metadata_hash": metadata_hash,
+        "content_hash": content_hash({"symbol": asset.symbol, "name": asset.name, "metadata": metadata}),
+    }
+
+
+class BatchWriter:
+    """Buffers records for one source and writes them in multi-row batches.
+
+    Every record is classified by its content hash against what is stored:
+    ``new`` rows are inserted, ``changed`` rows are upserted (raw payload and
+    normalized asset), and ``unchanged`` rows are not written at all. Payload
+    bodies go to the ``payloads`` store, compressed and once per distinct hash;
+    raw and asset rows only carry the hash.
+
+    Each flush writes the buffered rows, advances the checkpoint and the run
+    counters, and commits once, so the checkpoint never points past data that
+    is not durable (when the writer has no run or checkpoint, only the data
+    and the counters in ``counts`` move). Stored hashes come from the ``IdempotencyIndex`` when one is
+    given; anything it cannot answer is looked up with one query per flush.
+    """
+
+    def __init__(self, session: Session, source_name: str, run: Optional[ETLRun], checkpoint: Optional[Checkpoint],
+                 batch_size: int = 500, index: Optional[IdempotencyIndex] = None, run_id: Optional[int] = None,
+                 lease=None):
+        self.session = session
+        self.source_name = source_name
+        # shard workers write without the run and checkpoint rows; their coordinator owns those
+        self.run = run
+        self.run_id = run.id if run is not None else run_id
+        self.checkpoint = checkpoint
+        self.batch_size = max(1, batch_size)
+        self.index = index
+        # the run's ingestion.leases.Lease; every flush is fenced on it
+        self.lease = lease
+        self.processed = 0
+        self.counts = {NEW: 0, UNCHANGED: 0, CHANGED: 0}
+        # record_id -> (state, digest, raw row, asset row or None); state is NEW, CHANGED or MAYBE
+        self._rows: Dict[str, tuple] = {}
+        self._batch_counts = {NEW: 0, UNCHANGED: 0, CHANGED: 0}
+        self._last_record_id: Optional[str] = None
+        self._last_position: Optional[Dict[str, Any]] = None
+        # record_id -> quarantine row, written with the next flush
+        self._quarantined: Dict[str, Dict[str, Any]] = {}
+        self._pending = 0
+        self._batch_seen = 0
+        # seconds spent per write stage, summed over all flushes
+        self.timings = {"raw_write": 0.0, "asset_upsert": 0.0, "checkpoint": 0.0}
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @staticmethod
+    def _classify(stored, digest: str):
+        if stored is ABSENT:
+            return NEW
+        if stored is MAYBE:
+            return MAYBE
+        return UNCHANGED if stored == digest else CHANGED
+
+    def add(self, record_id: str, payload: Dict[str, Any], asset: Optional[AssetSchema],
+            position: Optional[Dict[str, Any]] = None):
+        """Buffer a record. ``asset`` is None when validation failed: the raw
+        payload is still stored but the checkpoint record id does not move past
+        it. ``position`` is the source's resume point just after this record."""
+        self._batch_seen += 1
+        if position is not None:
+            self._last_position = position
+        if asset is not None:
+            self._last_record_id = record_id
+            self._pending += 1
+
+        digest = content_hash(payload)
+        buffered = self._rows.pop(record_id, None)
+        if buffered is not None and buffered[1] == digest:
+            self._rows[record_id] = buffered
+            self._batch_counts[UNCHANGED] += 1
+            return self._maybe_flush()
+
+        stored = self.index.get(record_id) if self.index else MAYBE
+        state = self._classify(stored, digest)
+        if state is UNCHANGED:
+            self._batch_counts[UNCHANGED] += 1
+            return self._maybe_flush()
+
+        # "payload" / "metadata" hold the body until flush moves it to the payload store
+        raw_row = {"source": self.source_name, "record_id": record_id, "payload": payload, "payload_hash": digest,
+                   "content_hash": digest}
+        asset_row = build_asset_row(asset, payload, digest) if asset is not None else None
+        self._rows[record_id] = (state, digest, raw_row, asset_row)
+        self._maybe_flush()
+
+    def quarantine(self, record_id: str, payload: Any, reason: str):
+        """Buffer a rejected record for the quarantine table (latest reason per record wins)."""
+        self._quarantined[record_id] = {"source": self.source_name, "record_id": record_id, "reason": reason,
+                                        "payload": payload, "run_id": self.run_id}
+
+    def add_validated(self, record_id: Optional[str], item: Dict[str, Any], asset: Optional[AssetSchema],
+                      reason: Optional[str]) -> bool:
+        """Buffer one item after validation; rejected ones are quarantined. Returns whether it was valid."""
+        payload = item.get("raw") or item
+        if asset is None:
+            # rejected rows keep their raw payload (when they can be keyed) and land in quarantine
+            if record_id is None:
+                self.quarantine(f"hash:{content_hash(payload)}", payload, reason)
+                return False
+            self.quarantine(record_id, payload, reason)
+        # raw is stored even when validation fails; writes are idempotent upserts keyed by content hash
+        self.add(record_id, payload, asset, position=item.get("position"))
+        return asset is not None
+
+    def _maybe_flush(self):
+        if self._batch_seen >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def _offload(blobs: Dict[str, Dict[str, Any]], row: Dict[str, Any], column: str, hash_column: str):
+        """Move ``row[column]`` into ``blobs`` (once per hash); the column is left to default to NULL."""
+        value = row.pop(column)
+        payload_hash = row[hash_column]
+        if payload_hash is not None and payload_hash not in blobs:
+            blobs[payload_hash] = payloads.row(value, payload_hash)
+
+    def _settle(self):
+        """Classify MAYBE rows against the database; unchanged ones are dropped."""
+        maybe = [rid for rid, (state, _, _, _) in self._rows.items() if state is MAYBE]
+        if not maybe:
+            return
+        if self.index:
+            stored = self.index.resolve(self.session, maybe)
+        else:
+            stored = resolve_hashes(self.session, self.source_name, maybe)
+        for rid in maybe:
+            _, digest, raw_row, asset_row = self._rows[rid]
+            state = self._classify(stored.get(rid, ABSENT), digest)
+            if state is UNCHANGED:
+                del self._rows[rid]
+                self._batch_counts[UNCHANGED] += 1
+            else:
+                self._rows[rid] = (state, digest, raw_row, asset_row)
+
+    def flush(self):
+        if not self._batch_seen and not self._quarantined:
+            return
+        clock = time.perf_counter
+        start = clock()
+        self._settle()
+        new_raw, new_assets, changed_raw, changed_assets = [], [], [], []
+        blobs: Dict[str, Dict[str, Any]] = {}
+        for state, _, raw_row, asset_row in self._rows.values():
+            self._batch_counts[state] += 1
+            self._offload(blobs, raw_row, "payload", "payload_hash")
+            (new_raw if state is NEW else changed_raw).append(raw_row)
+            if asset_row is not None:
+                self._offload(blobs, asset_row, "metadata", "metadata_hash")
+                (new_assets if state is NEW else changed_assets).append(asset_row)
+
+        raw_table, asset_table = RawAsset.__table__, Asset.__table__
+        insert_ignore_many(self.session, Payload.__table__, list(blobs.values()), PAYLOAD_KEY)
+        insert_ignore(self.session, raw_table, new_raw, RAW_KEY)
+        upsert(self.session, raw_table, changed_raw, RAW_KEY, RAW_UPDATE)
+        raw_done = clock()
+        changes.stamp(self.session, new_assets, changed_assets)
+        assets_inserted = insert_ignore(self.session, asset_table, new_assets, ASSET_KEY)
+        upsert(self.session, asset_table, changed_assets, ASSET_KEY, ASSET_UPDATE)
+        if new_assets or changed_assets:
+            generation.bump(self.session, assets_inserted)
+        assets_done = clock()
+        upsert(self.session, Quarantine.__table__, list(self._quarantined.values()), QUARANTINE_KEY, QUARANTINE_UPDATE)
+
+        if self.checkpoint is not None:
+            if self._last_record_id is not None:
+                self.checkpoint.last_record_id = self._last_record_id
+            if self._last_position is not None:
+                self.checkpoint.position = self._last_position
+        for state, n in self._batch_counts.items():
+            self.counts[state] += n
+        if self.run is not None:
+            self.run.records_processed = self.processed + self._pending
+            self.run.records_new = self.counts[NEW]
+            self.run.records_unchanged = self.counts[UNCHANGED]
+            self.run.records_changed = self.counts[CHANGED]
+        changes.assign(self.session, self.source_name, len(new_assets) + len(changed_assets))
+        if self.lease is not None:
+            self.lease.fence(self.session)
+        self.session.commit()
+        timings = self.timings
+        timings["raw_write"] += raw_done - start
+        timings["asset_upsert"] += assets_done - raw_done
+        timings["checkpoint"] += clock() - assets_done
+        logger.debug("Flushed batch for %s", self.source_name, extra={"source": self.source_name, **self._batch_counts})
+
+        if self.index:
+            for rid, (_, digest, _, _) in self._rows.items():
+                self.index.set(rid, digest)
+        self.processed += self._pending
+        self._rows.clear()
+        self._quarantined.clear()
+        self._batch_counts = {NEW: 0, UNCHANGED: 0, CHANGED: 0}
+        self._last_record_id = None
+        self._last_position = None
+        self._pending = 0
+        self._batch_seen = 0
@@ -1,18 +1,163 @@
+import base64
+import json
 import logging
-from core.db import SessionLocal
+import threading
+from collections import OrderedDict
+from core.db import SessionLocal, run_session
 from core.models import Asset
-from sqlalchemy import select
+from core import generation
+from core import search
+from sqlalchemy import select, func, and_, or_
 
 logger = logging.getLogger("services.api")
 
+# filtered totals kept per process, keyed by filter and data generation
+TOTALS_CACHE_SIZE = 1024
+
+# columns returned by /data and /data/export; metadata is never read
+ASSET_COLUMNS = ("id", "external_id", "symbol", "name", "source")
+# rows fetched from the server-side cursor per round-trip
+EXPORT_BATCH_SIZE = 1000
+# most changes returned by one /changes poll
+CHANGES_MAX_LIMIT = 1000
+
+
+def encode_cursor(last_id: int, rank: int | None = None) -> str:
+    data = {"id": last_id} if rank is None else {"id": last_id, "rank": rank}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int | None]:
+    """(last id, last search rank or None) encoded in ``cursor``."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        rank = data.get("rank")
+        return int(data["id"]), None if rank is None else int(rank)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid cursor")
+
+
 class APIService:
+    _totals = OrderedDict()  # q -> (generation, total), LRU ordered
+    _totals_lock = threading.Lock()
+
+    @staticmethod
+    def _filter(session, stmt, q: str | None):
+        if q:
+            stmt = search.apply_filter(stmt, q, session.get_bind())
+        return stmt
+
+    @classmethod
+    def _total(cls, session, q: str | None) -> int:
+        """Total matching ``q``. The unfiltered total is the counter the ETL maintains;
+        filtered totals are counted once per data generation."""
+        gen, asset_total = generation.current(session)
+        if not q:
+            return asset_total
+        with cls._totals_lock:
+            cached = cls._totals.get(q)
+            if cached and cached[0] == gen:
+                cls._totals.move_to_end(q)
+                return cached[1]
+        total = session.execute(cls._filter(session, select(func.count()).select_from(Asset), q)).scalar_one()
+        with cls._totals_lock:
+            cls._totals[q] = (gen, total)
+            cls._totals.move_to_end(q)
+            while len(cls._totals) > TOTALS_CACHE_SIZE:
+                cls._totals.popitem(last=False)
+        return total
+
     @staticmethod
-    def list_assets(limit: int = 50, offset: int = 0, q: str | None = None):
+    def _columns():
+        return [Asset.__table__.c[c] for c in ASSET_COLUMNS]
+
+    @classmethod
+    def list_assets(cls, limit: int = 50, offset: int = 0, q: str | None = None, cursor: str | None = None):
+        """Page of assets as ``ASSET_COLUMNS`` dicts, plus the total and the cursor of the next page.
+
+        Assets are ordered by id; with ``q`` exact symbol matches come first,
+        then symbol prefixes, then other substring matches. With ``cursor`` the
+        page starts after the row it encodes (keyset paging) and ``offset`` is
+        ignored; otherwise ``limit/offset`` paging is used. ``next_cursor`` is
+        None on the last page.
+
+        Only the projected columns are selected and no ORM objects are built.
+        """
+        with SessionLocal() as session:
+            return cls._list_assets(session, limit, offset, q, cursor)
+
+    @classmethod
+    async def list_assets_async(cls, limit: int = 50, offset: int = 0, q: str | None = None, cursor: str | None = None):
+        """``list_assets`` for async routes (async engine or worker thread, see ``run_session``)."""
+        return await run_session(cls._list_assets, limit, offset, q, cursor)
+
+    @classmethod
+    def _list_assets(cls, session, limit: int, offset: int, q: str | None, cursor: str | None):
+        after_id, after_rank = decode_cursor(cursor) if cursor else (None, None)
+        if q:
+            rank = search.rank(q)
+            stmt = cls._filter(session, select(*cls._columns(), rank), q).order_by(rank, Asset.id)
+            if after_id is not None:
+                after_rank = after_rank or 0
+                stmt = stmt.where(or_(rank > after_rank, and_(rank == after_rank, Asset.id > after_id)))
+        else:
+            stmt = select(*cls._columns()).order_by(Asset.id)
+            if after_id is not None:
+                stmt = stmt.where(Asset.id > after_id)
+        if after_id is None:
+            stmt = stmt.offset(offset)
+        rows = session.execute(stmt.limit(limit)).all()
+        res = [dict(zip(ASSET_COLUMNS, row)) for row in rows]
+        total = cls._total(session, q)
+        next_cursor = None
+        if rows and len(rows) == limit:
+            next_cursor = encode_cursor(rows[-1][0], rows[-1][-1] if q else None)
+        return res, total, next_cursor
+
+    @classmethod
+    def list_changes(cls, since: int = 0, limit: int = 100):
+        """Assets changed after sequence ``since``, oldest change first, plus the next cursor and whether more follow.
+
+        Each entry is the asset's current ``ASSET_COLUMNS`` with its ``seq`` and
+        ``op`` ("insert" or "update"); an asset changed several times appears
+        once, at its latest change. The query is a range scan on
+        ``ix_assets_change_seq``, so a poll costs the changes it returns.
+        """
+        with SessionLocal() as session:
+            return cls._list_changes(session, since, limit)
+
+    @classmethod
+    async def list_changes_async(cls, since: int = 0, limit: int = 100):
+        """``list_changes`` for async routes."""
+        return await run_session(cls._list_changes, since, limit)
+
+    @classmethod
+    def _list_changes(cls, session, since: int, limit: int):
+        stmt = (
+            select(Asset.change_seq, Asset.change_op, *cls._columns())
+            .where(Asset.change_seq > since)
+            .order_by(Asset.change_seq)
+            .limit(limit + 1)
+        )
+        rows = session.execute(stmt).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        res = [{"seq": row[0], "op": row[1], **dict(zip(ASSET_COLUMNS, row[2:]))} for row in rows]
+        return res, rows[-1][0] if rows else since, has_more
+
+    @classmethod
+    def export_rows(cls, q: str | None = None, source: str | None = None, batch_size: int = EXPORT_BATCH_SIZE):
+        """Yield batches of ``ASSET_COLUMNS`` tuples for every matching asset, ordered by id.
+
+        Rows come from a server-side cursor (``yield_per``), so memory use does
+        not grow with the table; no ORM objects are built.
+        """
         with SessionLocal() as session:
-            stmt = select(Asset)
-            if q:
-                stmt = stmt.where(Asset.symbol.ilike(f"%{q}%") | Asset.name.ilike(f"%{q}%"))
-            stmt = stmt.limit(limit).offset(offset)
-            res = session.execute(stmt).scalars().all()
-            total = session.query(Asset).count()
-            return res, total
+            stmt = select(*cls._columns()).order_by(Asset.id)
+            stmt = cls._filter(session, stmt, q)
+            if source:
+                stmt = stmt.where(Asset.source == source)
+            result = session.execute(stmt.execution_options(yield_per=batch_size))
+            for rows in result.partitions():
+                yield [tuple(row) for row in rows]
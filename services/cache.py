@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from core.db import SessionLocal, run_session
+from core import generation
+from core.config import settings
+
+logger = logging.getLogger("services.cache")
+
+
+class ResponseCache:
+    """In-process TTL + LRU cache of endpoint results.
+
+    Entries are keyed by endpoint and normalized query parameters and tagged
+    with a token built from the ``data_generation`` counters, so any ETL commit
+    invalidates them. The counters are re-read at most once per
+    ``generation_ttl`` seconds (immediately after an ETL commit in this
+    process), which makes a cached read cost no queries. When the counters
+    cannot be read, results are computed and not cached.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0, generation_ttl: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation_ttl = generation_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, Tuple[Any, float, Any]]" = OrderedDict()
+        self._token: Optional[tuple] = None  # (session factory, local version, read at, token)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ResponseCache":
+        return cls(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES, ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+                   generation_ttl=settings.RESPONSE_CACHE_GENERATION_TTL_SECONDS)
+
+    @staticmethod
+    def key(endpoint: str, params: Dict[str, Any]) -> tuple:
+        return (endpoint,) + tuple(sorted((k, str(v)) for k, v in params.items() if v is not None))
+
+    def _fresh_token(self):
+        """(True, token) when the remembered token is still usable, else (False, None)."""
+        cached = self._token
+        if cached and cached[0] is SessionLocal and cached[1] == generation.local_version \
+                and time.monotonic() - cached[2] < self.generation_ttl:
+            return True, cached[3]
+        return False, None
+
+    @staticmethod
+    def _read_token(session):
+        return str(session.get_bind().url), tuple(sorted(generation.versions(session).items()))
+
+    def _remember(self, factory, local: int, read_at: float, token):
+        self._token = (factory, local, read_at, token)
+        return token
+
+    def token(self):
+        """Current generation token, or None when the counters cannot be read."""
+        fresh, token = self._fresh_token()
+        if fresh:
+            return token
+        factory, local, now = SessionLocal, generation.local_version, time.monotonic()
+        try:
+            with factory() as session:
+                token = self._read_token(session)
+        except Exception as e:
+            logger.warning("Could not read data generation; bypassing response cache: %s", e)
+            return None
+        return self._remember(factory, local, now, token)
+
+    async def token_async(self):
+        fresh, token = self._fresh_token()
+        if fresh:
+            return token
+        factory, local, now = SessionLocal, generation.local_version, time.monotonic()
+        try:
+            token = await run_session(self._read_token)
+        except Exception as e:
+            logger.warning("Could not read data generation; bypassing response cache: %s", e)
+            return None
+        return self._remember(factory, local, now, token)
+
+    def _lookup(self, key: tuple, token):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if token is not None and entry and entry[0] == token and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2]
+            self.misses += 1
+        return False, None
+
+    def _store(self, key: tuple, token, value):
+        if token is None:
+            return
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, endpoint: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(result, hit) for ``endpoint`` with ``params``, calling ``compute`` on a miss."""
+        if self.max_entries <= 0:
+            return compute(), False
+        key, token = self.key(endpoint, params), self.token()
+        hit, value = self._lookup(key, token)
+        if not hit:
+            value = compute()
+            self._store(key, token, value)
+        return value, hit
+
+    async def get_or_set_async(self, endpoint: str, params: Dict[str, Any],
+                               compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """``get_or_set`` for async routes; ``compute`` returns an awaitable."""
+        if self.max_entries <= 0:
+            return await compute(), False
+        key, token = self.key(endpoint, params), await self.token_async()
+        hit, value = self._lookup(key, token)
+        if not hit:
+            value = await compute()
+            self._store(key, token, value)
+        return value, hit
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._token = None
+            self.hits = self.misses = 0
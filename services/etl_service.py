@@ -1,7 +1,6 @@
 import logging
-from sqlalchemy import select, desc
-from core.db import SessionLocal
-from core.models import ETLRun
+from core.db import SessionLocal, run_session
+from core import etl_stats
 
 logger = logging.getLogger("services.etl")
 
@@ -9,16 +8,50 @@ class ETLService:
     @staticmethod
     def last_run():
         with SessionLocal() as session:
-            return session.execute(select(ETLRun).order_by(desc(ETLRun.run_started_at)).limit(1)).scalar_one_or_none()
+            return ETLService._last_run(session)
+
+    @staticmethod
+    async def last_run_async():
+        return await run_session(ETLService._last_run)
+
+    @staticmethod
+    def _last_run(session):
+        """Rollup row of the source that ran most recently (``last_status``, ``last_run_started_at``)."""
+        return etl_stats.latest(session)
 
     @staticmethod
     def stats():
         with SessionLocal() as session:
-            total = session.query(ETLRun).count()
-            last_success = session.execute(select(ETLRun).where(ETLRun.status=="success").order_by(desc(ETLRun.run_finished_at)).limit(1)).scalar_one_or_none()
-            last_failure = session.execute(select(ETLRun).where(ETLRun.status=="failed").order_by(desc(ETLRun.run_finished_at)).limit(1)).scalar_one_or_none()
-            return {
-                "total_runs": total,
-                "last_success": last_success.run_finished_at.isoformat() if last_success and last_success.run_finished_at else None,
-                "last_failure": last_failure.run_finished_at.isoformat() if last_failure and last_failure.run_finished_at else None,
-            }
+            return ETLService._stats(session)
+
+    @staticmethod
+    async def stats_async():
+        return await run_session(ETLService._stats)
+
+    @staticmethod
+    def _stats(session):
+        """Totals and per-source breakdown, read from the etl_source_stats rollup."""
+        rows = etl_stats.all_sources(session)
+        last_success = max((r.last_success_at for r in rows if r.last_success_at), default=None)
+        last_failure = max((r.last_failure_at for r in rows if r.last_failure_at), default=None)
+        return {
+            "total_runs": sum(r.total_runs for r in rows),
+            "last_success": last_success.isoformat() if last_success else None,
+            "last_failure": last_failure.isoformat() if last_failure else None,
+            "sources": {
+                r.source: {
+                    "total_runs": r.total_runs,
+                    "success_runs": r.success_runs,
+                    "failed_runs": r.failed_runs,
+                    "last_status": r.last_status,
+                    "last_run_started_at": r.last_run_started_at.isoformat() if r.last_run_started_at else None,
+                    "last_success": r.last_success_at.isoformat() if r.last_success_at else None,
+                    "last_failure": r.last_failure_at.isoformat() if r.last_failure_at else None,
+                    "last_error": r.last_error,
+                    "last_records_processed": r.last_records_processed,
+                    "total_records_processed": r.total_records_processed,
+                    "last_duration_seconds": r.last_duration_seconds,
+                    "last_records_per_second": r.last_records_per_second,
+                } for r in rows
+            },
+        }
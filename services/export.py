@@ -0,0 +1,63 @@
+import csv
+import io
+import zlib
+import orjson
+from typing import Iterable, Iterator, Sequence, Tuple
+
+# media type for each export format
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an ``Accept-Encoding`` header allows gzip: listed (or ``*``) with a non-zero q-value."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    return weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0))) > 0
+
+
+def ndjson_chunks(columns: Sequence[str], batches: Iterable[Sequence[Tuple]]) -> Iterator[bytes]:
+    """One JSON object per line; each batch of rows becomes one chunk."""
+    for rows in batches:
+        yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def csv_chunks(columns: Sequence[str], batches: Iterable[Sequence[Tuple]]) -> Iterator[bytes]:
+    """Header line, then one chunk per batch of rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream into a single gzip member as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def encode(fmt: str, columns: Sequence[str], batches: Iterable[Sequence[Tuple]], gzip: bool = False) -> Iterator[bytes]:
+    chunks = ndjson_chunks(columns, batches) if fmt == "ndjson" else csv_chunks(columns, batches)
+    return gzip_chunks(chunks) if gzip else chunks
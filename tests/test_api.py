@@ -1,6 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from api.main import app
+from ingestion import retention
 
 
 def test_health():
@@ -16,3 +17,308 @@ def test_data_and_stats():
     assert r.status_code == 200
     s = client.get("/stats")
     assert s.status_code == 200
+
+
+def _seed_assets(n=7):
+    import importlib
+    import ingestion.run
+    importlib.reload(ingestion.run)
+    items = [{"id": f"a{i}", "symbol": "BTC" if i % 2 else f"T{i}", "name": f"Token {i}", "raw": {"i": i}} for i in range(n)]
+    ingestion.run._process_stream("api", iter(items))
+
+
+def test_data_keyset_pagination_and_cached_totals():
+    from sqlalchemy import event
+    from core.db import engine
+    _seed_assets()
+    client = TestClient(app)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/data", params=params).json()
+        assert body["total"] == 7
+        seen += [d["external_id"] for d in body["data"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [f"a{i}" for i in range(7)]
+
+    # offset paging is still available and agrees with keyset paging
+    body = client.get("/data", params={"limit": 3, "offset": 3}).json()
+    assert [d["external_id"] for d in body["data"]] == ["a3", "a4", "a5"]
+
+    assert client.get("/data", params={"q": "btc"}).json()["total"] == 3
+    statements = []
+    listener = lambda conn, cursor, stmt, *args: statements.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.get("/data", params={"q": "btc"}).json()["total"] == 3
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert not any("count(" in st.lower() for st in statements)
+
+    # a new ETL run bumps the generation, so the filtered total is recounted
+    import ingestion.run
+    ingestion.run._process_stream("api2", iter([{"id": "b1", "symbol": "BTC", "name": "More", "raw": {}}]))
+    assert client.get("/data", params={"q": "btc"}).json()["total"] == 4
+
+    assert client.get("/data", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_data_search_ranking_and_index(monkeypatch):
+    from sqlalchemy import event
+    from core.db import engine
+    import importlib
+    import ingestion.run
+    importlib.reload(ingestion.run)
+    items = [
+        {"id": "s4", "symbol": "ZZZ", "name": "Not ethereal", "raw": {}},
+        {"id": "s1", "symbol": "XETHX", "name": "Wrapped", "raw": {}},
+        {"id": "s2", "symbol": "ETH", "name": "Ethereum", "raw": {}},
+        {"id": "s3", "symbol": "ETHW", "name": "PoW fork", "raw": {}},
+    ]
+    ingestion.run._process_stream("search", iter(items))
+    client = TestClient(app)
+
+    statements = []
+    listener = lambda conn, cursor, stmt, *args: statements.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        body = client.get("/data", params={"q": "eth", "limit": 2}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    if engine.dialect.name == "sqlite":
+        assert any("assets_search" in st for st in statements)
+    ids = [d["external_id"] for d in body["data"] if d["source"] == "search"]
+    assert ids[:2] == ["s2", "s3"]
+
+    # keyset paging follows the ranked order
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "eth", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/data", params=params).json()
+        seen += [d["external_id"] for d in body["data"] if d["source"] == "search"]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["s2", "s3", "s4", "s1"]
+
+    # a changed name is picked up by the incremental refresh after the next run; a search answered
+    # while the index is still behind is not served from cache once the run has finished
+    refresh = ingestion.run.search.refresh
+
+    def search_then_refresh(bind):
+        client.get("/data", params={"q": "renamed"})
+        refresh(bind)
+
+    monkeypatch.setattr(ingestion.run.search, "refresh", search_then_refresh)
+    ingestion.run._process_stream("search", iter([{"id": "s4", "symbol": "ZZZ", "name": "Renamed", "raw": {"v": 2}}]))
+    found = [d["external_id"] for d in client.get("/data", params={"q": "ethereal"}).json()["data"]]
+    assert "s4" not in found
+    assert "s4" in [d["external_id"] for d in client.get("/data", params={"q": "renamed"}).json()["data"]]
+
+    # one- and two-character queries fall back to a scan
+    assert "s2" in [d["external_id"] for d in client.get("/data", params={"q": "et", "limit": 1000}).json()["data"]]
+
+
+def test_search_refresh_leaves_legacy_rows_alone():
+    """Rows without ``updated_at`` are indexed by the first build, not re-indexed on every refresh."""
+    from sqlalchemy import text
+    from core import search
+    from core.db import engine
+    _seed_assets(3)
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE assets SET updated_at = NULL, name = 'Not reindexed' WHERE external_id = 'a0'"))
+    search.refresh(engine)
+    with engine.connect() as conn:
+        indexed = conn.execute(text(
+            "SELECT s.name FROM assets_search s JOIN assets a ON a.id = s.rowid WHERE a.external_id = 'a0'"
+        )).scalars().all()
+    assert indexed == ["Token 0"]
+
+
+def test_response_cache_hits_cost_no_queries_and_follow_generation():
+    from sqlalchemy import event
+    from core.db import engine
+    from api.main import response_cache
+    _seed_assets(3)
+    client = TestClient(app)
+
+    for path in ("/stats", "/health", "/data"):
+        assert client.get(path).headers["X-Cache"] == "MISS"
+    client.get("/data", params={"limit": 2, "offset": 1})
+    statements = []
+    listener = lambda conn, cursor, stmt, *args: statements.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        for path in ("/stats", "/health", "/data"):
+            assert client.get(path).headers["X-Cache"] == "HIT"
+        # parameter order does not matter
+        assert client.get("/data", params={"offset": 1, "limit": 2}).headers["X-Cache"] == "HIT"
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    # at most one generation re-read if the generation TTL lapsed mid-test
+    assert all("data_generation" in st for st in statements) and len(statements) <= 1
+    assert client.get("/stats").json()["response_cache"]["hits"] >= 4
+
+    # an ETL commit invalidates every cached endpoint
+    import ingestion.run
+    ingestion.run._process_stream("api", iter([{"id": "new", "symbol": "NEW", "name": "New", "raw": {}}]))
+    r = client.get("/data")
+    assert r.headers["X-Cache"] == "MISS" and r.json()["total"] == 4
+    assert client.get("/health").headers["X-Cache"] == "MISS"
+    response_cache.clear()
+
+
+def test_data_export_streams_ndjson_and_csv():
+    import csv
+    import io
+    import json
+    _seed_assets()
+    client = TestClient(app)
+
+    r = client.get("/data/export", headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert "content-encoding" not in r.headers
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["external_id"] for row in rows] == [f"a{i}" for i in range(7)]
+    assert set(rows[0]) == {"id", "external_id", "symbol", "name", "source"}
+
+    r = client.get("/data/export", params={"format": "csv", "q": "btc", "source": "api"},
+                   headers={"Accept-Encoding": "identity"})
+    table = list(csv.DictReader(io.StringIO(r.text)))
+    assert [row["external_id"] for row in table] == ["a1", "a3", "a5"]
+
+    # the client transparently decompresses the gzip body
+    r = client.get("/data/export", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and r.headers["vary"] == "Accept-Encoding"
+    assert len(r.text.splitlines()) == 7
+    # q-values: gzip;q=0 refuses gzip, a wildcard accepts it unless gzip is refused explicitly
+    for header, gzipped in (("gzip;q=0", False), ("br, gzip; q=0.5", True), ("*", True), ("*, gzip;q=0", False),
+                            ("identity", False)):
+        r = client.get("/data/export", headers={"Accept-Encoding": header})
+        assert (r.headers.get("content-encoding") == "gzip") is gzipped, header
+        assert r.headers["vary"] == "Accept-Encoding"
+
+    assert client.get("/data/export", params={"format": "xml"}).status_code == 400
+
+
+def test_data_reads_only_projected_columns():
+    from sqlalchemy import event
+    from core.db import engine
+    from api.main import response_cache
+    _seed_assets(3)
+    response_cache.clear()
+    statements = []
+    listener = lambda conn, cursor, stmt, *args: statements.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        body = TestClient(app).get("/data", params={"limit": 2}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert body["data"][0] == {"id": 1, "external_id": "a0", "symbol": "T0", "name": "Token 0", "source": "api"}
+    assert not any("assets.metadata" in st for st in statements)
+
+
+def test_async_db_mode_serves_same_responses(monkeypatch):
+    import core.db
+    from api.main import response_cache
+    _seed_assets()
+    client = TestClient(app)
+    response_cache.clear()
+    sync_body = client.get("/data", params={"q": "btc", "limit": 2}).json()
+
+    monkeypatch.setattr(core.db.settings, "API_ASYNC_DB", True)
+    response_cache.clear()
+    async_body = client.get("/data", params={"q": "btc", "limit": 2}).json()
+    assert str(core.db.engine.url) in core.db._async_sessions
+    for key in ("total", "next_cursor", "data"):
+        assert async_body[key] == sync_body[key]
+    assert client.get("/stats").json()["total_runs"] == 1
+    assert client.get("/health").json()["db"] is True
+    response_cache.clear()
+
+
+def test_metrics_endpoint(monkeypatch, tmp_path):
+    import core.config
+    from core import metrics
+    monkeypatch.setattr(core.config.settings, "METRICS_ETL_FILE", str(tmp_path / "etl.prom"))
+    _seed_assets(3)
+    client = TestClient(app)
+    r = client.get("/data")
+    assert r.json()["request_id"] == r.headers["X-Request-Id"]
+    client.get("/nope")
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{route="/data",method="GET",status="200"}' in body
+    assert 'route="unmatched",method="GET",status="404"' in body
+    for stage in ("fetch", "validate", "raw_write", "asset_upsert", "checkpoint"):
+        assert f'etl_stage_seconds_count{{source="api",stage="{stage}"}}' in body
+    assert 'db_pool_connections{state="checked_out"}' in body
+
+    # the ETL's textfile is only served by processes other than the one that wrote it
+    assert (tmp_path / "etl.prom").read_text().startswith("# pid ")
+    assert metrics.read_textfile() == ""
+    (tmp_path / "etl.prom").write_text("# pid 0\netl_records_processed_total{source=\"other\"} 5\n")
+    assert 'etl_records_processed_total{source="other"} 5' in client.get("/metrics").text
+
+    # retention publishes to its own textfile instead of replacing the ETL's
+    retention.run()
+    assert "retention_duration_seconds_count" in (tmp_path / "etl-retention.prom").read_text()
+    assert 'etl_records_processed_total{source="other"} 5' in (tmp_path / "etl.prom").read_text()
+    (tmp_path / "etl-retention.prom").write_text("# pid 0\nretention_duration_seconds_count 1\n")
+    body = client.get("/metrics").text
+    assert 'etl_records_processed_total{source="other"} 5' in body and "retention_duration_seconds_count 1" in body
+
+
+def test_changes_feed_returns_inserts_then_updates_in_sequence_order():
+    import importlib
+    import ingestion.run
+    from sqlalchemy import event
+    from core.db import engine
+    _seed_assets(5)
+    client = TestClient(app)
+
+    body = client.get("/changes", params={"limit": 3}).json()
+    assert [c["external_id"] for c in body["changes"]] == ["a0", "a1", "a2"]
+    assert {c["op"] for c in body["changes"]} == {"insert"} and body["has_more"]
+    body = client.get("/changes", params={"since": body["next"], "limit": 3}).json()
+    assert [c["external_id"] for c in body["changes"]] == ["a3", "a4"] and not body["has_more"]
+    cursor = body["next"]
+    body = client.get("/changes", params={"since": cursor}).json()
+    assert (body["changes"], body["next"], body["has_more"]) == ([], cursor, False)
+
+    importlib.reload(ingestion.run)
+    items = [{"id": "a3", "symbol": "T3", "name": "Renamed", "raw": {"i": 3, "v": 2}},
+             {"id": "a9", "symbol": "T9", "name": "Token 9", "raw": {"i": 9}}]
+    # the counter row is locked only after the batch's asset writes, right before the placeholders are numbered
+    written = []
+    listener = lambda conn, cursor_, stmt, params, *args: written.append((stmt, str(params)))
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        ingestion.run._process_stream("api", iter(items))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    reserved = next(i for i, (st, params) in enumerate(written) if "asset_changes" in params and st.startswith("UPDATE"))
+    assert all(i < reserved for i, (st, _) in enumerate(written) if st.startswith("INSERT INTO assets ("))
+    assert written[reserved + 2][0].startswith("UPDATE assets SET") and "change_seq < " in written[reserved + 2][0]
+    statements = []
+    listener = lambda conn, cursor_, stmt, *args: statements.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        body = client.get("/changes", params={"since": cursor}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert [(c["external_id"], c["op"]) for c in body["changes"]] == [("a9", "insert"), ("a3", "update")]
+    assert body["changes"][1]["name"] == "Renamed" and body["next"] == body["changes"][-1]["seq"] > cursor
+    assert any("assets.change_seq >" in st for st in statements)
+    assert client.get("/changes", params={"since": -1}).status_code == 400
@@ -1,5 +1,6 @@
 import pytest
 import ingestion.run
+from ingestion import retention
 from core.models import ETLRun, Checkpoint, RawAsset, Asset
 
 
@@ -131,3 +132,747 @@ def test_failure_injection_and_recovery(monkeypatch):
     with SessionLocal() as s:
         final_count = s.query(Asset).count()
         assert final_count == 3, f"Idempotency check failed: got {final_count} assets"
+
+
+def test_batched_writes_commit_once_per_batch():
+    """Records are written in batches; checkpoint and counter advance per batch."""
+    import importlib
+    from sqlalchemy import event
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+
+    items = [{"id": f"b{i}", "symbol": f"B{i}", "name": f"Batch {i}", "raw": {"id": f"b{i}"}} for i in range(5)]
+
+    commits = []
+    listener = lambda session: commits.append(1)
+    event.listen(SessionLocal, "after_commit", listener)
+    try:
+        ingestion.run._process_stream("batch", iter(items), batch_size=2)
+    finally:
+        event.remove(SessionLocal, "after_commit", listener)
+
+    # run + checkpoint creation, 3 batch flushes, final status
+    assert len(commits) == 6
+
+    with SessionLocal() as s:
+        assert s.query(RawAsset).filter(RawAsset.source == "batch").count() == 5
+        assert s.query(Asset).filter(Asset.source == "batch").count() == 5
+        ck = s.query(Checkpoint).filter(Checkpoint.source == "batch").one()
+        assert ck.last_record_id == "b4"
+        run = s.query(ETLRun).filter(ETLRun.source == "batch").one()
+        assert run.status == "success"
+        assert run.records_processed == 5
+
+
+def test_idempotency_index_skips_known_records_without_queries(monkeypatch):
+    """A rerun answers existence checks from the preloaded index; a tiny memory
+    budget switches to a Bloom filter that still never duplicates rows."""
+    import importlib
+    from sqlalchemy import event
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal, engine
+    from ingestion.idempotency import IdempotencyIndex, BloomFilter, KeyMap
+
+    items = [{"id": f"k{i}", "symbol": f"K{i}", "name": f"Key {i}", "raw": {"id": f"k{i}"}} for i in range(20)]
+    ingestion.run._process_stream("keys", iter(items), batch_size=5)
+
+    with SessionLocal() as s:
+        assert isinstance(IdempotencyIndex.load(s, "keys", 1024 * 1024).keys, KeyMap)
+        assert isinstance(IdempotencyIndex.load(s, "keys", 1000).keys, BloomFilter)
+
+    statements = []
+    listener = lambda conn, cursor, stmt, *args: statements.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        ingestion.run._process_stream("keys", iter(items), batch_size=5)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert not any(st.lstrip().upper().startswith("INSERT INTO RAW_ASSETS") for st in statements)
+    assert not any("IN (" in st for st in statements)
+
+    # force the Bloom filter path: every hit is settled against the database
+    monkeypatch.setattr("ingestion.idempotency.BYTES_PER_KEY", 10**9)
+    monkeypatch.setattr(ingestion.run.settings, "ETL_IDEMPOTENCY_MEMORY_MB", 1)
+    ingestion.run._process_stream("keys", iter(items + [{"id": "k20", "symbol": "K20", "name": "Key 20", "raw": {}}]), batch_size=5)
+    with SessionLocal() as s:
+        assert s.query(RawAsset).filter(RawAsset.source == "keys").count() == 21
+        assert s.query(Asset).filter(Asset.source == "keys").count() == 21
+
+
+def test_concurrent_run_all_isolates_failures(monkeypatch):
+    """Sources run in parallel; one failing source does not abort the others."""
+    import time
+    import importlib
+    importlib.reload(ingestion.run)
+
+    class SlowSource:
+        def __init__(self, prefix):
+            self.prefix = prefix
+
+        def list_assets(self):
+            time.sleep(0.3)
+            for i in range(3):
+                yield {"id": f"{self.prefix}{i}", "symbol": f"{self.prefix}{i}", "name": None, "raw": {}}
+
+    class BrokenSource:
+        def list_assets(self):
+            time.sleep(0.3)
+            raise ConnectionError("upstream down")
+            yield
+
+    monkeypatch.setattr(ingestion.run, "SOURCE_CLASSES", {
+        "slow_a": lambda: SlowSource("a"),
+        "slow_b": lambda: SlowSource("b"),
+        "broken": BrokenSource,
+    })
+
+    start = time.monotonic()
+    with pytest.raises(ingestion.run.ETLRunError) as excinfo:
+        ingestion.run.run_all(max_workers=3)
+    assert time.monotonic() - start < 0.8
+
+    outcomes = excinfo.value.outcomes
+    assert outcomes["slow_a"]["status"] == "success" and outcomes["slow_a"]["records_processed"] == 3
+    assert outcomes["slow_b"]["status"] == "success"
+    assert outcomes["broken"] == {"status": "failed", "records_processed": None, "error": "upstream down", "seconds": outcomes["broken"]["seconds"]}
+
+    from core.db import SessionLocal
+    with SessionLocal() as s:
+        statuses = dict(s.query(ETLRun.source, ETLRun.status).all())
+        assert statuses == {"slow_a": "success", "slow_b": "success", "broken": "failed"}
+        assert s.query(Asset).count() == 6
+
+
+def test_changed_records_are_upserted_and_unchanged_skipped():
+    """Content hashes classify records as new, unchanged or changed per run."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+
+    def items(names):
+        return iter([{"id": f"h{i}", "symbol": f"H{i}", "name": n, "raw": {"id": f"h{i}", "name": n}} for i, n in enumerate(names)])
+
+    ingestion.run._process_stream("hash", items(["a", "b", "c"]), batch_size=2)
+    # key order in the payload does not matter for the hash
+    ingestion.run._process_stream("hash", iter([{"id": "h0", "symbol": "H0", "name": "a", "raw": {"name": "a", "id": "h0"}}]))
+    # h0 is the checkpoint record now and is classified like any other
+    ingestion.run._process_stream("hash", items(["a", "B!", "c", "d"]), batch_size=2)
+
+    with SessionLocal() as s:
+        runs = s.query(ETLRun).filter(ETLRun.source == "hash").order_by(ETLRun.id).all()
+        assert [(r.records_new, r.records_unchanged, r.records_changed) for r in runs] == [(3, 0, 0), (0, 1, 0), (1, 2, 1)]
+        assert [r.records_processed for r in runs] == [3, 1, 4]
+
+        asset = s.query(Asset).filter(Asset.source == "hash", Asset.external_id == "h1").one()
+        assert asset.name == "B!"
+        raw = s.query(RawAsset).filter(RawAsset.source == "hash", RawAsset.record_id == "h1").one()
+        assert raw.payload == {"id": "h1", "name": "B!"}
+        assert s.query(Asset).filter(Asset.source == "hash").count() == 4
+
+
+def test_change_to_the_checkpoint_record_is_picked_up():
+    """The last record of a successful run is the checkpoint; a later change to it is still written."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+
+    def items(last_name):
+        return iter([{"id": f"c{i}", "symbol": f"C{i}", "name": last_name if i == 2 else "same", "raw": {"i": i, "n": last_name if i == 2 else ""}}
+                     for i in range(3)])
+
+    ingestion.run._process_stream("ckpt", items("old"))
+    ingestion.run._process_stream("ckpt", items("new"))
+    with SessionLocal() as s:
+        assert s.query(Checkpoint).filter(Checkpoint.source == "ckpt").one().last_record_id == "c2"
+        assert s.query(Asset).filter(Asset.source == "ckpt", Asset.external_id == "c2").one().name == "new"
+        run = s.query(ETLRun).filter(ETLRun.source == "ckpt").order_by(ETLRun.id.desc()).first()
+        assert (run.records_unchanged, run.records_changed) == (2, 1)
+
+
+def test_csv_resume_seeks_to_checkpointed_offset(tmp_path):
+    """A failed CSV run resumes by seeking to the stored byte offset; a replaced file is rescanned."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from ingestion.sources.csv_source import CSVSource
+    from core.db import SessionLocal
+
+    path = tmp_path / "drop.csv"
+    rows = ["id,symbol,name"] + [f"c{i},C{i},\"Coin\n{i}\"" for i in range(6)]
+    path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    source = CSVSource(str(path))
+
+    with pytest.raises(RuntimeError):
+        ingestion.run._process_stream("csv", ingestion.run._open_stream("csv", source), fail_after=3, batch_size=2)
+
+    with SessionLocal() as s:
+        position = s.query(Checkpoint).filter(Checkpoint.source == "csv").one().position
+    assert position["line"] == 7 and position["fingerprint"] == source.fingerprint()
+
+    resumed = list(source.list_assets(resume=position))
+    assert [i["id"] for i in resumed] == ["c3", "c4", "c5"]
+    assert resumed[0]["name"] == "Coin\n3"
+
+    ingestion.run._process_stream("csv", ingestion.run._open_stream("csv", source))
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "csv", ETLRun.status == "success").one()
+        assert (run.records_processed, run.records_new) == (3, 3)
+        assert s.query(Asset).filter(Asset.source == "csv").count() == 6
+    assert list(ingestion.run._open_stream("csv", source)) == []
+
+    # replaced file: the fingerprint no longer matches, so every row is read again
+    path.write_text("id,symbol,name\nz1,Z1,Zed\n", encoding="utf-8")
+    assert [i["id"] for i in ingestion.run._open_stream("csv", source)] == ["z1"]
+
+
+def test_chunked_csv_directory_ingestion(tmp_path):
+    """pandas chunked mode reads every CSV in a directory, drops rows without an
+    id, dedupes within a file, writes per chunk and resumes after the last chunk."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from ingestion.sources.csv_source import CSVSource
+    from core.db import SessionLocal
+
+    (tmp_path / "a.csv").write_text("external_id,symbol,name\nx1,X1, Ex One \nx2,X2,\n,NOID,\nx1,X1,dup\nx3,X3,Ex Three\n", encoding="utf-8")
+    (tmp_path / "b.csv").write_text("id,symbol,name\ny1,Y1,Why\n", encoding="utf-8")
+    (tmp_path / "ignored.txt").write_text("id\nnope\n", encoding="utf-8")
+    source = CSVSource(str(tmp_path), chunked=True, chunksize=2)
+
+    chunks = list(source.list_assets())
+    assert [[i["id"] for i in c] for c in chunks] == [["x1", "x2"], ["NOID"], ["x3"], ["y1"]]
+    assert chunks[0][0]["name"] == "Ex One" and chunks[0][1]["name"] is None
+    assert chunks[0][0]["raw"] == {"external_id": "x1", "symbol": "X1", "name": " Ex One "}
+    assert chunks[-1][-1]["position"]["file"] == str(tmp_path / "b.csv")
+
+    ingestion.run._process_stream("csv_dir", ingestion.run._open_stream("csv_dir", source))
+    with SessionLocal() as s:
+        assets = dict(s.query(Asset.external_id, Asset.name).filter(Asset.source == "csv_dir").all())
+        assert assets == {"x1": "Ex One", "x2": None, "NOID": None, "x3": "Ex Three", "y1": "Why"}
+        assert s.query(Checkpoint).filter(Checkpoint.source == "csv_dir").one().position["rows"] == 1
+
+    # completed files are skipped; new rows in a later file are picked up
+    (tmp_path / "c.csv").write_text("id,symbol,name\nz1,Z1,Zed\n", encoding="utf-8")
+    assert [[i["id"] for i in c] for c in ingestion.run._open_stream("csv_dir", source)] == [["z1"]]
+
+
+def test_csv_row_and_chunked_modes_normalize_alike(tmp_path):
+    """Padded and blank cells give the same items (and record keys) in row and chunked mode."""
+    from ingestion.sources.csv_source import CSVSource
+
+    (tmp_path / "padded.csv").write_text(
+        "id,external_id,symbol,name\n btc ,,BTC , Bitcoin \n  ,eth-1, ETH,\n,, SOL ,Solana\n", encoding="utf-8")
+
+    def items(chunked):
+        flat = []
+        for entry in CSVSource(str(tmp_path / "padded.csv"), chunked=chunked, chunksize=2).list_assets():
+            flat += entry if isinstance(entry, list) else [entry]
+        return [{k: v for k, v in item.items() if k != "position"} for item in flat]
+
+    rows = items(chunked=False)
+    assert [(i["id"], i["symbol"], i["name"]) for i in rows] == [("btc", "BTC", "Bitcoin"), ("eth-1", "ETH", None),
+                                                                  ("SOL", "SOL", "Solana")]
+    assert rows == items(chunked=True)
+    # replay re-normalizes stored raw rows the same way
+    assert [CSVSource.normalize(i["raw"]) for i in rows] == rows
+
+
+def test_change_counter_row_exists_before_the_first_write():
+    """Startup creates the asset_changes counter, so concurrent first writers only ever UPDATE it."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core import changes
+    from core.db import SessionLocal
+    from core.models import DataGeneration
+
+    ingestion.run._ensure_tables()
+    with SessionLocal() as s:
+        assert s.get(DataGeneration, changes.CHANGES).generation == 0
+    ingestion.run._process_stream("counted", iter([{"id": "n1", "symbol": "N1", "name": "n", "raw": {}}]))
+    ingestion.run._ensure_tables()
+    with SessionLocal() as s:
+        assert s.get(DataGeneration, changes.CHANGES).generation == 1
+        assert s.query(Asset.change_seq).filter(Asset.source == "counted").scalar() == 1
+
+
+def test_run_rollup_and_stats_breakdown():
+    """Each finished run updates its source's rollup row; /stats reads the rollup."""
+    import importlib
+    from sqlalchemy import inspect
+    from fastapi.testclient import TestClient
+    from core import etl_stats
+    from core.db import SessionLocal, engine
+    from core.models import ETLSourceStats
+    importlib.reload(ingestion.run)
+    items = [{"id": f"r{i}", "symbol": f"R{i}", "name": None, "raw": {}} for i in range(4)]
+    ingestion.run._process_stream("rollup", iter(items))
+    with pytest.raises(RuntimeError):
+        ingestion.run._process_stream("rollup", iter(items + [{"id": "r9", "symbol": "R9", "name": None, "raw": {}}]), fail_after=1)
+
+    with SessionLocal() as s:
+        row = s.get(ETLSourceStats, "rollup")
+        assert (row.total_runs, row.success_runs, row.failed_runs) == (2, 1, 1)
+        assert row.last_status == "failed" and "Injected failure" in row.last_error
+        assert row.last_success_at is not None and row.last_failure_at is not None
+        assert row.total_records_processed == 5 and row.last_records_per_second is not None
+        assert all(r.run_finished_at is not None for r in s.query(ETLRun).filter(ETLRun.source == "rollup"))
+
+        # the rollup can be rebuilt from the run history (upgrade path)
+        s.query(ETLSourceStats).delete()
+        assert etl_stats.backfill(s) == 1
+        s.flush()
+        rebuilt = s.get(ETLSourceStats, "rollup")
+        assert (rebuilt.total_runs, rebuilt.success_runs, rebuilt.failed_runs) == (2, 1, 1)
+        s.rollback()
+
+    indexes = {ix["name"] for ix in inspect(engine).get_indexes("etl_runs")}
+    assert "ix_etl_runs_source_status_finished" in indexes
+
+    from api.main import app, response_cache
+    response_cache.clear()
+    body = TestClient(app).get("/stats").json()
+    assert body["total_runs"] == 2
+    assert body["sources"]["rollup"]["failed_runs"] == 1
+    assert TestClient(app).get("/health").json()["last_etl"]["status"] == "failed"
+
+
+def test_synthetic_benchmark_source_and_regression_check(monkeypatch):
+    """The benchmark source plugs into SOURCE_CLASSES; reruns hit the changed path."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from benchmarks.synthetic import SyntheticSource, register
+    from benchmarks.run import compare
+
+    items = list(SyntheticSource(n=100, duplicate_ratio=0.1).list_assets())
+    assert len(items) == 109 and len({i["id"] for i in items}) == 100
+    assert items == list(SyntheticSource(n=100, duplicate_ratio=0.1).list_assets())
+
+    for name in list(ingestion.run.SOURCE_CLASSES):
+        monkeypatch.delitem(ingestion.run.SOURCE_CLASSES, name)
+    register("synthetic", n=50, change_ratio=0.2)
+    assert ingestion.run.run_all()["synthetic"]["records_processed"] == 50
+    register("synthetic", n=50, change_ratio=0.2, version=1)
+    ingestion.run.run_all()
+    from core.db import SessionLocal
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "synthetic").order_by(ETLRun.id.desc()).first()
+        assert (run.records_new, run.records_changed) == (0, 10)
+
+    baseline = {"etl": [{"backend": "sqlite", "records": 10, "initial": {"records_per_second": 100},
+                         "rerun": {"records_per_second": 100}, "peak_rss_mb": 50}],
+                "api": {"page": {"p95_ms": 10}}}
+    current = {"etl": [{"backend": "sqlite", "records": 10, "initial": {"records_per_second": 60},
+                        "rerun": {"records_per_second": 95}, "peak_rss_mb": 51}],
+               "api": {"page": {"p95_ms": 20}}}
+    regressed = {name for name, *_ in compare(current, baseline, 0.25)}
+    assert regressed == {"etl.sqlite.10.initial.records_per_second", "api.page.p95_ms"}
+
+
+def test_invalid_records_are_quarantined_with_reasons():
+    """Rejected rows land in the quarantine table; counts per reason are kept on the run."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+    from core.models import Quarantine
+
+    items = iter([
+        {"id": "q0", "symbol": "Q0", "name": "ok", "raw": {"id": "q0"}},
+        {"id": "q1", "symbol": 42, "name": "coerced", "raw": {"id": "q1"}},
+        {"id": "q2", "symbol": None, "name": "no symbol", "raw": {"id": "q2"}},
+        {"id": "q3", "symbol": "Q3", "name": {"bad": True}, "raw": {"id": "q3"}},
+        {"symbol": "Q4", "name": "no id", "raw": {"name": "no id"}},
+        {"id": "q5", "symbol": "", "name": "empty", "raw": {"id": "q5"}},
+    ])
+    ingestion.run._process_stream("quar", items, batch_size=4)
+
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "quar").one()
+        assert run.status == "success"
+        assert run.records_processed == 2
+        assert run.records_invalid == 4
+        assert run.validation_errors["missing symbol"] == 2
+        assert run.validation_errors["missing id"] == 1
+
+        assert s.query(Asset).filter(Asset.source == "quar", Asset.external_id == "q1").one().symbol == "42"
+        rows = {q.record_id: q for q in s.query(Quarantine).filter(Quarantine.source == "quar")}
+        assert set(rows) == {"q2", "q3", "q5", next(k for k in rows if k.startswith("hash:"))}
+        assert rows["q3"].reason.startswith("name:")
+        assert rows["q2"].payload == {"id": "q2"} and rows["q2"].run_id == run.id
+        # raw payloads of keyed rejects are still stored
+        assert s.query(RawAsset).filter(RawAsset.source == "quar", RawAsset.record_id == "q2").count() == 1
+
+
+def test_payloads_are_stored_once_compressed_and_migrated():
+    """Raw payloads and asset metadata share one compressed body per hash; legacy inline rows migrate in batches."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+    from core.models import Payload
+    from ingestion import migrate_payloads
+
+    shared = {"kind": "same"}
+    items = [{"id": f"p{i}", "symbol": f"P{i}", "name": "n", "raw": {"id": f"p{i}"}} for i in range(3)]
+    items += [{"id": "p3", "symbol": "P3", "name": "n", "raw": shared}, {"id": "p4", "symbol": "P4", "name": "n", "raw": dict(shared)}]
+    ingestion.run._process_stream("store", iter(items), batch_size=2)
+
+    with SessionLocal() as s:
+        assert s.query(Payload).count() == 4
+        raw = s.query(RawAsset).filter(RawAsset.source == "store", RawAsset.record_id == "p1").one()
+        assert raw.inline_payload is None and raw.payload == {"id": "p1"}
+        asset = s.query(Asset).filter(Asset.source == "store", Asset.external_id == "p4").one()
+        assert asset.inline_metadata is None
+        assert asset.run_metadata == shared
+
+        # rows written before the payload store carry their JSON inline
+        s.execute(RawAsset.__table__.insert(), [{"source": "legacy", "record_id": f"l{i}", "payload": {"v": i % 2}} for i in range(5)])
+        s.execute(Asset.__table__.insert(), [{"external_id": "l0", "symbol": "L0", "source": "legacy", "metadata": {"v": 0}}])
+        s.commit()
+
+    assert migrate_payloads.migrate(batch_size=2) == {"raw_assets": 5, "assets": 1}
+    assert migrate_payloads.migrate(batch_size=2) == {"raw_assets": 0, "assets": 0}
+    with SessionLocal() as s:
+        legacy = s.query(RawAsset).filter(RawAsset.source == "legacy").order_by(RawAsset.record_id).all()
+        assert [r.payload for r in legacy] == [{"v": i % 2} for i in range(5)]
+        assert all(r.inline_payload is None for r in legacy)
+        assert len({r.payload_hash for r in legacy}) == 2
+        asset = s.query(Asset).filter(Asset.source == "legacy").one()
+        assert asset.run_metadata == {"v": 0} and asset.metadata_hash == legacy[0].payload_hash
+
+
+def test_source_lease_is_single_flight_and_expired_leases_are_taken_over():
+    """Only one owner holds a source's lease; an expired one is taken over and its running run marked failed."""
+    from datetime import datetime, timedelta, timezone
+    from core.db import SessionLocal
+    from core.models import ETLLease
+    from ingestion.leases import Lease
+
+    with Lease("leased", ttl=60, owner="a") as first:
+        assert first
+        with Lease("leased", ttl=60, owner="b") as second:
+            assert not second
+    # released on exit
+    with Lease("leased", ttl=60, owner="b") as again:
+        assert again
+
+    # owner "a" crashes mid-run: its lease is never released and stops being renewed
+    assert Lease("leased", ttl=60, owner="a").acquire()
+    with SessionLocal() as s:
+        s.add(ETLRun(source="leased", status="running"))
+        s.commit()
+    assert not Lease("leased", ttl=60, owner="b").acquire()
+    with SessionLocal() as s:
+        s.query(ETLLease).filter(ETLLease.source == "leased").update(
+            {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+        s.commit()
+    assert Lease("leased", ttl=60, owner="b").acquire()
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "leased").one()
+        assert run.status == "failed" and "expired" in run.error
+        assert s.get(ETLLease, "leased").owner == "b"
+
+
+def test_run_stops_writing_once_its_lease_is_taken_over(monkeypatch):
+    """A run whose lease expired and was claimed by another replica fails at its next commit."""
+    from datetime import datetime, timedelta, timezone
+    from core.db import SessionLocal
+    from core.models import ETLLease
+    from ingestion.leases import Lease, LeaseLost
+
+    monkeypatch.setattr(ingestion.run.settings, "ETL_PIPELINE_DEPTH", 0)
+
+    def items():
+        for i in range(8):
+            if i == 4:
+                # the heartbeat stalled long enough for replica "b" to take over
+                with SessionLocal() as s:
+                    s.query(ETLLease).filter(ETLLease.source == "taken").update(
+                        {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+                    s.commit()
+                assert Lease("taken", ttl=60, owner="b").acquire()
+            yield {"id": f"t{i}", "symbol": f"T{i}", "name": f"Taken {i}", "raw": {}}
+
+    with Lease("taken", ttl=60, owner="a") as lease:
+        with pytest.raises(LeaseLost):
+            ingestion.run._process_stream("taken", items(), batch_size=2, lease=lease)
+        assert lease.lost
+    with SessionLocal() as s:
+        assert s.query(Asset).filter(Asset.source == "taken").count() == 4
+        assert s.query(Checkpoint).filter(Checkpoint.source == "taken").one().last_record_id == "t3"
+        run = s.query(ETLRun).filter(ETLRun.source == "taken").one()
+        assert run.status == "failed" and "taken over" in run.error
+        assert s.get(ETLLease, "taken").owner == "b"
+
+
+def test_scheduler_reuses_sources_and_skips_leased_ones():
+    """The daemon builds each source once, reruns it every interval and skips sources leased elsewhere."""
+    from concurrent.futures import ThreadPoolExecutor
+    import importlib
+    importlib.reload(ingestion.run)
+    from ingestion.leases import Lease
+    from ingestion.scheduler import Scheduler
+
+    built = []
+
+    class Source:
+        def __init__(self):
+            built.append(self)
+
+        def list_assets(self):
+            yield {"id": "s1", "symbol": "S1", "name": "one", "raw": {"id": "s1"}}
+
+    now = [0.0]
+    ingestion.run._ensure_tables()
+    scheduler = Scheduler({"warm": Source, "busy": Source}, intervals={"busy": 5.0}, default_interval=10.0,
+                          jitter=0, clock=lambda: now[0])
+    assert Lease("busy", ttl=60, owner="other-replica").acquire()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for t in (0.0, 1.0, 10.0, 11.0):
+            now[0] = t
+            scheduler.poll(pool)
+            for future in list(scheduler._running.values()):
+                future.result()
+    assert scheduler.last_outcomes["warm"]["status"] == "success"
+    assert scheduler.last_outcomes["busy"]["status"] == "skipped"
+    # warm ran at t=0 and t=11 on the same object; busy was built but never run
+    assert len(built) == 2
+    from core.db import SessionLocal
+    with SessionLocal() as s:
+        assert s.query(ETLRun).filter(ETLRun.source == "warm").count() == 2
+        assert s.query(ETLRun).filter(ETLRun.source == "busy").count() == 0
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_pipelined_stages_keep_order_and_checkpoint_on_source_error(monkeypatch, depth):
+    """A source error mid-stream fails the run; the checkpoint covers exactly the batches already written."""
+    import importlib
+    importlib.reload(ingestion.run)
+    monkeypatch.setattr(ingestion.run.settings, "ETL_PIPELINE_DEPTH", depth)
+    from core.db import SessionLocal
+
+    def items():
+        for i in range(5):
+            yield {"id": f"o{i}", "symbol": f"O{i}", "name": "n", "raw": {"id": f"o{i}"}}
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        ingestion.run._process_stream("order", items(), batch_size=2)
+
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "order").one()
+        assert run.status == "failed" and "connection reset" in run.error
+        assert run.records_processed == 4
+        assert s.query(Checkpoint).filter(Checkpoint.source == "order").one().last_record_id == "o3"
+        assert {a.external_id for a in s.query(Asset).filter(Asset.source == "order")} == {"o0", "o1", "o2", "o3"}
+
+    text = ingestion.run.metrics.REGISTRY.render("etl_")
+    if depth:
+        assert 'etl_queue_max_depth{source="order",queue="fetch"}' in text
+        assert 'etl_stage_blocked_seconds_count{source="order",stage="write"}' in text
+
+
+def test_sharded_run_partitions_records_and_checkpoints_on_the_shared_watermark(monkeypatch):
+    """Shard processes write disjoint keys; one ETLRun sums their progress and the checkpoint follows the watermark."""
+    import importlib
+    importlib.reload(ingestion.run)
+    monkeypatch.setattr(ingestion.run.settings, "ETL_SHARDS", 3)
+    from core.db import SessionLocal
+    from core.models import ETLShardProgress, Quarantine
+
+    def items(n, rename=()):
+        for i in range(n):
+            yield {"id": f"sh{i}", "symbol": f"SH{i}", "name": "renamed" if i in rename else "n", "raw": {"id": f"sh{i}", "r": i in rename}}
+        yield {"id": "bad", "symbol": None, "raw": {"id": "bad"}}
+
+    assert ingestion.run._process_stream("sharded", items(40), batch_size=4) == 40
+
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "sharded").one()
+        assert (run.status, run.records_processed, run.records_new, run.records_invalid) == ("success", 40, 41, 1)
+        progress = s.query(ETLShardProgress).filter(ETLShardProgress.run_id == run.id).all()
+        assert len(progress) == 3 and sum(p.records_processed for p in progress) == 40
+        assert all(p.records_processed > 0 for p in progress)
+        assert s.query(Asset).filter(Asset.source == "sharded").count() == 40
+        assert s.query(Quarantine).filter(Quarantine.source == "sharded").one().record_id == "bad"
+        # the last record is invalid, so the checkpoint stops at the last valid one
+        assert s.query(Checkpoint).filter(Checkpoint.source == "sharded").one().last_record_id == "sh39"
+
+    ingestion.run._process_stream("sharded", items(40, rename={3, 17}), batch_size=4)
+    with SessionLocal() as s:
+        run = s.query(ETLRun).filter(ETLRun.source == "sharded").order_by(ETLRun.id.desc()).first()
+        assert (run.records_new, run.records_unchanged, run.records_changed) == (0, 39, 2)
+        assert s.query(Asset).filter(Asset.source == "sharded", Asset.name == "renamed").count() == 2
+
+
+def test_shard_worker_stops_writing_once_the_lease_is_taken_over():
+    """A shard worker fences every flush on the coordinator's lease and fails after a takeover."""
+    import queue
+    import threading
+    from datetime import datetime, timedelta, timezone
+    from core.db import SessionLocal, engine
+    from core.models import ETLLease
+    from ingestion import sharding
+    from ingestion.leases import Lease
+
+    ingestion.run._ensure_tables()
+    lease = Lease("shard_lease", ttl=60)
+    assert lease.acquire()
+    with SessionLocal() as s:
+        run = ETLRun(source="shard_lease", status="running")
+        s.add(run)
+        s.commit()
+        run_id = run.id
+    inbox, outbox = queue.Queue(), queue.Queue()
+    url = engine.url.render_as_string(hide_password=False)
+    worker = threading.Thread(target=sharding._worker,
+                              args=(url, "shard_lease", run_id, 0, 1, 10, 0, inbox, outbox, lease.owner))
+    worker.start()
+
+    def round_of(no, ids):
+        return no, [(k, f"w{i}", {"id": f"w{i}", "symbol": f"W{i}", "name": "n", "raw": {}}) for k, i in enumerate(ids)]
+
+    inbox.put(round_of(0, [0, 1]))
+    assert outbox.get(timeout=30)[:2] == (0, 0)
+    with SessionLocal() as s:
+        s.query(ETLLease).filter(ETLLease.source == "shard_lease").update(
+            {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+        s.commit()
+    assert Lease("shard_lease", ttl=60, owner="b").acquire()
+    inbox.put(round_of(1, [2, 3]))
+    inbox.put(None)
+    shard, kind, error = outbox.get(timeout=30)
+    worker.join(timeout=30)
+    assert kind == sharding._ERROR and error.startswith("LeaseLost")
+    with SessionLocal() as s:
+        assert sorted(r.external_id for r in s.query(Asset.external_id).filter(Asset.source == "shard_lease")) == ["w0", "w1"]
+
+
+def test_replay_renormalizes_stored_payloads_without_fetching(monkeypatch):
+    """--replay rebuilds assets from raw_assets with the current normalizer, inline or across worker processes."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+    from ingestion.replay import replay
+
+    items = [ingestion.run.CoinPaprikaSource.normalize({"id": f"rp{i}", "symbol": f"RP{i}", "name": f"coin {i}"}) for i in range(30)]
+    assert ingestion.run._process_stream("coinpaprika", iter(items), batch_size=8) == 30
+
+    def no_fetch():
+        raise AssertionError("replay must not build sources")
+    monkeypatch.setitem(ingestion.run.SOURCE_CLASSES, "coinpaprika", no_fetch)
+
+    with monkeypatch.context() as m:
+        m.setitem(ingestion.run.SOURCE_NORMALIZERS, "coinpaprika",
+                  lambda raw: {**ingestion.run.CoinPaprikaSource.normalize(raw), "name": raw["name"].upper()})
+        outcome = replay(["coinpaprika"], workers=1, batch_size=7)["coinpaprika"]
+    assert (outcome["status"], outcome["changed"], outcome["unchanged"], outcome["new"]) == ("success", 30, 0, 0)
+    with SessionLocal() as s:
+        assert s.query(Asset).filter(Asset.source == "coinpaprika", Asset.name.like("COIN %")).count() == 30
+
+    # worker processes import the registry afresh, so this restores the stock names
+    outcome = replay(workers=2, batch_size=7)["coinpaprika"]
+    assert (outcome["changed"], outcome["unchanged"]) == (30, 0)
+    with SessionLocal() as s:
+        assert s.query(Asset).filter(Asset.source == "coinpaprika", Asset.name.like("coin %")).count() == 30
+        assert s.query(RawAsset).filter(RawAsset.source == "coinpaprika").count() == 30
+    assert replay(["coinpaprika"], workers=2)["coinpaprika"]["unchanged"] == 30
+
+
+def test_retention_folds_old_runs_into_daily_summaries_and_prunes_superseded_payloads():
+    import importlib
+    importlib.reload(ingestion.run)
+    from datetime import datetime, timedelta, timezone
+    from core.db import SessionLocal
+    from core.models import ETLRunDaily, Payload
+
+    for version in range(5):
+        items = [{"id": f"rt{i}", "symbol": f"RT{i}", "name": "n", "raw": {"id": f"rt{i}", "v": version if i == 0 else 0}}
+                 for i in range(3)]
+        ingestion.run._process_stream("retained", iter(items))
+    with SessionLocal() as s:
+        payloads_before = s.query(Payload).count()
+        runs = s.query(ETLRun).filter(ETLRun.source == "retained").order_by(ETLRun.id).all()
+        run_ids = [r.id for r in runs]
+        folded = sum(r.records_processed for r in runs[:3])
+        # bodies written long ago: the window counts from when they were superseded, not created
+        s.query(Payload).update({"created_at": datetime.now(timezone.utc) - timedelta(days=60)})
+        s.commit()
+
+    # a freshly superseded body is kept until it has been unreferenced for the whole window
+    assert retention.run(keep_runs=2, batch_size=2) == {"etl_runs": 3, "etl_shard_progress": 0, "payloads": 0}
+    with SessionLocal() as s:
+        assert [r.id for r in s.query(ETLRun).filter(ETLRun.source == "retained")] == run_ids[-2:]
+        daily = s.query(ETLRunDaily).filter(ETLRunDaily.source == "retained").one()
+        assert (daily.runs, daily.success_runs, daily.records_processed, daily.records_new) == (3, 3, folded, 3)
+        assert s.query(Payload).filter(Payload.unreferenced_at.isnot(None)).count() == 4
+
+    # four earlier versions of rt0 are no longer referenced by any row
+    assert retention.run(keep_runs=2, payload_days=0)["payloads"] == 4
+    with SessionLocal() as s:
+        assert s.query(Payload).count() == payloads_before - 4
+        assert all(raw.payload["v"] in (0, 4) for raw in s.query(RawAsset).filter(RawAsset.source == "retained"))
+    assert retention.run(keep_runs=2, payload_days=0) == {"etl_runs": 0, "etl_shard_progress": 0, "payloads": 0}
+
+
+def test_retention_skips_payloads_of_a_source_ingested_in_the_same_process():
+    """Two threads of one process exclude each other on a lease: retention must not prune under a running ingest."""
+    import importlib
+    importlib.reload(ingestion.run)
+    from core.db import SessionLocal
+    from core.models import Payload
+    from ingestion.leases import Lease
+
+    for version in range(2):
+        ingestion.run._process_stream("busy", iter([{"id": "b0", "symbol": "B0", "name": "n", "raw": {"v": version}},
+                                                    {"id": "b1", "symbol": "B1", "name": "n", "raw": {"id": "b1"}}]))
+    with SessionLocal() as s:
+        payloads_before = s.query(Payload).count()
+    with Lease("busy") as ingest:
+        assert ingest and not Lease("busy").acquire()
+        assert retention.run(keep_runs=100, payload_days=0)["payloads"] == 0
+        with SessionLocal() as s:
+            assert s.query(Payload).count() == payloads_before
+            # retention's own lease attempt left the ingest's lease alone
+            ingest.fence(s)
+            s.commit()
+    assert retention.run(keep_runs=100, payload_days=0)["payloads"] == 0  # first pass only stamps the old body
+    assert retention.run(keep_runs=100, payload_days=0)["payloads"] == 1
+
+
+BASELINE_SCHEMA = [
+    """CREATE TABLE raw_assets (id INTEGER NOT NULL, source VARCHAR NOT NULL, record_id VARCHAR NOT NULL,
+       payload JSON NOT NULL, ingested_at DATETIME DEFAULT (CURRENT_TIMESTAMP), PRIMARY KEY (id),
+       CONSTRAINT uq_raw_source_record UNIQUE (source, record_id))""",
+    """CREATE TABLE assets (id INTEGER NOT NULL, symbol VARCHAR NOT NULL, name VARCHAR, external_id VARCHAR NOT NULL,
+       source VARCHAR NOT NULL, metadata JSON, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), PRIMARY KEY (id),
+       CONSTRAINT uq_asset_external_source UNIQUE (external_id, source))""",
+    """CREATE TABLE etl_checkpoints (id INTEGER NOT NULL, source VARCHAR NOT NULL, last_record_id VARCHAR,
+       updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP), PRIMARY KEY (id), UNIQUE (source))""",
+    """CREATE TABLE etl_runs (id INTEGER NOT NULL, source VARCHAR NOT NULL, run_started_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+       run_finished_at DATETIME, status VARCHAR NOT NULL, records_processed INTEGER, error VARCHAR,
+       injected_failure BOOLEAN, PRIMARY KEY (id))""",
+]
+
+
+def test_upgrade_from_baseline_schema_keeps_raw_rows(tmp_path):
+    """A database created by the original schema upgrades in place, even after the API added indexes to it."""
+    from sqlalchemy import create_engine, inspect, text
+    from core import models, payloads
+    from core.db import ensure_schema
+
+    bind = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}", future=True)
+    with bind.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO raw_assets (source, record_id, payload) VALUES ('csv', 'a', :p), ('csv', 'b', :p)"),
+                     {"p": '{"id": "a"}'})
+    # API startup only runs ensure_schema, which indexes the old raw_assets
+    ensure_schema(models.Base.metadata, bind=bind)
+    for _ in range(2):
+        payloads.ensure(bind)
+        ensure_schema(models.Base.metadata, bind=bind)
+
+    tables = inspect(bind).get_table_names()
+    assert "raw_assets_legacy" not in tables
+    assert [c["nullable"] for c in inspect(bind).get_columns("raw_assets") if c["name"] == "payload"] == [True]
+    assert "ix_raw_assets_payload_hash" in {i["name"] for i in inspect(bind).get_indexes("raw_assets")}
+    with bind.connect() as conn:
+        assert conn.execute(text("SELECT record_id FROM raw_assets ORDER BY id")).scalars().all() == ["a", "b"]
+    bind.dispose()
@@ -0,0 +1,183 @@
+import json
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from ingestion.sources.http_client import iter_json_array
+
+N_COINS = 30_000
+
+
+def _coin(i):
+    return {"id": f"coin-{i}", "symbol": f"c{i}", "name": f"Coin number {i}", "is_active": True, "rank": i}
+
+
+def _coin_list_chunks():
+    """Synthetic /coins/list body, generated lazily in ~64KB writes."""
+    yield b"["
+    parts = []
+    size = 0
+    for i in range(N_COINS):
+        part = (b"," if i else b"") + json.dumps(_coin(i)).encode()
+        parts.append(part)
+        size += len(part)
+        if size >= 64 * 1024:
+            yield b"".join(parts)
+            parts, size = [], 0
+    yield b"".join(parts) + b"]"
+
+
+@pytest.fixture
+def stub_server():
+    """Local HTTP server. Routes map a path to ``fn(request_headers)`` returning
+    ``(status, headers, body_chunks)``; bodies are sent chunked."""
+    routes = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            route = routes.get(self.path)
+            status, headers, body = route(self.headers) if route else (404, {}, [])
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if status == 304:
+                self.end_headers()
+                return
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in body:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.protocol_version = "HTTP/1.1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.routes = routes
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_iter_json_array_handles_split_tokens():
+    doc = json.dumps([{"id": "a", "name": "é ✓"}, 12345, "x,]", [1, 2], None]).encode()
+    # one byte at a time splits every token and multi-byte character
+    assert list(iter_json_array(doc[i:i + 1] for i in range(len(doc)))) == json.loads(doc)
+    assert list(iter_json_array([b" [ ] "])) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"id": 1}, {"id"']))
+
+
+def test_coingecko_streams_large_list_with_flat_memory(stub_server, monkeypatch):
+    import ingestion.sources.coingecko as coingecko
+    stub_server.routes["/coins/list"] = lambda headers: (200, {}, _coin_list_chunks())
+    monkeypatch.setattr(coingecko, "API_BASE", stub_server.url)
+    body_size = sum(len(c) for c in _coin_list_chunks())
+
+    source = coingecko.CoinGeckoSource(stream=True)
+    tracemalloc.start()
+    try:
+        count = 0
+        for item in source.list_assets():
+            if count == 0:
+                first = item
+            count += 1
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert count == N_COINS
+    assert first == {"id": "coin-0", "symbol": "c0", "name": "Coin number 0", "raw": _coin(0)}
+    # the body is ~3MB (and several times that once decoded); streaming keeps
+    # only a few chunks alive, including the stub server's own buffers
+    assert peak < body_size / 4, f"peak {peak} vs body {body_size}"
+
+
+def test_conditional_fetch_skips_or_replays_on_304(stub_server, monkeypatch, tmp_path):
+    import ingestion.sources.coinpaprika as coinpaprika
+    settings = coinpaprika.settings  # other tests reload core.config; patch the instance the sources use
+    coins = [{"id": "btc-bitcoin", "symbol": "BTC", "name": "Bitcoin"}]
+    seen = []
+
+    def coins_route(headers):
+        seen.append(headers.get("If-None-Match"))
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, []
+        return 200, {"ETag": '"v1"'}, [json.dumps(coins).encode()]
+
+    stub_server.routes["/coins"] = coins_route
+    monkeypatch.setattr(coinpaprika, "API_BASE", stub_server.url)
+    monkeypatch.setattr(settings, "HTTP_CACHE_DIR", str(tmp_path))
+
+    source = coinpaprika.CoinPaprikaSource()
+    assert [i["id"] for i in source.list_assets()] == ["btc-bitcoin"]
+    source.finish(True)
+    assert list(source.list_assets()) == []
+    monkeypatch.setattr(settings, "HTTP_CACHE_ON_NOT_MODIFIED", "replay")
+    assert [i["raw"] for i in source.list_assets()] == coins
+    assert seen == [None, '"v1"', '"v1"']
+
+
+def test_cache_entries_are_kept_only_after_the_run_commits(stub_server, monkeypatch, tmp_path):
+    """A run that fails after the body was read must not leave validators that make the next run skip."""
+    import importlib
+    import ingestion.run
+    import ingestion.sources.coinpaprika as coinpaprika
+    from core.db import SessionLocal
+    from core.models import Asset
+    importlib.reload(ingestion.run)
+    settings = coinpaprika.settings
+    coins = [{"id": f"coin-{i}", "symbol": f"C{i}", "name": f"Coin {i}"} for i in range(5)]
+    seen = []
+
+    def coins_route(headers):
+        seen.append(headers.get("If-None-Match"))
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, []
+        return 200, {"ETag": '"v1"'}, [json.dumps(coins).encode()]
+
+    stub_server.routes["/coins"] = coins_route
+    monkeypatch.setattr(coinpaprika, "API_BASE", stub_server.url)
+    monkeypatch.setattr(settings, "HTTP_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "HTTP_CACHE_ON_NOT_MODIFIED", "skip")
+    monkeypatch.setattr(ingestion.run.settings, "ETL_PIPELINE_DEPTH", 4)
+
+    source = coinpaprika.CoinPaprikaSource()
+    assert ingestion.run._run_source("coinpaprika", fail_after=3, src=source)["status"] == "failed"
+    assert ingestion.run._run_source("coinpaprika", src=source)["status"] == "success"
+    assert ingestion.run._run_source("coinpaprika", src=source)["status"] == "success"
+    # the failed run's body was never cached, so the retry refetched it in full
+    assert seen == [None, None, '"v1"']
+    with SessionLocal() as s:
+        assert s.query(Asset).filter(Asset.source == "coinpaprika").count() == 5
+
+
+def test_retries_honor_retry_after(stub_server, monkeypatch, tmp_path):
+    import ingestion.sources.coingecko as coingecko
+    import ingestion.sources.http_client as http_client
+    settings = coingecko.settings  # other tests reload core.config; patch the instance the sources use
+    responses = [(429, {"Retry-After": "7"}, []), (503, {}, []), (200, {}, [b'[{"id": "x"}]'])]
+    stub_server.routes["/coins/list"] = lambda headers: responses.pop(0)
+    monkeypatch.setattr(coingecko, "API_BASE", stub_server.url)
+    monkeypatch.setattr(settings, "HTTP_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 2.0)
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+
+    assert [i["id"] for i in coingecko.CoinGeckoSource().list_assets()] == ["x"]
+    assert sleeps[0] == 7.0
+    # second retry falls back to jittered exponential backoff: 2 * 2**1 * [0.5, 1.0]
+    assert 2.0 <= sleeps[1] <= 4.0
+
+    # a wait beyond HTTP_MAX_BACKOFF_SECONDS fails fast instead of retrying early
+    responses[:] = [(429, {"Retry-After": "300"}, []), (200, {}, [b'[{"id": "y"}]'])]
+    monkeypatch.setattr(settings, "HTTP_MAX_BACKOFF_SECONDS", 120.0)
+    sleeps.clear()
+    with pytest.raises(http_client.RetryAfterTooLong, match="Retry-After 300s"):
+        list(coingecko.CoinGeckoSource().list_assets())
+    assert sleeps == [] and len(responses) == 1